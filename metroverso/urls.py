@@ -10,6 +10,14 @@ urlpatterns = [
     path('', metroversoViews.map, name='map'),
     path('view/callRute', metroversoViews.callRute, name='callRute'),
     path('view/getServiceHours', metroversoViews.getServiceHours, name='getServiceHours'),
+    path('view/nearest', metroversoViews.nearest, name='nearest'),
+    path('view/batchRoutes', metroversoViews.batch_routes, name='batch_routes'),
+    path('view/isochrone', metroversoViews.isochrone, name='isochrone'),
+    path('view/paretoRoutes', metroversoViews.pareto_routes, name='pareto_routes'),
+    path('view/reroute', metroversoViews.reroute, name='reroute'),
+    path('view/travelMatrix', metroversoViews.travel_matrix, name='travel_matrix'),
+    path('view/closures', metroversoViews.closures, name='closures'),
+    path('view/closures/<int:closure_id>/end', metroversoViews.end_closure, name='end_closure'),
     path('dashboard/', dashboard, name='dashboard'),
     path('save-journey/', metroversoViews.save_journey, name='save_journey'),
     
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Station, Route, Package, BlogPost, PointOfInterest, StationService
+from .models import User, Station, Route, Package, BlogPost, PointOfInterest, StationService, Closure
 
 # Registro de modelos básicos
 admin.site.register(User)
@@ -9,3 +9,4 @@ admin.site.register(Package)
 admin.site.register(BlogPost)
 admin.site.register(PointOfInterest)
 admin.site.register(StationService)
+admin.site.register(Closure)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MetroversoappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'metroversoApp'
+
+    def ready(self):
+        # Connects the receivers that keep the in-memory caches in sync with the database
+        from . import signals  # noqa: F401
@@ -0,0 +1,281 @@
+"""
+k-shortest loopless alternative routes (Yen's algorithm).
+
+Alternatives are meant to be different trips, but the shared stations of
+Metroplus lines 1 and 2 are pairs of nodes joined by 0.01-minute transfer
+edges, so the k shortest paths of G between two of them are mostly the same
+trip with the hop between the twin nodes made at another station. Yen's
+algorithm therefore runs on the station groups: nodes joined by transfers of
+at most SAME_STATION_MINUTES form one group, and an arc between two groups
+costs the cheapest arc between their nodes. Each route found there is
+turned back into the cheapest path of G through the nodes of its groups, in
+order. Routes are ranked, and their cost reported, on the groups: the hops
+between the nodes of a group are not counted, so a route that changes
+between twin nodes does not cost one more 'transfer' than the same trip
+without the change.
+
+The alternatives of an OD pair are found one at a time: every accepted
+route is the cheapest of the candidates queued so far, and accepting it
+queues the spur paths that leave it at each of its groups (the search from
+the spur group avoids the groups before it and the next arc of every
+accepted route with the same beginning). The state of each OD pair and
+criterion, accepted routes and queued candidates, is kept in a bounded LRU,
+so asking for alternative k + 1 after the first k only accepts one more
+candidate and queues its spur paths.
+
+Searches run on the routing engine with the active closures applied
+(closures.routing_engine); the states are dropped when its version changes.
+"""
+import math
+import threading
+from collections import OrderedDict
+from heapq import heappush, heappop
+
+import networkx as nx
+
+SAME_STATION_MINUTES = 0.05
+MAX_ALTERNATIVES = 10
+CACHE_MAX_ENTRIES = 128
+
+_lock = threading.Lock()
+# (source, target, criterion) -> _YenState
+_states = OrderedDict()
+# criterion -> _GroupGraph of the engine at _graph_version
+_group_graphs = {}
+_graph_version = None
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'spur_searches': 0}
+
+
+class _GroupGraph:
+    """Station groups of an engine and the cheapest arc between every two adjacent groups for one criterion."""
+
+    def __init__(self, engine, criterion):
+        n = engine.number_of_nodes
+        weights = engine.weight_list(criterion)
+        times = engine.weight_list('time')
+        walking = engine.arc_transfer.tolist()
+
+        parent = list(range(n))
+
+        def find(v):
+            while parent[v] != v:
+                parent[v] = parent[parent[v]]
+                v = parent[v]
+            return v
+
+        for v in range(n):
+            for k, u in engine.arcs[v]:
+                if walking[k] and times[k] <= SAME_STATION_MINUTES:
+                    parent[find(u)] = find(v)
+        roots = {}
+        self.group = [roots.setdefault(find(v), len(roots)) for v in range(n)]
+        self.members = [[] for _ in roots]
+        for v in range(n):
+            self.members[self.group[v]].append(v)
+
+        cheapest = [{} for _ in roots]
+        for v in range(n):
+            for k, u in engine.arcs[v]:
+                g, h = self.group[v], self.group[u]
+                if g != h and weights[k] < cheapest[g].get(h, math.inf):
+                    cheapest[g][h] = weights[k]
+        # Same layout as CompiledGraph: per group (arc, head) and a flat weight list
+        self.weights = []
+        self._arcs = []
+        for heads in cheapest:
+            arcs = []
+            for h, weight in heads.items():
+                arcs.append((len(self.weights), h))
+                self.weights.append(weight)
+            self._arcs.append(tuple(arcs))
+
+    def arc_index(self, g, h):
+        for k, head in self._arcs[g]:
+            if head == h:
+                return k
+        return -1
+
+
+def _shortest_path(graph, weights, source, target, banned_nodes=(), banned_arcs=()):
+    """Dijkstra from `source` to `target` avoiding `banned_nodes` and `banned_arcs`; (path, cost) or None."""
+    arcs = graph._arcs
+    dist = {source: 0.0}
+    pred = {source: -1}
+    done = set()
+    fringe = [(0.0, source)]
+    while fringe:
+        d, v = heappop(fringe)
+        if v in done:
+            continue
+        done.add(v)
+        if v == target:
+            path = [v]
+            while pred[path[-1]] >= 0:
+                path.append(pred[path[-1]])
+            path.reverse()
+            return path, d
+        for k, u in arcs[v]:
+            if u in banned_nodes or k in banned_arcs or u in done:
+                continue
+            candidate = d + weights[k]
+            if candidate < dist.get(u, math.inf):
+                dist[u] = candidate
+                pred[u] = v
+                heappush(fringe, (candidate, u))
+    return None
+
+
+def _expand(engine, weights, groups, source, target, group_path):
+    """
+    Cheapest path of the engine from `source` to `target` through the nodes
+    of `group_path`, group after group, as a list of integer ids.
+    """
+    # Nodes of the search are (position in group_path, node)
+    last = len(group_path) - 1
+    dist = {(0, source): 0.0}
+    pred = {(0, source): None}
+    done = set()
+    fringe = [(0.0, 0, source)]
+    while fringe:
+        d, j, v = heappop(fringe)
+        if (j, v) in done:
+            continue
+        done.add((j, v))
+        if j == last and v == target:
+            break
+        for k, u in engine.arcs[v]:
+            g = groups.group[u]
+            if g == group_path[j]:
+                state = (j, u)
+            elif j < last and g == group_path[j + 1]:
+                state = (j + 1, u)
+            else:
+                continue
+            candidate = d + weights[k]
+            if candidate < dist.get(state, math.inf):
+                dist[state] = candidate
+                pred[state] = (j, v)
+                heappush(fringe, (candidate, state[0], u))
+
+    state = (last, target)
+    path = []
+    while state is not None:
+        path.append(state[1])
+        state = pred[state]
+    path.reverse()
+    return path
+
+
+class _YenState:
+    """Accepted routes and queued candidates of one OD pair and criterion, over station groups."""
+
+    def __init__(self, source, target, criterion):
+        self.lock = threading.Lock()
+        self.source, self.target, self.criterion = source, target, criterion
+        self.routes = []        # accepted (group cost, group path, path of integer ids), cheapest first
+        self.candidates = []    # heap of (cost, push order, group path)
+        self.queued = set()     # every group path accepted or queued
+        self.spurred = 0        # accepted routes whose spur paths are queued
+        self.pushes = 0
+
+    def extend(self, engine, groups, k):
+        """Accepts routes until there are `k` or no candidate is left; returns how many were added."""
+        weights = groups.weights
+        source, target = groups.group[self.source], groups.group[self.target]
+        added = 0
+        if not self.routes and not self.queued:
+            first = _shortest_path(groups, weights, source, target)
+            if first is not None:
+                self._queue(tuple(first[0]), first[1])
+        while len(self.routes) < k:
+            if self.spurred < len(self.routes):
+                self._queue_spur_paths(groups, weights, target, self.routes[self.spurred][1])
+                self.spurred += 1
+                continue
+            if not self.candidates:
+                break
+            cost, _, group_path = heappop(self.candidates)
+            expanded = _expand(engine, engine.weight_list(self.criterion), groups, self.source, self.target, group_path)
+            self.routes.append((cost, group_path, expanded))
+            added += 1
+        return added
+
+    def _queue(self, group_path, cost):
+        if group_path not in self.queued:
+            self.queued.add(group_path)
+            self.pushes += 1
+            heappush(self.candidates, (cost, self.pushes, group_path))
+
+    def _queue_spur_paths(self, groups, weights, target, group_path):
+        """Queues the cheapest detour leaving `group_path` at each of its groups."""
+        with _lock:
+            _stats['spur_searches'] += len(group_path) - 1
+        root_cost = 0.0
+        for i in range(len(group_path) - 1):
+            root = group_path[:i + 1]
+            banned_arcs = {
+                groups.arc_index(route[i], route[i + 1])
+                for _, route, _ in self.routes if len(route) > i + 1 and route[:i + 1] == root
+            }
+            found = _shortest_path(groups, weights, group_path[i], target, set(root[:-1]), banned_arcs)
+            if found is not None:
+                spur, spur_cost = found
+                self._queue(root[:-1] + tuple(spur), root_cost + spur_cost)
+            root_cost += weights[groups.arc_index(group_path[i], group_path[i + 1])]
+
+
+def _check_graph_version(engine):
+    """Drops every state if the graph, or the closures applied to it, changed. Call with _lock held."""
+    global _graph_version
+    if engine.version != _graph_version:
+        if _states:
+            _stats['invalidations'] += 1
+        _states.clear()
+        _group_graphs.clear()
+        _graph_version = engine.version
+
+
+def k_shortest_routes(star, destination, criterion, k):
+    """
+    Returns (routes, added): the `k` (at most MAX_ALTERNATIVES) cheapest
+    loopless routes from `star` to `destination` for `criterion` that are
+    different trips, as (cost, list of station ids) cheapest first, and how
+    many of them this call had to search for (0 when they were all cached).
+    The cost is the one routes are ranked by, over the station groups.
+    Raises nx.NodeNotFound for unknown stations and nx.NetworkXNoPath if they
+    are not connected.
+    """
+    from metroversoApp.assets import closures
+
+    engine = closures.routing_engine()
+    source, target = engine.node_index(star), engine.node_index(destination)
+    k = max(1, min(k, MAX_ALTERNATIVES))
+    key = (star, destination, criterion)
+    with _lock:
+        _check_graph_version(engine)
+        groups = _group_graphs.get(criterion)
+        if groups is None:
+            groups = _group_graphs[criterion] = _GroupGraph(engine, criterion)
+        state = _states.get(key)
+        if state is not None:
+            _states.move_to_end(key)
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+            state = _states[key] = _YenState(source, target, criterion)
+            while len(_states) > CACHE_MAX_ENTRIES:
+                _states.popitem(last=False)
+                _stats['evictions'] += 1
+
+    with state.lock:
+        added = state.extend(engine, groups, k)
+        routes = state.routes[:k]
+    if not routes:
+        raise nx.NetworkXNoPath(f"No path to {destination}.")
+    return [(cost, [engine.node_ids[i] for i in path]) for cost, _, path in routes], added
+
+
+def get_cache_info():
+    """Returns the counters, the number of OD pairs kept and the size limit."""
+    with _lock:
+        return dict(_stats, entries=len(_states), max_entries=CACHE_MAX_ENTRIES)
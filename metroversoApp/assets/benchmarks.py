@@ -0,0 +1,409 @@
+"""
+Micro-benchmarks for the routing code.
+
+Run from the project root, for example:
+    python -m metroversoApp.assets.benchmarks route_table
+Without arguments every benchmark is run.
+Set METROVERSO_FEEDER_NETWORK=1 to run them on the network with the feeder
+buses; the OD pairs are then sampled.
+"""
+import random
+import sys
+import time
+
+import networkx as nx
+
+
+def _timeit(func, repeat=3):
+    """Runs `func` `repeat` times and returns the best wall time in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# Above MAX_OD_PAIRS pairs (the metro network has ~12,000) a fixed sample of
+# SAMPLED_OD_PAIRS is used instead
+MAX_OD_PAIRS = 15000
+SAMPLED_OD_PAIRS = 1000
+
+
+def _od_pairs(nodes):
+    """Every OD pair of `nodes`, or a fixed random sample if there are too many."""
+    nodes = list(nodes)
+    n = len(nodes)
+    if n * (n - 1) <= MAX_OD_PAIRS:
+        return [(u, v) for u in nodes for v in nodes if u != v]
+    rng = random.Random(0)
+    pairs = []
+    while len(pairs) < SAMPLED_OD_PAIRS:
+        u, v = rng.choice(nodes), rng.choice(nodes)
+        if u != v:
+            pairs.append((u, v))
+    return pairs
+
+
+def benchmark_route_table():
+    """Per-request nx.dijkstra_path against a lookup in the precomputed route tables."""
+    from metroversoApp.assets.stationGraphs import G
+    from metroversoApp.assets import routeTable
+
+    if not routeTable.has_table("weight"):
+        print("=== ROUTE TABLE: skipped, no tables for a network this large ===")
+        return
+
+    pairs = _od_pairs(G)
+    print(f"=== ROUTE TABLE vs DIJKSTRA ({len(pairs)} OD pairs) ===")
+
+    for criterion in routeTable.ROUTE_CRITERIA:
+        def run_dijkstra():
+            for u, v in pairs:
+                nx.dijkstra_path(G, u, v, weight=criterion)
+
+        def run_table():
+            for u, v in pairs:
+                routeTable.get_route(u, v, criterion)
+
+        t_dijkstra = _timeit(run_dijkstra)
+        t_table = _timeit(run_table)
+        print(f"{criterion:12s} dijkstra {t_dijkstra / len(pairs) * 1e6:8.1f} us/query   "
+              f"table {t_table / len(pairs) * 1e6:6.1f} us/query   "
+              f"x{t_dijkstra / t_table:.1f}")
+
+    rebuild = _timeit(routeTable.rebuild_route_tables, repeat=1)
+    print(f"Full rebuild ({len(routeTable.ROUTE_CRITERIA)} criteria): {rebuild * 1000:.1f} ms")
+
+
+def benchmark_engine():
+    """nx.dijkstra_path on G against the compiled CSR engine, plus memory use."""
+    import tracemalloc
+
+    from metroversoApp.assets.stationGraphs import G
+    from metroversoApp.assets import routingEngine
+
+    pairs = _od_pairs(G)
+    engine = routingEngine.engine
+    print(f"=== CSR ENGINE vs NETWORKX ({len(pairs)} OD pairs) ===")
+
+    for criterion in routingEngine.ENGINE_CRITERIA:
+        mismatches = sum(
+            1 for u, v in pairs
+            if engine.shortest_path(u, v, criterion) != nx.dijkstra_path(G, u, v, weight=criterion)
+        )
+
+        def run_nx():
+            for u, v in pairs:
+                nx.dijkstra_path(G, u, v, weight=criterion)
+
+        def run_engine():
+            for u, v in pairs:
+                engine.shortest_path(u, v, criterion)
+
+        t_nx = _timeit(run_nx)
+        t_engine = _timeit(run_engine)
+        print(f"{criterion:12s} networkx {t_nx / len(pairs) * 1e6:7.1f} us/query   "
+              f"engine {t_engine / len(pairs) * 1e6:7.1f} us/query   "
+              f"x{t_nx / t_engine:.1f}   mismatches {mismatches}")
+
+    tracemalloc.start()
+    graph_copy = G.copy()
+    graph_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del graph_copy
+    print(f"Memory: nx.Graph {graph_bytes / 1024:.1f} KiB   engine arrays {engine.nbytes() / 1024:.1f} KiB")
+
+
+def benchmark_cold_start():
+    """Building G and the engine from stationGraphs against loading the network snapshot."""
+    import subprocess
+
+    from metroversoApp.assets import networkSnapshot, routingEngine, routeTable
+    from metroversoApp.assets.stationGraphs import build_graph, INCLUDE_FEEDER_NETWORK
+
+    print("=== COLD START: SOURCE BUILD vs SNAPSHOT ===")
+    if networkSnapshot.loaded_snapshot() is None:
+        networkSnapshot.write_snapshot(build_graph(), options={'feeder_network': INCLUDE_FEEDER_NETWORK})
+
+    def from_source():
+        engine = routingEngine.compile_graph(build_graph())
+        if routeTable.tables_supported(engine):
+            routeTable.build_route_tables(engine)
+
+    def from_snapshot():
+        snapshot = networkSnapshot.load_snapshot()
+        networkSnapshot.graph_from_snapshot(snapshot)
+        routingEngine.engine_from_snapshot(snapshot)
+
+    t_source = _timeit(from_source, repeat=5)
+    t_snapshot = _timeit(from_snapshot, repeat=5)
+    print(f"build G + engine + route tables: {t_source * 1000:7.2f} ms")
+    print(f"load snapshot (mmap):            {t_snapshot * 1000:7.2f} ms   x{t_source / t_snapshot:.1f}")
+
+    code = ("import time; t = time.perf_counter(); "
+            "import metroversoApp.assets.routeTable; "
+            "print(time.perf_counter() - t)")
+    runs = [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True).stdout.split()[-1])
+            for _ in range(3)]
+    print(f"Full import of the routing stack in a fresh process: {min(runs) * 1000:.1f} ms "
+          f"(networkx and numpy imports included)")
+
+
+def benchmark_astar():
+    """Nodes expanded and query time of Dijkstra, A* and bidirectional A* on the engine."""
+    from metroversoApp.assets import routingEngine
+
+    engine = routingEngine.engine
+    pairs = _od_pairs(engine.node_ids)
+    print(f"=== DIJKSTRA vs A* ({engine.number_of_nodes} nodes, {len(pairs)} OD pairs, criterion 'time') ===")
+
+    for algorithm in routingEngine.SEARCH_ALGORITHMS:
+        expanded = sum(engine.search(u, v, "time", algorithm)[1] for u, v in pairs)
+
+        def run():
+            for u, v in pairs:
+                engine.search(u, v, "time", algorithm)
+
+        elapsed = _timeit(run)
+        print(f"{algorithm:14s} {expanded / len(pairs):7.1f} nodes expanded/query   "
+              f"{elapsed / len(pairs) * 1e6:7.1f} us/query")
+
+
+def benchmark_nearest():
+    """k-nearest stations from the grid index against scanning every station."""
+    from metroversoApp.assets import spatialIndex
+
+    index = spatialIndex.station_index(feeder_stops=True)
+    stations = list(index.points.items())
+    rng = random.Random(0)
+    # Points around the network, as users and map clicks are
+    queries = [(lon + rng.uniform(-0.01, 0.01), lat + rng.uniform(-0.01, 0.01))
+               for lon, lat in rng.choices([pos for _, pos in stations], k=2000)]
+    print(f"=== NEAREST STATION ({len(index)} points, {len(queries)} queries) ===")
+
+    for k in (1, 3):
+        def run_scan():
+            for lon, lat in queries:
+                sorted(stations, key=lambda item: spatialIndex.haversine_km(lon, lat, *item[1]))[:k]
+
+        def run_index():
+            spatialIndex.nearest_stations(queries, k, feeder_stops=True)
+
+        t_scan = _timeit(run_scan, repeat=1)
+        t_index = _timeit(run_index)
+        print(f"k={k}   scan {t_scan / len(queries) * 1e6:8.1f} us/query   "
+              f"grid index {t_index / len(queries) * 1e6:6.1f} us/query   x{t_scan / t_index:.1f}")
+
+
+def benchmark_fares():
+    """Compiled fare automaton against the original pattern matching, on every route of the table."""
+    from metroversoApp.assets import functions, routeTable
+    from metroversoApp.assets.stationGraphs import G
+
+    criterion = "time"
+    if not routeTable.has_table(criterion):
+        print("=== FARE PACKAGES: skipped, no route table for a network this large ===")
+        return
+    routes = [routeTable.get_route(u, v, criterion) for u, v in _od_pairs(G)]
+    print(f"=== FARE PACKAGES ({len(routes)} routes) ===")
+
+    mismatches = sum(
+        1 for route in routes
+        if functions.get_route_pricing_package(route) != functions._reference_route_pricing_package(route)
+    )
+
+    def run_reference():
+        for route in routes:
+            functions._reference_route_pricing_package(route)
+
+    def run_automaton():
+        for route in routes:
+            functions.get_route_pricing_package(route)
+
+    t_reference = _timeit(run_reference)
+    t_automaton = _timeit(run_automaton)
+    print(f"pattern lists {t_reference / len(routes) * 1e6:7.2f} us/route   "
+          f"automaton ({len(functions._FARE_NEXT)} states) {t_automaton / len(routes) * 1e6:6.2f} us/route   "
+          f"x{t_reference / t_automaton:.1f}   mismatches {mismatches}")
+
+
+def benchmark_annotate():
+    """One-pass annotate_route against the separate passes calculeRute used to make, on every OD pair."""
+    from metroversoApp.assets import functions, routeTable, stationGraphs
+    from metroversoApp.assets.stationGraphs import G
+
+    criterion = "time"
+    if not routeTable.has_table(criterion):
+        print("=== ROUTE ANNOTATION: skipped, no route table for a network this large ===")
+        return
+    routes = [routeTable.get_route(u, v, criterion) for u, v in _od_pairs(G)]
+    print(f"=== ROUTE ANNOTATION ({len(routes)} routes) ===")
+
+    def multi_pass(route):
+        all_coords = {**stationGraphs.lineaA, **stationGraphs.linea1, **stationGraphs.linea2,
+                      **stationGraphs.lineaL, **stationGraphs.lineaB, **stationGraphs.lineaT,
+                      **stationGraphs.lineaZ, **stationGraphs.lineaJ, **stationGraphs.lineaH,
+                      **stationGraphs.lineaO, **stationGraphs.lineaP, **stationGraphs.lineaK}
+        rute_coords = [all_coords.get(n) or list(G.nodes[n]['pos']) for n in route]
+        transfer_info = functions.analyze_route_transfers(route)
+        transfer_coords = [all_coords.get(n) or list(G.nodes[n]['pos']) for n in transfer_info['transfer_stations']]
+        return transfer_info, rute_coords, transfer_coords, functions.get_route_pricing_package(route)
+
+    mismatches = sum(1 for route in routes if multi_pass(route) != functions.annotate_route(route))
+
+    def run_multi_pass():
+        for route in routes:
+            multi_pass(route)
+
+    def run_one_pass():
+        for route in routes:
+            functions.annotate_route(route)
+
+    t_multi = _timeit(run_multi_pass)
+    t_one = _timeit(run_one_pass)
+    print(f"separate passes {t_multi / len(routes) * 1e6:7.2f} us/route   "
+          f"annotate_route {t_one / len(routes) * 1e6:6.2f} us/route   "
+          f"x{t_multi / t_one:.1f}   mismatches {mismatches}")
+
+
+def benchmark_batch():
+    """One Dijkstra tree per origin, as batch_route_responses does, against one search per query."""
+    from metroversoApp.assets import routingEngine
+    from metroversoApp.assets.stationGraphs import G
+
+    engine = routingEngine.engine
+    criterion = "time"
+    nodes = sorted(G.nodes())
+    rng = random.Random(0)
+    origins = rng.sample(nodes, min(20, len(nodes)))
+    queries = [(s, t) for s in origins for t in rng.sample(nodes, min(50, len(nodes)))]
+    print(f"=== BATCH ROUTING ({len(queries)} queries, {len(origins)} origins) ===")
+
+    def run_per_query(algorithm):
+        return [engine.search(s, t, criterion, algorithm)[0] for s, t in queries]
+
+    def run_grouped():
+        paths = []
+        trees = {}
+        for s, t in queries:
+            if s not in trees:
+                trees[s] = engine.dijkstra(engine.index[s], criterion)
+            pred = trees[s][1]
+            path_ids = engine.path_from_pred(pred, engine.index[s], engine.index[t])
+            paths.append([engine.node_ids[i] for i in path_ids])
+        return paths
+
+    mismatches = sum(1 for a, b in zip(run_per_query("dijkstra"), run_grouped()) if a != b)
+    t_grouped = _timeit(run_grouped)
+    line = f"grouped {t_grouped / len(queries) * 1e6:7.1f} us/query"
+    for algorithm in ("dijkstra", "bidirectional"):
+        t = _timeit(lambda: run_per_query(algorithm))
+        line += f"   {algorithm} {t / len(queries) * 1e6:7.1f} us/query (x{t / t_grouped:.1f})"
+    print(f"{line}   mismatches {mismatches}")
+
+
+def benchmark_matrix():
+    """All-pairs matrices propagated down the trees against walking every route pair by pair."""
+    from metroversoApp.assets import functions, routeTable, routingEngine, travelMatrix
+    from metroversoApp.assets.stationGraphs import G
+
+    criterion = "time"
+    if not routeTable.has_table(criterion):
+        print("=== TRAVEL MATRIX: skipped, pair by pair is too slow on a network this large ===")
+        return
+    nodes = list(G.nodes())
+    print(f"=== TRAVEL MATRIX ({len(nodes)} x {len(nodes)} stations) ===")
+
+    def run_pairwise():
+        for s in nodes:
+            for t in nodes:
+                route = routeTable.get_route(s, t, criterion)
+                routeTable.get_route_duration(s, t, criterion)
+                functions.detect_transfers(route)
+                functions.get_route_pricing_package(route)
+
+    t_pairwise = _timeit(run_pairwise, repeat=1)
+    t_matrix = _timeit(lambda: travelMatrix.compute_matrices(routingEngine.engine, criterion))
+    print(f"pair by pair {t_pairwise * 1e3:8.1f} ms   matrices {t_matrix * 1e3:7.1f} ms   x{t_pairwise / t_matrix:.1f}")
+
+
+def benchmark_line_graph():
+    """Fewest transfers on the line graph against the 'transfer' criterion, which counts transfer edges."""
+    from metroversoApp.assets import lineGraph, routingEngine
+    from metroversoApp.assets.stationGraphs import G
+
+    engine = routingEngine.engine
+    pairs = _od_pairs(G.nodes())
+    t_build = _timeit(lambda: lineGraph.LineGraph(engine))
+    line_graph = lineGraph.LineGraph(engine)
+    print(f"=== LINE GRAPH ({len(pairs)} OD pairs, {engine.number_of_nodes} -> {line_graph.number_of_nodes} nodes, "
+          f"built in {t_build * 1e3:.1f} ms) ===")
+
+    def route_time(path):
+        return sum(G[u][v]["time"] for u, v in zip(path, path[1:]))
+
+    old = [engine.search(s, t, "transfer", "dijkstra")[0] for s, t in pairs]
+    new = [line_graph.search(s, t, "transfers") for s, t in pairs]
+    old_edges = [sum(G[u][v].get("transfer", 0) for u, v in zip(path, path[1:])) for path in old]
+    fewer = sum(1 for count, route in zip(old_edges, new) if route.transfers < count)
+    faster = sum(1 for count, path, route in zip(old_edges, old, new)
+                 if route.transfers == count and route_time(route.path) < route_time(path) - 1e-6)
+    print(f"transfer edges {sum(old_edges) / len(pairs):.2f}/route   line transfers "
+          f"{sum(route.transfers for route in new) / len(pairs):.2f}/route   "
+          f"fewer on {fewer} pairs, same count but faster on {faster}")
+
+    t_old = _timeit(lambda: [engine.search(s, t, "transfer", "dijkstra") for s, t in pairs])
+    t_new = _timeit(lambda: [line_graph.search(s, t, "transfers") for s, t in pairs])
+    print(f"'transfer' dijkstra {t_old / len(pairs) * 1e6:7.1f} us/query   "
+          f"line graph {t_new / len(pairs) * 1e6:7.1f} us/query")
+
+
+def benchmark_time_layers():
+    """Queries on the time-of-day layers against the same queries on the static 'time'."""
+    from metroversoApp.assets import routingEngine, speedProfiles
+
+    engine = routingEngine.engine
+    pairs = _od_pairs(engine.node_ids)
+    t_compile = _timeit(lambda: speedProfiles.compile_layers(engine))
+    criteria, layers = engine.layers
+    print(f"=== TIME LAYERS ({len(criteria)} layers of {engine.number_of_arcs} arcs, {layers.nbytes / 1024:.1f} KiB, "
+          f"compiled in {t_compile * 1e3:.2f} ms, {len(pairs)} OD pairs) ===")
+
+    for algorithm in ("dijkstra", "bidirectional"):
+        for criterion in ("time",) + criteria:
+            expanded = sum(engine.search(u, v, criterion, algorithm)[1] for u, v in pairs)
+            changed = sum(1 for u, v in pairs
+                          if engine.search(u, v, criterion, algorithm)[0] != engine.search(u, v, "time", algorithm)[0])
+
+            def run():
+                for u, v in pairs:
+                    engine.search(u, v, criterion, algorithm)
+
+            elapsed = _timeit(run, repeat=5)
+            print(f"{algorithm:14s} {criterion:8s} {expanded / len(pairs):7.1f} nodes expanded/query   "
+                  f"{elapsed / len(pairs) * 1e6:7.1f} us/query   {changed} routes differ from 'time'")
+
+
+BENCHMARKS = {
+    'route_table': benchmark_route_table,
+    'engine': benchmark_engine,
+    'cold_start': benchmark_cold_start,
+    'astar': benchmark_astar,
+    'nearest': benchmark_nearest,
+    'fares': benchmark_fares,
+    'annotate': benchmark_annotate,
+    'batch': benchmark_batch,
+    'matrix': benchmark_matrix,
+    'line_graph': benchmark_line_graph,
+    'time_layers': benchmark_time_layers,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
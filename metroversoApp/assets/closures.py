@@ -0,0 +1,171 @@
+"""
+Temporary closures of stations and connections (models.Closure).
+
+Closures never touch G or the compiled engine. The closures active right now
+are turned into an overlay of the routing engine (routingEngine.with_closed_arcs)
+where the closed arcs weigh inf, and routing_engine() returns that overlay
+while there is any. The route tables stay as they are: a table route that
+does not go through a closure is still the shortest one (closing arcs only
+raises costs), and the ones that do are searched again on the overlay (see
+functions.find_route).
+
+When the set of active closures changes, only the affected route responses
+are dropped from routeCache: the ones going through a new closure, and the
+ones computed while a closure that just ended was active.
+
+Every process keeps its own copy of the closures. Saving or deleting a
+Closure (metroversoApp.signals) rewrites the CLOSURES_STAMP stamp file
+(stampFile); every process compares that file with the one it loaded on
+each routing call (one stat) and reloads when it changed. The table is also read again every
+CLOSURE_POLL_SECONDS, and the active set is recomputed whenever a closure
+starts or ends.
+"""
+import threading
+import time
+
+from metroversoApp.assets import stampFile
+
+CLOSURES_STAMP = 'closures'
+CLOSURE_POLL_SECONDS = 30
+
+_lock = threading.Lock()
+# Closures that have not ended: (id, station, other_station, starts_at, ends_at)
+_rows = None
+_loaded_stamp = None
+_loaded_at = 0.0
+# Ids of the closures active now, and when that can change next
+_active = frozenset()
+_next_change = None
+# Engine the overlay was built on, and the overlay (None without active closures)
+_base_engine = None
+_overlay = None
+_closed_stations = frozenset()
+_closed_edges = frozenset()
+_stats = {'loads': 0, 'changes': 0}
+
+
+def _load_rows(now):
+    from django.db import DatabaseError
+    from django.db.models import Q
+    from metroversoApp.models import Closure
+
+    try:
+        return tuple(
+            Closure.objects.filter(Q(ends_at__isnull=True) | Q(ends_at__gt=now))
+            .values_list('id_closure', 'station', 'other_station', 'starts_at', 'ends_at')
+        )
+    except DatabaseError as e:
+        print(f"Warning: could not read the closures ({e}); routing without them")
+        return ()
+
+
+def _closed_elements(rows, engine):
+    """(closed stations, closed edges as (u, v) in both directions, closed arc positions) of `rows`."""
+    import numpy as np
+
+    stations, edges, arcs = set(), set(), []
+    for _, station, other_station, _, _ in rows:
+        if station not in engine.index or (other_station and other_station not in engine.index):
+            print(f"Warning: closure of unknown station {station} {other_station}".rstrip())
+            continue
+        u = engine.index[station]
+        if other_station:
+            v = engine.index[other_station]
+            edges.update({(station, other_station), (other_station, station)})
+            arcs.extend(k for k in (engine.arc_index(u, v), engine.arc_index(v, u)) if k >= 0)
+        else:
+            stations.add(station)
+            arcs.extend(engine.station_arcs(u).tolist())
+    return frozenset(stations), frozenset(edges), np.array(sorted(set(arcs)), dtype=np.int64)
+
+
+def refresh():
+    """
+    Brings the active closures up to date: reloads them if another process
+    changed them (or after CLOSURE_POLL_SECONDS) and recomputes the overlay
+    when a closure started or ended. Cheap when nothing changed.
+    """
+    global _rows, _loaded_stamp, _loaded_at, _active, _next_change
+    global _base_engine, _overlay, _closed_stations, _closed_edges
+    from django.utils import timezone
+    from metroversoApp.assets import routingEngine, routeCache
+
+    stamp = stampFile.read_stamp(CLOSURES_STAMP)
+    now = timezone.now()
+    engine = routingEngine.engine
+    if (_rows is not None and stamp == _loaded_stamp and time.monotonic() - _loaded_at < CLOSURE_POLL_SECONDS
+            and (_next_change is None or now < _next_change) and _base_engine is engine):
+        return
+
+    with _lock:
+        if _rows is None or stamp != _loaded_stamp or time.monotonic() - _loaded_at >= CLOSURE_POLL_SECONDS:
+            _rows = _load_rows(now)
+            _loaded_stamp = stamp
+            _loaded_at = time.monotonic()
+            _stats['loads'] += 1
+
+        active_rows = [row for row in _rows if row[3] <= now and (row[4] is None or now < row[4])]
+        active = frozenset(row[0] for row in active_rows)
+        changes = [t for row in _rows for t in (row[3], row[4]) if t is not None and t > now]
+        _next_change = min(changes, default=None)
+        if active == _active and _base_engine is engine:
+            return
+
+        previous = _active
+        stations, edges, arcs = _closed_elements(active_rows, engine)
+        _overlay = engine.with_closed_arcs(arcs) if len(arcs) else None
+        _base_engine = engine
+        _active, _closed_stations, _closed_edges = active, stations, edges
+        _stats['changes'] += 1
+
+        # Only what a new closure goes through, or what was routed around an ended one
+        started = [row for row in active_rows if row[0] not in previous]
+        started_stations, started_edges, _ = _closed_elements(started, engine)
+        routeCache.invalidate_routes(started_stations, started_edges, previous - active)
+
+
+def routing_engine():
+    """The routing engine with the active closures applied (the plain engine when there are none)."""
+    from metroversoApp.assets import routingEngine
+
+    refresh()
+    overlay = _overlay
+    return overlay if overlay is not None else routingEngine.engine
+
+
+def active_ids():
+    """Ids of the closures active now."""
+    refresh()
+    return _active
+
+
+def route_is_open(path):
+    """True if `path` does not go through a closed station or connection."""
+    refresh()
+    stations, edges = _closed_stations, _closed_edges
+    if not stations and not edges:
+        return True
+    return not any(station in stations for station in path) and not any(edge in edges for edge in zip(path, path[1:]))
+
+
+def notify_changed():
+    """
+    Called after a Closure is saved or deleted: reloads them here on the next
+    call, and rewrites the stamp file so every other process does too.
+    """
+    global _rows
+    with _lock:
+        _rows = None
+    try:
+        stampFile.write_stamp(CLOSURES_STAMP)
+    except OSError as e:
+        print(f"Warning: could not write the {CLOSURES_STAMP} stamp ({e}); other processes see the change "
+              f"within {CLOSURE_POLL_SECONDS} s")
+
+
+def get_closures_info():
+    """Counters and the closures active now."""
+    refresh()
+    return dict(_stats, active=sorted(_active), closed_stations=sorted(_closed_stations),
+                closed_edges=sorted(edge for edge in _closed_edges if edge[0] < edge[1]),
+                next_change=_next_change)
@@ -0,0 +1,191 @@
+"""
+Cheapest-fare routes.
+
+The fare rules are the automaton of functions (_FARE_NEXT, _FARE_EMIT,
+_FARE_FINAL): a package can be charged on any step of the route and at its
+end, depending on the transports used so far. get_route_pricing_package
+prices a route once it is chosen; here the automaton runs inside the search
+instead. A search state is (station, automaton state, last transport
+counted), moving onto a station takes the automaton's transition for that
+station's transport, and the move costs the price of the package it charges
+for the profile (priceTable, in memory). Reaching the target charges the
+final package of its state through one more step to a virtual sink.
+
+Routes minimise (price, time): the fastest of the routes with the cheapest
+fare. Both are folded into one exact integer, prices in cents and times in
+lineGraph.TIME_RESOLUTION units, so a plain Dijkstra answers them. Most trips
+are charged a single package at the end, so the search mostly runs through
+states that have not paid anything yet, in order of time. The arcs come from
+the routing engine with the active closures applied and are rebuilt whenever
+that engine changes.
+"""
+from dataclasses import dataclass
+from heapq import heappush, heappop
+import math
+import threading
+
+import networkx as nx
+
+from metroversoApp.assets.lineGraph import TIME_RESOLUTION
+
+# Criteria answered by a fare-aware search in functions.find_route
+FARE_CRITERIA = ("cheapest",)
+
+
+@dataclass
+class FareRoute:
+    """A cheapest route: stations of G, its price for the profile and its time in minutes."""
+    path: list
+    price: float = 0.0
+    time: float = 0.0
+    expanded_nodes: int = 0
+
+
+def _package_cents(profile):
+    """Price of every fare package for `profile` in cents, indexed by package id (0 without a price)."""
+    from metroversoApp.assets.travelMatrix import _package_prices
+
+    return [round(price * 100) for price in _package_prices(profile).tolist()]
+
+
+# (prices in cents, scale) -> transition_table()
+_tables = {}
+
+
+def transition_table(cents, scale=1):
+    """
+    Fare automaton as a flat table indexed by (fare state * slots + slot) *
+    slots + slot of the next station, where a slot is a column of the
+    automaton + 1 (0 for no transport yet, or a station of an unknown line).
+    Entries are (next fare state, next slot, cost of stepping onto the
+    station), the cost being the price in `cents` of the package charged,
+    times `scale`. Built once per set of prices.
+    """
+    from metroversoApp.assets.functions import FARE_TRANSPORTS, _FARE_NEXT, _FARE_EMIT
+
+    key = (tuple(cents), scale)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+    slots = len(FARE_TRANSPORTS) + 1
+    table = []
+    for fare_state in range(len(_FARE_NEXT)):
+        for slot in range(slots):
+            for column_slot in range(slots):
+                # Unknown lines are ignored and consecutive stops on the same transport count once
+                if column_slot == 0 or column_slot == slot:
+                    table.append((fare_state, slot, 0))
+                    continue
+                package = _FARE_EMIT[fare_state][column_slot - 1]
+                table.append((_FARE_NEXT[fare_state][column_slot - 1], column_slot,
+                              cents[package] * scale if package >= 0 else 0))
+    _tables[key] = table
+    return table
+
+
+class FareGraph:
+    """Arcs of a CompiledGraph in integer time units, with the fare column of every station."""
+
+    def __init__(self, engine):
+        from metroversoApp.assets.functions import FARE_TRANSPORTS, _FARE_NEXT
+        from metroversoApp.assets.travelMatrix import _fare_columns
+
+        self.engine = engine
+        indptr = engine.indptr.tolist()
+        indices = engine.indices.tolist()
+        times = engine.weights['time'].tolist()
+        self._fare_states = len(_FARE_NEXT)
+        # Last column counted + 1 (0 before the first known transport), the slot of a state
+        self._slots = len(FARE_TRANSPORTS) + 1
+        columns = _fare_columns(engine).tolist()
+        self._arcs = [
+            tuple((indices[k], round(times[k] / TIME_RESOLUTION), columns[indices[k]] + 1)
+                  for k in range(indptr[v], indptr[v + 1]) if times[k] != math.inf)  # closed arcs are left out
+            for v in range(engine.number_of_nodes)
+        ]
+        self._column_slots = [column + 1 for column in columns]
+        # State key: (station * fare states + fare state) * slots + slot
+        states = engine.number_of_nodes * self._fare_states * self._slots
+        # A shortest route visits every state at most once, so its time stays below this
+        self._time_scale = max((ticks for arcs in self._arcs for _, ticks, _ in arcs), default=0) * states + 1
+
+    def search(self, source, target, profile="Frecuente"):
+        """
+        Cheapest route from station `source` to station `target` for `profile`,
+        the fastest one among equally cheap routes. Returns a FareRoute.
+        Raises nx.NodeNotFound or nx.NetworkXNoPath.
+        """
+        from metroversoApp.assets.functions import _FARE_FINAL
+
+        s = self.engine.node_index(source)
+        t = self.engine.node_index(target)
+        cents = _package_cents(profile)
+        transitions = transition_table(cents, scale=self._time_scale)
+        arcs = self._arcs
+        fare_states, slots, scale = self._fare_states, self._slots, self._time_scale
+        station_states = fare_states * slots
+
+        sink = -1
+        fare_state, slot, cost = transitions[self._column_slots[s]]
+        start = s * station_states + fare_state * slots + slot
+        dist = {start: cost}
+        pred = {start: None}
+        done = set()
+        fringe = [(cost, start)]
+        while fringe:
+            d, key = heappop(fringe)
+            if key in done:
+                continue
+            done.add(key)
+            if key == sink:
+                break
+            v, state = divmod(key, station_states)
+            if v == t:
+                # The route ends here: charge the package still open
+                package = _FARE_FINAL[state // slots]
+                candidate = d + (cents[package] * scale if package >= 0 else 0)
+                if candidate < dist.get(sink, math.inf):
+                    dist[sink] = candidate
+                    pred[sink] = key
+                    heappush(fringe, (candidate, sink))
+                continue
+            base = state * slots
+            for u, ticks, column_slot in arcs[v]:
+                fare_state, slot, cost = transitions[base + column_slot]
+                next_key = u * station_states + fare_state * slots + slot
+                candidate = d + cost + ticks
+                if candidate < dist.get(next_key, math.inf):
+                    dist[next_key] = candidate
+                    pred[next_key] = key
+                    heappush(fringe, (candidate, next_key))
+
+        if sink not in done:
+            raise nx.NetworkXNoPath(f"No path to {target}.")
+
+        path = []
+        key = pred[sink]
+        while key is not None:
+            path.append(self.engine.node_ids[key // station_states])
+            key = pred[key]
+        path.reverse()
+        price, ticks = divmod(dist[sink], scale)
+        return FareRoute(path=path, price=price / 100, time=ticks * TIME_RESOLUTION, expanded_nodes=len(done) - 1)
+
+
+_fare_graph = None
+_lock = threading.Lock()
+
+
+def get_fare_graph():
+    """Fare graph of the current routing engine (closures applied), built on first use."""
+    global _fare_graph
+    from metroversoApp.assets import closures
+
+    engine = closures.routing_engine()
+    fare_graph = _fare_graph
+    if fare_graph is None or fare_graph.engine is not engine:
+        with _lock:
+            if _fare_graph is None or _fare_graph.engine is not engine:
+                _fare_graph = FareGraph(engine)
+            fare_graph = _fare_graph
+    return fare_graph
@@ -0,0 +1,125 @@
+"""
+Feeder-bus network (alimentadores) from todas_las_rutas.geojson.
+
+The file is a FeatureCollection of bus stops, one Point per stop with the
+properties ID (e.g. "C6-001-01") and ruta (e.g. "C6-001"). The stops of a
+route come one after the other in travel order, so consecutive stops of the
+same route are joined with a timed edge, like the metro lines in stationGraphs.
+
+The features are read one at a time from the file instead of loading the
+whole document, and every stop is linked on foot to the stations within
+walking distance found through a spatial index, instead of writing the
+add_transfer calls by hand.
+"""
+import json
+from pathlib import Path
+
+from metroversoApp.assets.spatialIndex import GridIndex
+
+FEEDER_GEOJSON_PATH = Path(__file__).resolve().parents[2] / 'todas_las_rutas.geojson'
+
+# Line key of the feeder stops in SPEEDS and in the station ids
+FEEDER_LINE_KEY = "C"
+
+# Stops closer than this to a station get a walking transfer to it
+LINK_RADIUS_KM = 0.3
+WALK_SPEED_KMH = 4.5
+MIN_WALK_MINUTES = 1.0
+
+
+def iter_features(path=FEEDER_GEOJSON_PATH, chunk_size=64 * 1024):
+    """
+    Yields the features of a GeoJSON FeatureCollection one by one.
+    Only `chunk_size` characters plus the feature being decoded are kept in
+    memory, whatever the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        # Skip everything up to the opening bracket of the "features" array
+        while True:
+            start = buffer.find('"features"')
+            bracket = buffer.find('[', start) if start != -1 else -1
+            if bracket != -1:
+                buffer = buffer[bracket + 1:]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError(f"{path} has no 'features' array")
+            buffer += chunk
+
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                feature, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The feature is cut at the end of the buffer: read more
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield feature
+            if pos >= chunk_size:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def iter_stops(path=FEEDER_GEOJSON_PATH):
+    """Yields (stop_id, route, [lon, lat]) for every Point feature in the file."""
+    for feature in iter_features(path):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            continue
+        properties = feature.get('properties') or {}
+        lon, lat = geometry['coordinates'][:2]
+        yield properties['ID'], properties['ruta'], [lon, lat]
+
+
+def walk_minutes(distance_km):
+    return max(MIN_WALK_MINUTES, distance_km / WALK_SPEED_KMH * 60.0)
+
+
+def add_feeder_network(G, path=FEEDER_GEOJSON_PATH, link_radius_km=LINK_RADIUS_KM):
+    """
+    Adds the feeder stops in `path` to G, joins consecutive stops of each
+    route and links every stop to the stations of G within `link_radius_km`.
+    Returns a summary dict with the number of stops, routes, edges and links.
+    """
+    # Imported here because stationGraphs.build_graph calls this function
+    from metroversoApp.assets.stationGraphs import add_station, add_edge_time, add_transfer
+
+    # Only the stations already in G are link targets, not the feeder stops
+    stations = GridIndex({
+        node: data['pos'] for node, data in G.nodes(data=True) if 'pos' in data
+    }, cell_km=max(link_radius_km, 0.1))
+
+    summary = {'stops': 0, 'routes': 0, 'edges': 0, 'links': 0}
+    previous_stop = previous_route = None
+    coords = {}
+    for stop_id, route, stop_coords in iter_stops(path):
+        add_station(G, stop_id, stop_coords, line_key=FEEDER_LINE_KEY)
+        coords[stop_id] = stop_coords
+        summary['stops'] += 1
+
+        if route == previous_route:
+            add_edge_time(G, coords, previous_stop, stop_id, line_key=FEEDER_LINE_KEY)
+            summary['edges'] += 1
+            # Only the previous stop is needed to build the next edge
+            del coords[previous_stop]
+        else:
+            coords = {stop_id: stop_coords}
+            summary['routes'] += 1
+
+        for station, distance_km in stations.within(stop_coords[0], stop_coords[1], link_radius_km):
+            add_transfer(G, stop_id, station, walkTime=round(walk_minutes(distance_km), 2))
+            summary['links'] += 1
+
+        previous_stop, previous_route = stop_id, route
+
+    return summary
@@ -1,39 +1,176 @@
 import networkx as nx
-from math import sqrt
+from math import sqrt, inf
 from copy import deepcopy
+from datetime import timedelta
+from dataclasses import dataclass, field
 
 from metroversoApp.assets.stationGraphs import G
+from metroversoApp.assets import routeTable
+from metroversoApp.assets import routeCache
+from metroversoApp.assets import priceTable
+from metroversoApp.assets import stationRegistry
+from metroversoApp.assets import routingEngine
+from metroversoApp.assets import closures
+from metroversoApp.assets import lineGraph
+from metroversoApp.assets import fareRouting
+from metroversoApp.assets import paretoRouting
+from metroversoApp.assets import alternatives as alternativeRoutes
+from metroversoApp.assets import serviceCalendar
+from metroversoApp.assets import headways
+from metroversoApp.assets import speedProfiles
+
+# Line letter of a station id -> transport used by the fare rules:
+# M = metro, C = cable, T = tranvía, B = bus (Metroplus)
+FARE_TRANSPORT_MAP = {
+    'A': 'M',
+    'B': 'M',
+    'L': 'C',
+    'K': 'C',
+    'J': 'C',
+    'H': 'C',
+    'T': 'T',
+    'M': 'B',
+    'O': 'B',
+    'X': 'B',
+    'P': 'C',
+    'Z': 'C'
+}
+
+# Fare packages: (requirements, package id). Every requirement is the set of
+# transports that can fill it; a package applies once all its requirements
+# are filled, in any order, by consecutive transports of the route.
+FARE_PATTERNS = (
+    (('MATBC',), 1),           # MATBC
+    (('TB', 'MC'), 1),        # TB + MC
+    (('A', 'TB'), 1),         # A + TB
+    (('T', 'CM'), 1),         # T + CM
+    (('A', 'MC'), 2),         # A + MC
+    (('A', 'TB', 'MC'), 2),   # A + TB + MC
+    (('A', 'TB', 'A'), 3),    # A + TB + A
+    (('A', 'MC', 'A'), 4),    # A + MC + A
+    (('A', 'TB', 'MC', 'A'), 4),  # A + TB + MC + A
+    (('V',), 0)            # Parque Arví
+)
+
+# Transport alphabet of the automaton ('V' is Parque Arví, station L01)
+FARE_TRANSPORTS = ('M', 'C', 'T', 'B', 'V')
+ARVI_STATION = 'L01'
+
+# Criteria find_route() answers: the engine weights plus the line graph, fare and headway searches
+SEARCH_CRITERIA = (routingEngine.ENGINE_CRITERIA + lineGraph.LINE_CRITERIA + fareRouting.FARE_CRITERIA
+                   + headways.HEADWAY_CRITERIA)
+
+
+def _fare_step(working, transport):
+    """
+    One step of the pattern matching on `working`, a tuple of
+    (pattern index, remaining requirements) in pattern order. Returns
+    (package or None, next working): when no pattern can take `transport`
+    the first completed pattern is charged and matching starts over.
+    """
+    while True:
+        next_working = []
+        for index, requirements in working:
+            if not requirements:
+                continue  # completed before this transport
+            for k, requirement in enumerate(requirements):
+                if transport in requirement:
+                    next_working.append((index, requirements[:k] + requirements[k + 1:]))
+                    break
+        if next_working:
+            return None, tuple(next_working)
+        package = _fare_package(working)
+        working = _FARE_START
+        if package is not None:
+            return package, _fare_step(working, transport)[1]
+
+
+def _fare_package(working):
+    """Package of the first completed pattern in `working`, or None."""
+    for index, requirements in working:
+        if not requirements:
+            return FARE_PATTERNS[index][1]
+    return None
+
+
+_FARE_START = tuple((index, requirements) for index, (requirements, _) in enumerate(FARE_PATTERNS))
+
+
+def _compile_fare_automaton():
+    """
+    Explores every matching state reachable from the start and returns the
+    automaton as flat tables: next_state[state][t], emit[state][t] (package
+    charged on that transition or -1) and final[state] (package charged at
+    the end of the route or -1), with t the position in FARE_TRANSPORTS.
+    """
+    states = {_FARE_START: 0}
+    queue = [_FARE_START]
+    next_state, emit, final = [], [], []
+    while queue:
+        working = queue.pop(0)
+        row_next, row_emit = [], []
+        for transport in FARE_TRANSPORTS:
+            package, target = _fare_step(working, transport)
+            if target not in states:
+                states[target] = len(states)
+                queue.append(target)
+            row_next.append(states[target])
+            row_emit.append(-1 if package is None else package)
+        next_state.append(tuple(row_next))
+        emit.append(tuple(row_emit))
+        package = _fare_package(working)
+        final.append(-1 if package is None else package)
+    return tuple(next_state), tuple(emit), tuple(final)
+
+
+_FARE_NEXT, _FARE_EMIT, _FARE_FINAL = _compile_fare_automaton()
+
+# First letter of a station id -> column of the automaton
+_FARE_COLUMN = {
+    letter: FARE_TRANSPORTS.index(transport)
+    for line, transport in FARE_TRANSPORT_MAP.items()
+    for letter in (line, line.lower())
+}
+_ARVI_COLUMN = FARE_TRANSPORTS.index('V')
+
 
 # Function to determine the pricing package based on the route taken
 def get_route_pricing_package(route):
-    
-    transport_map = {
-        'A': 'M',
-        'B': 'M',
-        'L': 'C',
-        'K': 'C',
-        'J': 'C',
-        'H': 'C',
-        'T': 'T',
-        'M': 'B',
-        'O': 'B',
-        'X': 'B',
-        'P': 'C',
-        'Z': 'C'
-    }
+    """
+    Returns the fare packages charged for `route`, in order. The fare rules
+    are compiled once into an automaton (see _compile_fare_automaton), so a
+    route is priced in a single pass over its stations.
+    """
+    next_state, emit, column_of = _FARE_NEXT, _FARE_EMIT, _FARE_COLUMN
+    price_packages = []
+    state = 0
+    previous = -1
+    for stop in route:
+        column = _ARVI_COLUMN if stop == ARVI_STATION else column_of.get(stop[:1], -1)
+        # Unknown lines are ignored and consecutive stops on the same transport count once
+        if column < 0 or column == previous:
+            continue
+        previous = column
+        package = emit[state][column]
+        if package >= 0:
+            price_packages.append(package)
+        state = next_state[state][column]
+
+    package = _FARE_FINAL[state]
+    if package >= 0:
+        price_packages.append(package)
+    return price_packages
+
 
-    patterns = [
-        (['MATBC'], 1),           # MATBC
-        (['TB', 'MC'], 1),        # TB + MC
-        (['A', 'TB'], 1),         # A + TB
-        (['T', 'CM'], 1),         # T + CM
-        (['A', 'MC'], 2),         # A + MC
-        (['A', 'TB', 'MC'], 2),   # A + TB + MC
-        (['A', 'TB', 'A'], 3),    # A + TB + A
-        (['A', 'MC', 'A'], 4),    # A + MC + A
-        (['A', 'TB', 'MC', 'A'], 4),  # A + TB + MC + A
-        (['V'], 0)            # Parque Arví
-    ]
+def _reference_route_pricing_package(route):
+    """
+    Original pattern-matching implementation of get_route_pricing_package.
+    Kept as the reference the compiled fare automaton is tested and
+    benchmarked against; not used on the request path.
+    """
+    
+    transport_map = FARE_TRANSPORT_MAP
+    patterns = [(list(requirements), group_id) for requirements, group_id in FARE_PATTERNS]
     
     price_packages = []
     
@@ -184,6 +321,112 @@ def analyze_route_transfers(route):
         'line_segments': line_segments
     }
     
+# Per-graph transfer edges for annotate_route, built on first use
+_annotation_graph = None
+_transfer_edges = frozenset()
+
+
+def _annotation_tables():
+    """
+    Returns (registry, transfer_edges) for the current graph: the station
+    registry (coordinates) and the set of (u, v) pairs joined by a walking
+    transfer.
+    """
+    global _annotation_graph, _transfer_edges
+    from metroversoApp.assets import stationGraphs
+
+    graph = stationGraphs.G
+    if _annotation_graph is not graph:
+        transfer_edges = set()
+        for u, v, transfer in graph.edges(data='transfer'):
+            if transfer == 1:
+                transfer_edges.add((u, v))
+                transfer_edges.add((v, u))
+        _transfer_edges = frozenset(transfer_edges)
+        _annotation_graph = graph
+    return stationRegistry.get_registry(), _transfer_edges
+
+
+def _station_coordinates(station, registry, kind="Station"):
+    coords = registry.coordinates(station)
+    if coords is None:
+        print(f"Warning: {kind} {station} not found in coordinates")
+        coords = [0, 0]  # Fallback coordinates
+    return coords
+
+
+def annotate_route(route):
+    """
+    Everything calculeRute shows about a path, in one pass over it:
+    (transfer_info, rute_coords, transfer_coords, price_packages).
+    transfer_info is the same as analyze_route_transfers(route) and
+    price_packages the same as get_route_pricing_package(route).
+    """
+    registry, transfer_edges = _annotation_tables()
+    station_index, station_coords = registry.index, registry.coords
+    next_state, emit, column_of = _FARE_NEXT, _FARE_EMIT, _FARE_COLUMN
+
+    rute_coords = []
+    transfers = []
+    transfer_coords = []
+    line_segments = []
+    price_packages = []
+    segment = []
+    current_line = None
+    state = 0
+    previous_column = -1
+    previous_stop = None
+    for stop in route:
+        i = station_index.get(stop)
+        coords = station_coords[i] if i is not None else None
+        rute_coords.append(coords if coords is not None else _station_coordinates(stop, registry))
+
+        # Line segments: a walking transfer ends the segment at this stop
+        if previous_stop is None:
+            segment = [stop]
+            current_line = get_line_from_station(stop)
+        elif (previous_stop, stop) in transfer_edges:
+            transfers.append(previous_stop)
+            transfer_coords.append(_station_coordinates(previous_stop, registry, "Transfer station"))
+            segment.append(stop)
+            line_segments.append({'line': current_line, 'stations': segment})
+            segment = [stop]
+            current_line = get_line_from_station(stop)
+        else:
+            segment.append(stop)
+        previous_stop = stop
+
+        # Fare automaton, see get_route_pricing_package
+        column = _ARVI_COLUMN if stop == ARVI_STATION else column_of.get(stop[:1], -1)
+        if column >= 0 and column != previous_column:
+            previous_column = column
+            package = emit[state][column]
+            if package >= 0:
+                price_packages.append(package)
+            state = next_state[state][column]
+
+    package = _FARE_FINAL[state]
+    if package >= 0:
+        price_packages.append(package)
+
+    if len(route) < 2:
+        transfer_info = {
+            'requires_transfer': False,
+            'transfer_count': 0,
+            'transfer_stations': [],
+            'line_segments': []
+        }
+    else:
+        line_segments.append({'line': current_line, 'stations': segment})
+        transfer_info = {
+            'requires_transfer': len(transfers) > 0,
+            'transfer_count': len(transfers),
+            'transfer_stations': transfers,
+            'line_segments': line_segments
+        }
+    return transfer_info, rute_coords, transfer_coords, price_packages
+
+
 def get_package_price(package, profile):
     try:
         pkg_int = int(package)
@@ -193,20 +436,11 @@ def get_package_price(package, profile):
     if profile is None:
         return None
 
-    profile_norm = str(profile).strip()
-
-    from metroversoApp.models import Package
-
-    qs = Package.objects.filter(id_package=pkg_int, profile__iexact=profile_norm).values_list('price', flat=True)
-    if qs:
-        return qs[0]
-
-    return None
+    # In-memory copy of the Package table, no query per package
+    return priceTable.get_price(pkg_int, profile)
 
 
 def get_price_from_packages(packages, profile):
-    
-    from metroversoApp.models import Package
 
     total = 0
 
@@ -233,7 +467,323 @@ def get_price_from_packages(packages, profile):
 
     return total
 
-def calculeRute(star, destination, criteria, profile='Frecuente'):
+@dataclass
+class RouteResult:
+    """
+    Everything derived from one route search: the path, the travel time of
+    each hop, the total duration in minutes and whether the trip fits in the
+    service window at the time it was searched.
+    """
+    source: str
+    target: str
+    criterion: str
+    path: list
+    edge_times: list = field(default_factory=list)
+    duration: float = 0.0
+    uses_arvi_station: bool = False
+    can_make_trip: bool = False
+    algorithm: str = 'table'
+    expanded_nodes: int = 0
+    # Vehicles changed and rides per line, for routes found on the line graph
+    line_transfers: int = None
+    line_legs: list = None
+    # Expected minutes waiting for vehicles (included in duration) and their time band, for headway searches
+    expected_wait: float = None
+    time_band: str = None
+    # Time layer of the departure hour (speedProfiles) the route was searched and timed on
+    time_layer: str = None
+
+    def check_service_window(self, start_time=None):
+        """
+        Re-evaluates the service-window verdict for `start_time`
+        (defaults to the current backend time) without searching again.
+        """
+        from metroversoApp.assets.stationGraphs import can_make_trip, _now
+
+        if start_time is None:
+            start_time = _now()
+        return can_make_trip(start_time, int(self.duration), self.path)
+
+
+def find_route(star, destination, criteria, algorithm=None, profile='Frecuente', depart_at=None):
+    """
+    Runs the single route search for a request and returns a RouteResult.
+    `algorithm` can force a live search: 'dijkstra', or 'astar' /
+    'bidirectional' for the time-based criteria. By default the precomputed
+    route tables are used, or a search when the network is too large for them.
+    Searches run on the engine with the active closures applied; a table route
+    through a closure is searched again. The criteria in
+    lineGraph.LINE_CRITERIA are answered on the line graph, those in
+    fareRouting.FARE_CRITERIA by a search over the fares of `profile`, and
+    those in headways.HEADWAY_CRITERIA with the expected waits of the time
+    band of `depart_at` (default: now). 'time' is routed and timed on the
+    layer of the hour of `depart_at` (default: now) when some line is slowed
+    then (speedProfiles), with the route table of that layer, and on the
+    static weights otherwise.
+    Raises ValueError for a criterion not in SEARCH_CRITERIA and
+    nx.NetworkXNoPath if the stations are not connected.
+    """
+    if criteria not in SEARCH_CRITERIA:
+        raise ValueError(f"Unknown criterion: {criteria}")
+    if criteria in headways.HEADWAY_CRITERIA:
+        from metroversoApp.assets.stationGraphs import _now
+
+        band = headways.time_band(depart_at or _now())
+        route = headways.get_headway_graph().search(star, destination, band)
+        result = _route_result(star, destination, criteria, route.path, 'headway_search', route.expanded_nodes)
+        result.expected_wait, result.time_band = route.wait, band
+        result.duration += route.wait
+        result.can_make_trip = result.check_service_window()
+        return result
+    if criteria in fareRouting.FARE_CRITERIA:
+        route = fareRouting.get_fare_graph().search(star, destination, profile)
+        return _route_result(star, destination, criteria, route.path, 'fare_search', route.expanded_nodes)
+    if criteria in lineGraph.LINE_CRITERIA:
+        route = lineGraph.get_line_graph().search(star, destination, lineGraph.LINE_OBJECTIVES[criteria])
+        result = _route_result(star, destination, criteria, route.path, 'line_graph', route.expanded_nodes)
+        result.line_transfers, result.line_legs = route.transfers, route.legs
+        return result
+
+    engine = closures.routing_engine()
+    layer = _time_layer(criteria, depart_at)
+    criterion = layer or criteria
+
+    # A* needs a criterion measured in minutes; otherwise use the default search
+    if algorithm in ('astar', 'bidirectional') and criterion not in engine.astar_criteria:
+        algorithm = None
+
+    expanded = 0
+    path = None
+    if algorithm in routingEngine.SEARCH_ALGORITHMS:
+        path, expanded = engine.search(star, destination, criterion, algorithm)
+    elif routeTable.has_table(criterion):
+        # Precomputed tables cover the usual criteria; anything else is searched on demand
+        algorithm = 'table'
+        path = routeTable.get_route(star, destination, criterion)
+        if not closures.route_is_open(path):
+            path = None
+    if path is None:
+        # The table route is closed, or there are no tables. Dijkstra breaks ties like the
+        # tables, so routes stay the same when a closure is lifted; bidirectional A* (which
+        # can pick another route of equal cost) only on networks too large for the tables
+        large = not routeTable.tables_supported(engine)
+        algorithm = 'bidirectional' if large and criterion in engine.astar_criteria else 'dijkstra'
+        path, expanded = engine.search(star, destination, criterion, algorithm)
+
+    result = _route_result(star, destination, criteria, path, algorithm, expanded)
+    if layer is not None:
+        result.edge_times = engine.path_weights(path, layer)
+        result.duration = sum(result.edge_times)
+        result.time_layer = layer
+        result.can_make_trip = result.check_service_window()
+    return result
+
+
+def _time_layer(criteria, depart_at=None):
+    """Time layer to search `criteria` on for a departure at `depart_at` (default: now), or None for the static weights."""
+    from metroversoApp.assets.stationGraphs import _now
+
+    if criteria != 'time':
+        return None
+    return speedProfiles.time_layer(depart_at or _now())
+
+
+def _route_result(star, destination, criteria, path, algorithm, expanded):
+    """RouteResult for a path found by `algorithm`, with its times and service-window verdict."""
+    edge_times = [G[u][v].get("time", 0.0) for u, v in zip(path, path[1:])]
+    result = RouteResult(
+        source=star,
+        target=destination,
+        criterion=criteria,
+        path=path,
+        edge_times=edge_times,
+        duration=sum(edge_times),
+        uses_arvi_station='L01' in path,
+        algorithm=algorithm,
+        expanded_nodes=expanded,
+    )
+    result.can_make_trip = result.check_service_window()
+    return result
+
+
+def _departure_key(criteria, depart_at):
+    """Part of the route_response() cache key that depends on the departure time."""
+    key = ()
+    if criteria in headways.HEADWAY_CRITERIA:
+        key += (headways.time_band(depart_at),)
+    layer = _time_layer(criteria, depart_at)
+    if layer is not None:
+        key += (layer,)
+    return key
+
+
+def route_response(star, destination, criteria, profile='Frecuente', algorithm=None, depart_at=None, arrive_by=None):
+    """
+    Returns (response, cache_hit) where response is the part of a route
+    response that does not depend on the clock: {'route_result', 'transfer_info',
+    'rute_coords', 'transfer_coords', 'price_packages', 'price'}. Responses are
+    cached in routeCache and shared between requests, so they must not be modified.
+    `depart_at` (default: now) only matters for headways.HEADWAY_CRITERIA,
+    cached per time band, and for 'time', cached per time layer.
+    Given `arrive_by` instead, the band and layer are those of the departure:
+    the route found for the arrival time is searched again for the time it
+    leaves at (arrive_by - its duration) when that falls in another band or layer.
+    Raises nx.NetworkXNoPath if the stations are not connected.
+    """
+    if depart_at is None and arrive_by is not None:
+        response, cache_hit = route_response(star, destination, criteria, profile, algorithm, arrive_by)
+        departure = arrive_by - timedelta(minutes=response['route_result'].duration)
+        if _departure_key(criteria, departure) == _departure_key(criteria, arrive_by):
+            return response, cache_hit
+        return route_response(star, destination, criteria, profile, algorithm, departure)
+
+    key = (star, destination, criteria, profile, algorithm)
+    if criteria in headways.HEADWAY_CRITERIA or criteria == 'time':
+        from metroversoApp.assets.stationGraphs import _now
+
+        depart_at = depart_at or _now()
+    key += _departure_key(criteria, depart_at)
+    response = routeCache.get(key)
+    if response is not None:
+        return response, True
+
+    response = _route_response(find_route(star, destination, criteria, algorithm, profile, depart_at), profile)
+    routeCache.put(key, response)
+    return response, False
+
+
+def _route_response(route_result, profile):
+    """Builds the route_response() dict for a RouteResult."""
+    # Transfers, coordinates and fare packages in a single pass over the path
+    transfer_info, rute_coords, transfer_coords, price_packages = annotate_route(route_result.path)
+    price = get_price_from_packages(price_packages, profile)
+
+    return {
+        'route_result': route_result,
+        'transfer_info': transfer_info,
+        'rute_coords': rute_coords,
+        'transfer_coords': transfer_coords,
+        'price_packages': price_packages,
+        'price': price,
+    }
+
+
+def batch_route_responses(queries, depart_at=None, arrive_by=None):
+    """
+    Answers many route queries at once. `queries` is a list of
+    (star, destination, criteria, profile) tuples whose stations are in G.
+    Queries are grouped by origin and criterion: with a route table each one
+    is a lookup (and one search for lineGraph.LINE_CRITERIA,
+    fareRouting.FARE_CRITERIA and headways.HEADWAY_CRITERIA), otherwise a single Dijkstra tree from the origin answers every
+    destination of the group. Yields (index, response, cache_hit) group by
+    group, where index is the position in `queries` and response is the
+    route_response() dict, or None if the stations are not connected.
+    `depart_at` (default: now) picks the time band of
+    headways.HEADWAY_CRITERIA and the time layer of 'time'; with `arrive_by`
+    they are picked as in route_response().
+    """
+    groups = {}
+    for index, (star, destination, criteria, profile) in enumerate(queries):
+        groups.setdefault((star, criteria), []).append((index, destination, profile))
+
+    for (star, criteria), members in groups.items():
+        if (routeTable.has_table(criteria) or criteria in lineGraph.LINE_CRITERIA
+                or criteria in fareRouting.FARE_CRITERIA or criteria in headways.HEADWAY_CRITERIA
+                or _time_layer(criteria, depart_at or arrive_by) is not None
+                or (criteria == 'time' and arrive_by is not None)):
+            for index, destination, profile in members:
+                try:
+                    response, cache_hit = route_response(star, destination, criteria, profile,
+                                                         depart_at=depart_at, arrive_by=arrive_by)
+                except nx.NetworkXNoPath:
+                    response, cache_hit = None, False
+                yield index, response, cache_hit
+            continue
+
+        # Tree paths are the ones a single-target Dijkstra finds (same tie-breaking)
+        engine = closures.routing_engine()
+        tree = None
+        for index, destination, profile in members:
+            key = (star, destination, criteria, profile, 'dijkstra')
+            response = routeCache.get(key)
+            if response is not None:
+                yield index, response, True
+                continue
+            if tree is None:
+                source = engine.index[star]
+                tree = engine.dijkstra(source, criteria)
+            dist, pred, _, order = tree
+            target = engine.index[destination]
+            if dist[target] == inf:
+                yield index, None, False
+                continue
+            path = [engine.node_ids[i] for i in engine.path_from_pred(pred, source, target)]
+            response = _route_response(_route_result(star, destination, criteria, path, 'dijkstra', len(order)), profile)
+            routeCache.put(key, response)
+            yield index, response, False
+
+
+def pareto_route_responses(star, destination, profile='Frecuente'):
+    """
+    Every route between two stations that no other route beats on travel
+    time, transfers and fare at once, for `profile` (see paretoRouting).
+    Returns (routes, truncated, labels): routes is a list of
+    (ParetoRoute, response) ordered by time, response being shaped like the
+    route_response() dict, and truncated tells if the search hit its label
+    limits. Raises nx.NetworkXNoPath if the stations are not connected.
+    """
+    routes, truncated, labels = paretoRouting.get_pareto_graph().search(star, destination, profile)
+    return [
+        (route, _route_response(_route_result(star, destination, 'pareto', route.path, 'pareto', labels), profile))
+        for route in routes
+    ], truncated, labels
+
+
+def plan_route_times(route_results, depart_at=None, arrive_by=None):
+    """
+    (departures, arrivals, can_make_trip) lists for RouteResults that leave
+    at `depart_at` or arrive by `arrive_by` (naive local datetimes, default:
+    leave now), checked against the service calendar in one pass.
+    """
+    departures, arrivals, can_make = serviceCalendar.plan_trips(
+        [route_result.duration for route_result in route_results],
+        [route_result.path for route_result in route_results], depart_at, arrive_by)
+    return departures, arrivals, can_make.tolist()
+
+
+def route_alternatives(star, destination, criteria, profile='Frecuente', k=3, offset=0):
+    """
+    Alternatives `offset` to `k` (1-based ranks offset + 1 .. k) of the k
+    shortest loopless routes between two stations (see alternatives), ranked
+    by `criteria` when the routing engine has weights for it and by time
+    otherwise. Returns (routes, added): routes is a list of (rank, cost,
+    response), response being shaped like the route_response() dict, and
+    added is the number of routes that had to be searched for. Asking again
+    with a larger k only searches for the new ones.
+    Raises nx.NetworkXNoPath if the stations are not connected.
+    """
+    criterion = criteria if criteria in routingEngine.ENGINE_CRITERIA else 'time'
+    routes, added = alternativeRoutes.k_shortest_routes(star, destination, criterion, k)
+    return [
+        (rank, cost, _route_response(_route_result(star, destination, criterion, path, 'yen', 0), profile))
+        for rank, (cost, path) in enumerate(routes, start=1) if rank > offset
+    ], added
+
+
+def calculeRute(star, destination, criteria, profile='Frecuente', algorithm=None, search_stats=None, alternatives=None,
+                schedule=None):
+    """
+    Computes the route and everything the map needs about it.
+    `algorithm` is passed to find_route. If `search_stats` is a dict it is
+    filled with the algorithm used, the number of nodes it expanded and
+    whether the route came from the cache. If `alternatives` is a dict with
+    'k' (and optionally 'offset'), route_alternatives() fills its 'routes'
+    with alternatives offset + 1 to k, each with its rank, route, time,
+    transfers and price. If `schedule` is a dict with 'depart_at' or
+    'arrive_by' (naive local datetimes), the trip is checked against the
+    service calendar for that time instead of now, and 'departure' and
+    'arrival' are added to it.
+    """
     try: 
         print(f"Calculating route from {star} to {destination}")
         print(criteria)
@@ -247,37 +797,50 @@ def calculeRute(star, destination, criteria, profile='Frecuente'):
             print(f"Error: Destination station {destination} not found in graph")
             return [], 0, {'requires_transfer': False, 'transfer_count': 0, 'transfer_stations': [], 'line_segments': []}, True, None, False, [], [], [], 0
 
-        rute = nx.dijkstra_path(G, source=star, target=destination, weight=criteria)
-        distance = sum(G[u][v].get("time", 0.0) for u, v in zip(rute, rute[1:]))
-        
-        # Get route coordinates from the coordinates dictionary
-        from metroversoApp.assets.stationGraphs import lineaA, linea1, linea2, lineaL, lineaB, lineaT, lineaZ, lineaJ, lineaH, lineaO, lineaP, lineaK
-        
-        # Combine all coordinate dictionaries
-        all_coords = {**lineaA, **linea1, **linea2, **lineaL, **lineaB, **lineaT, **lineaZ, **lineaJ, **lineaH, **lineaO, **lineaP, **lineaK}
-        
-        rute_coords = []
-        for n in rute:
-            if n in all_coords:
-                rute_coords.append(all_coords[n])
-            else:
-                print(f"Warning: Station {n} not found in coordinates")
-                rute_coords.append([0, 0])  # Fallback coordinates
-
-        # Analyze transfers
-        transfer_info = analyze_route_transfers(rute)
-
-        # Get transfer coordinates
-        transfer_coords = []
-        for station in transfer_info['transfer_stations']:
-            if station in all_coords:
-                transfer_coords.append(all_coords[station])
-            else:
-                print(f"Warning: Transfer station {station} not found in coordinates")
-                transfer_coords.append([0, 0])  # Fallback
-        # Determine price packages and total price
-        price_packages = get_route_pricing_package(rute)
-        price = get_price_from_packages(price_packages, profile)
+        depart_at = schedule.get('depart_at') if schedule is not None else None
+        arrive_by = schedule.get('arrive_by') if schedule is not None else None
+        response, cache_hit = route_response(star, destination, criteria, profile, algorithm, depart_at, arrive_by)
+        route_result = response['route_result']
+        if search_stats is not None:
+            search_stats.update({
+                'algorithm': route_result.algorithm,
+                'expanded_nodes': route_result.expanded_nodes,
+                'cache': 'hit' if cache_hit else 'miss',
+            })
+            if route_result.line_transfers is not None:
+                search_stats['line_transfers'] = route_result.line_transfers
+            if route_result.expected_wait is not None:
+                search_stats.update(expected_wait=route_result.expected_wait, time_band=route_result.time_band)
+            if route_result.time_layer is not None:
+                search_stats['time_layer'] = route_result.time_layer
+        if alternatives is not None:
+            routes, added = route_alternatives(star, destination, criteria, profile,
+                                               alternatives.get('k', 3), alternatives.get('offset', 0))
+            departures, arrivals, can_make = plan_route_times(
+                [alternative['route_result'] for _, _, alternative in routes], depart_at, arrive_by)
+            alternatives['searched'] = added
+            alternatives['routes'] = [{
+                'rank': rank,
+                'cost': cost,
+                'rute': alternative['route_result'].path,
+                'distance': alternative['route_result'].duration,
+                'transfer_count': alternative['transfer_info']['transfer_count'],
+                'transfer_info': alternative['transfer_info'],
+                'price': alternative['price'],
+                'price_packages': alternative['price_packages'],
+                'rute_coords': alternative['rute_coords'],
+                'transfer_coords': alternative['transfer_coords'],
+                'can_make_trip': can_make[i],
+                'departure': departures[i].isoformat(timespec='minutes'),
+                'arrival': arrivals[i].isoformat(timespec='minutes'),
+            } for i, (rank, cost, alternative) in enumerate(routes)]
+        rute = route_result.path
+        distance = route_result.duration
+        transfer_info = response['transfer_info']
+        rute_coords = response['rute_coords']
+        transfer_coords = response['transfer_coords']
+        price_packages = response['price_packages']
+        price = response['price']
 
         print("Rute:", rute)
         print("Distance:", round(distance, 2), "minutes")
@@ -288,11 +851,18 @@ def calculeRute(star, destination, criteria, profile='Frecuente'):
         print("Transfer_coords:", transfer_coords)
         
         # Check if the trip can be made according to the schedule
-        from metroversoApp.assets.stationGraphs import can_make_trip_now_graph, get_current_service_hours, get_arvi_service_hours
+        from metroversoApp.assets.stationGraphs import get_current_service_hours, get_arvi_service_hours
         
-        # Check if route includes Arvi station (L01)
-        uses_arvi_station = 'L01' in rute
-        can_make_trip = can_make_trip_now_graph(G, star, destination)
+        # The verdict depends on the current time: computed on every call,
+        # from the cached route when there is one, without searching again
+        uses_arvi_station = route_result.uses_arvi_station
+        can_make_trip = route_result.can_make_trip if not cache_hit else route_result.check_service_window()
+        if depart_at is not None or arrive_by is not None:
+            (departure,), (arrival,), (can_make_trip,) = plan_route_times([route_result], depart_at, arrive_by)
+            schedule.update({
+                'departure': departure.isoformat(timespec='minutes'),
+                'arrival': arrival.isoformat(timespec='minutes'),
+            })
         
         # Get service hours information
         if uses_arvi_station:
@@ -0,0 +1,171 @@
+"""
+Expected waiting time from line headways.
+
+G times a trip as riding time plus stops (add_edge_time) and a flat walk for
+transfers (add_transfer): the wait for the vehicle is not in it. Here every
+line has a headway per time band (HEADWAYS by mode, LINE_HEADWAYS for the
+lines that differ), and a rider arriving at random waits half of it. The
+wait is folded into boarding: a ride arc taken at the origin or right after
+a walking transfer costs its time plus the wait for its line, a ride arc
+that continues a ride costs its time. The search state is (station, riding
+or not), so walking to the destination or between two transfers is not
+charged a wait for a vehicle the rider never takes.
+
+The boarding weights of every time band are computed once per routing
+engine (closed arcs stay closed), so a query only looks up the band of its
+departure time and runs a Dijkstra with that band's list. They are kept
+apart from the engine's 'time': reverse searches, the bidirectional A* and
+the route tables rely on arcs costing the same in both directions.
+
+The headways are approximate published frequencies; cables run continuously.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass
+from heapq import heappush, heappop
+import math
+import threading
+
+import networkx as nx
+
+# Criteria answered by a search with expected waits in functions.find_route
+HEADWAY_CRITERIA = ("expected_time",)
+
+# Bands of each day type (serviceCalendar.day_type) as (first minute of the day, band)
+TIME_BANDS = {
+    'weekday': ((0, 'early'), (6 * 60, 'am_peak'), (9 * 60, 'midday'), (16 * 60 + 30, 'pm_peak'), (19 * 60 + 30, 'evening')),
+    'sunday': ((0, 'sunday'),),
+}
+BANDS = ('early', 'am_peak', 'midday', 'pm_peak', 'evening', 'sunday')
+
+# Minutes between vehicles per mode and band, in BANDS order
+HEADWAYS = {
+    'metro': (6, 3, 5, 3, 6, 7),
+    'cable': (0.2, 0.2, 0.2, 0.2, 0.2, 0.2),
+    'tram': (10, 5, 7, 5, 10, 10),
+    'metroplus': (8, 4, 6, 4, 8, 8),
+    'bus': (15, 8, 12, 8, 15, 15),
+}
+LINE_MODES = {
+    'A': 'metro', 'B': 'metro',
+    'H': 'cable', 'J': 'cable', 'K': 'cable', 'L': 'cable', 'P': 'cable', 'Z': 'cable',
+    'T': 'tram',
+    'M': 'metroplus', 'X': 'metroplus', 'O': 'metroplus',
+    'C': 'bus',
+}
+# Lines whose headways differ from their mode's
+LINE_HEADWAYS = {
+    'B': (8, 5, 7, 5, 8, 9),
+    'O': (10, 6, 8, 6, 10, 10),
+}
+
+
+def headway(line, band):
+    """Minutes between vehicles of `line` in `band` (0 for an unknown line)."""
+    headways = LINE_HEADWAYS.get(line) or HEADWAYS.get(LINE_MODES.get(line))
+    return headways[BANDS.index(band)] if headways else 0.0
+
+
+def time_band(moment):
+    """Band of a naive local datetime."""
+    from metroversoApp.assets import serviceCalendar
+
+    bands = TIME_BANDS[serviceCalendar.day_type(moment.date())]
+    minute = moment.hour * 60 + moment.minute
+    return bands[bisect_right([start for start, _ in bands], minute) - 1][1]
+
+
+@dataclass
+class HeadwayRoute:
+    """A route with expected waits: stations of G, riding and walking time and waiting time in minutes."""
+    path: list
+    time: float = 0.0
+    wait: float = 0.0
+    expanded_nodes: int = 0
+
+
+class HeadwayGraph:
+    """Arc weights of a CompiledGraph when a vehicle is boarded on them, per band."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        times = engine.weight_list('time')
+        arc_line = self._arc_line = engine.arc_line.tolist()
+        self._arc_transfer = engine.arc_transfer.tolist()
+        # Arc weight when the ride starts on it: its time plus half the headway of its line
+        self._boarding = {
+            band: [time if transfer else time + headway(engine.lines[line], band) / 2
+                   for time, line, transfer in zip(times, arc_line, self._arc_transfer)]
+            for band in BANDS
+        }
+
+    def search(self, source, target, band):
+        """
+        Route from station `source` to station `target` with the least riding,
+        walking and waiting time in `band`. Returns a HeadwayRoute.
+        Raises nx.NodeNotFound or nx.NetworkXNoPath.
+        """
+        engine = self.engine
+        s = engine.node_index(source)
+        t = engine.node_index(target)
+        times = engine.weight_list('time')
+        boarding = self._boarding[band]
+        arc_transfer = self._arc_transfer
+        arcs = engine.arcs
+
+        # State key: station * 2 + 1 while riding, + 0 on foot
+        start = 2 * s
+        dist = {start: 0.0}
+        pred = {start: -1}
+        done = set()
+        fringe = [(0.0, start)]
+        while fringe:
+            d, key = heappop(fringe)
+            if key in done:
+                continue
+            done.add(key)
+            v, riding = divmod(key, 2)
+            if v == t:
+                break
+            for k, u in arcs[v]:
+                if arc_transfer[k]:
+                    next_key, candidate = 2 * u, d + times[k]
+                else:
+                    next_key, candidate = 2 * u + 1, d + (times[k] if riding else boarding[k])
+                if candidate < dist.get(next_key, math.inf):
+                    dist[next_key] = candidate
+                    pred[next_key] = key
+                    heappush(fringe, (candidate, next_key))
+
+        if key // 2 != t:
+            raise nx.NetworkXNoPath(f"No path to {target}.")
+        states = [key]
+        while pred[states[-1]] >= 0:
+            states.append(pred[states[-1]])
+        states.reverse()
+        time = wait = 0.0
+        for a, b in zip(states, states[1:]):
+            k = engine.arc_index(a // 2, b // 2)
+            time += times[k]
+            if b % 2 and not a % 2:
+                wait += headway(engine.lines[self._arc_line[k]], band) / 2
+        return HeadwayRoute(path=[engine.node_ids[state // 2] for state in states], time=time, wait=wait,
+                            expanded_nodes=len(done))
+
+
+_headway_graph = None
+_lock = threading.Lock()
+
+
+def get_headway_graph():
+    """Headway weights of the current routing engine (closures applied), built on first use."""
+    global _headway_graph
+    from metroversoApp.assets import closures
+
+    engine = closures.routing_engine()
+    headway_graph = _headway_graph
+    if headway_graph is None or headway_graph.engine is not engine:
+        with _lock:
+            if _headway_graph is None or _headway_graph.engine is not engine:
+                _headway_graph = HeadwayGraph(engine)
+            headway_graph = _headway_graph
+    return headway_graph
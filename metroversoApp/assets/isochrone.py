@@ -0,0 +1,107 @@
+"""
+Stations reachable from a station within a travel-time budget.
+
+One Dijkstra on 'time' from the station, stopped as soon as the next node is
+over the budget, gives every reachable station with its travel time; the
+transfer count is accumulated along the search tree. The walks between the
+twin nodes of one station (alternatives.SAME_STATION_MINUTES, e.g. the
+Metroplus M and X platforms) are not transfers.
+
+Budgets are rounded up to BUDGET_BUCKET_MINUTES and the search result is
+cached per (station, bucketed budget), so the rings the map draws for 10,
+15, 20... minutes, or a slider moved a minute at a time, reuse a handful of
+searches. The answer is then trimmed to the exact budget. Like routeCache,
+the cache is a bounded LRU, cleared when the graph version or the active
+closures change.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+BUDGET_BUCKET_MINUTES = 5
+MAX_BUDGET_MINUTES = 240
+CACHE_MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+# (station, bucketed budget) -> tuple of (station, minutes, transfers) by travel time
+_entries = OrderedDict()
+_graph_version = None
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+
+def bucket_budget(minutes):
+    """`minutes` rounded up to a multiple of BUDGET_BUCKET_MINUTES."""
+    return math.ceil(minutes / BUDGET_BUCKET_MINUTES) * BUDGET_BUCKET_MINUTES
+
+
+def _search(station, budget):
+    """Bounded search from `station`; returns (station, minutes, transfers) in settling order."""
+    from metroversoApp.assets import closures
+    from metroversoApp.assets.alternatives import SAME_STATION_MINUTES
+
+    engine = closures.routing_engine()
+    source = engine.node_index(station)
+    dist, pred, pred_arc, order = engine.dijkstra(source, "time", max_cost=budget)
+
+    # Parents are settled before their children, so one pass over the order suffices
+    arc_transfer = ((engine.arc_transfer == 1) & (engine.weights['time'] > SAME_STATION_MINUTES)).tolist()
+    transfers = [0] * len(dist)
+    reachable = []
+    for v in order:
+        if v != source:
+            transfers[v] = transfers[pred[v]] + arc_transfer[pred_arc[v]]
+        reachable.append((engine.node_ids[v], dist[v], transfers[v]))
+    return tuple(reachable)
+
+
+def _check_graph_version():
+    """
+    Clears the cache if the graph, or the closures applied to it, changed
+    since the entries were stored. Call with _lock held.
+    """
+    global _graph_version
+    from metroversoApp.assets import closures
+
+    version = closures.routing_engine().version
+    if version != _graph_version:
+        if _entries:
+            _stats['invalidations'] += 1
+        _entries.clear()
+        _graph_version = version
+
+
+def reachable_stations(station, minutes):
+    """
+    Returns (reachable, cache_hit). reachable is a list of
+    (station, minutes, transfers), ordered by travel time, of every station
+    within `minutes` of `station` (itself included, at 0 minutes).
+    Raises nx.NodeNotFound for an unknown station.
+    """
+    budget = bucket_budget(minutes)
+    key = (station, budget)
+    with _lock:
+        _check_graph_version()
+        found = _entries.get(key)
+        if found is not None:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+    cache_hit = found is not None
+
+    if not cache_hit:
+        found = _search(station, budget)
+        with _lock:
+            _entries[key] = found
+            _entries.move_to_end(key)
+            while len(_entries) > CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+                _stats['evictions'] += 1
+
+    return [entry for entry in found if entry[1] <= minutes], cache_hit
+
+
+def get_cache_info():
+    """Returns the counters, the number of entries and the size limit."""
+    with _lock:
+        return dict(_stats, entries=len(_entries), max_entries=CACHE_MAX_ENTRIES)
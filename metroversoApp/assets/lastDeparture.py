@@ -0,0 +1,157 @@
+"""
+Latest departure from every station that still reaches a destination in time.
+
+A trip can be made if it ends before every service it uses closes
+(serviceCalendar), so a route through the Arví station must arrive before
+Arví closes, while one that avoids it has until the network closes. For each
+distinct closing time c of the day, the stations whose service runs until c
+or later are the ones a route may use; one Dijkstra on 'time' from the
+destination over those stations (the others have their arcs closed, as with
+closures.routing_engine) gives c minus the shortest time as the latest
+departure through them. The latest departure from a station is the best of
+those, or none when it is earlier than a service allowed at that level opens.
+
+Travel times depend on the hour of departure (speedProfiles): a trip leaving
+in an hour bucket takes the times of that bucket's layer. So at each level
+there is one Dijkstra per distinct layer of the buckets before c, and the
+latest departure within a bucket is c minus the shortest time on its layer,
+kept only if it still falls in the bucket (it is capped at the bucket's last
+minute). The answer depends on the hours of the day and its day type:
+profiles are cached per (destination, day type, hours of every service),
+which is one entry per day type unless a date has exceptions, in a bounded
+LRU cleared when the graph version or the active closures change.
+"""
+import datetime
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+# (destination, day type, day hours) -> minutes after midnight of the latest departure per engine node, -inf if none
+_entries = OrderedDict()
+# allowed services -> (engine with the arcs of the other stations closed, stations allowed)
+_overlays = {}
+_graph_version = None
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'searches': 0}
+
+
+def _check_graph_version(engine):
+    """Clears the profiles if the graph, or the closures applied to it, changed. Call with _lock held."""
+    global _graph_version
+    if engine.version != _graph_version:
+        if _entries:
+            _stats['invalidations'] += 1
+        _entries.clear()
+        _overlays.clear()
+        _graph_version = engine.version
+
+
+def _day_hours(date):
+    """((service, hours), ...) of `date`, hours being None for the services that do not run."""
+    from metroversoApp.assets import serviceCalendar
+
+    return tuple((service, serviceCalendar._hours(service, date)) for service in sorted(serviceCalendar.SERVICE_HOURS))
+
+
+def _restricted_engine(engine, allowed):
+    """
+    (`engine` with every arc of the stations whose service is not in
+    `allowed` closed, bool array of the stations that are). Call with _lock held.
+    """
+    from metroversoApp.assets import serviceCalendar
+
+    restricted = _overlays.get(allowed)
+    if restricted is None:
+        usable = np.array([serviceCalendar.station_service(station) in allowed for station in engine.node_ids])
+        closed = [engine.station_arcs(node) for node in np.flatnonzero(~usable)]
+        overlay = engine.with_closed_arcs(np.unique(np.concatenate(closed))) if closed else engine
+        restricted = _overlays[allowed] = (overlay, usable)
+    return restricted
+
+
+def _profile(engine, destination, day_hours, buckets):
+    """
+    Latest departure, in minutes after midnight, from every node to
+    `destination` (-inf if none), with the time layers of `buckets`
+    (speedProfiles.day_layers).
+    """
+    running = {service: hours for service, hours in day_hours if hours is not None}
+    latest = np.full(engine.number_of_nodes, -math.inf)
+    target = engine.node_index(destination)
+    for close in sorted({hours[1] for hours in running.values()}, reverse=True):
+        allowed = frozenset(service for service, hours in running.items() if hours[1] >= close)
+        opens = max(hours[0][0] * 60 + hours[0][1] for service, hours in running.items() if service in allowed)
+        close_minute = close[0] * 60 + close[1]
+        with _lock:
+            restricted, usable = _restricted_engine(engine, allowed)
+        dists = {}
+        for start, end, criterion in buckets:
+            if start >= close_minute:
+                continue
+            if criterion not in dists:
+                dists[criterion] = np.array(restricted.dijkstra(target, criterion)[0])
+                _stats['searches'] += 1
+            level = np.minimum(close_minute - dists[criterion], end - 1)
+            # The closed arcs keep other routes out, but not the destination itself
+            level[(level < max(start, opens)) | ~usable] = -math.inf
+            np.maximum(latest, level, out=latest)
+    return latest
+
+
+def latest_departures(destination, date):
+    """
+    Returns (profile, cache_hit): numpy array indexed by engine node id of
+    the latest departure from that station, in minutes after midnight of
+    `date`, that still reaches `destination` before the services it uses
+    close (-inf if none). The array is shared and must not be modified.
+    Raises nx.NodeNotFound for an unknown destination.
+    """
+    from metroversoApp.assets import closures, serviceCalendar, speedProfiles
+
+    engine = closures.routing_engine()
+    key = (destination, serviceCalendar.day_type(date), _day_hours(date))
+    with _lock:
+        _check_graph_version(engine)
+        profile = _entries.get(key)
+        if profile is not None:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return profile, True
+        _stats['misses'] += 1
+
+    profile = _profile(engine, destination, key[2], speedProfiles.day_layers(date))
+    with _lock:
+        if engine.version == _graph_version:
+            _entries[key] = profile
+            _entries.move_to_end(key)
+            while len(_entries) > CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+                _stats['evictions'] += 1
+    return profile, False
+
+
+def leave_by(star, destination, date=None):
+    """
+    Latest datetime (to the minute) on `date` (default: today) to leave
+    `star` and still reach `destination` in time, or None if no trip can.
+    Raises nx.NodeNotFound for unknown stations.
+    """
+    from metroversoApp.assets import closures
+    from metroversoApp.assets.stationGraphs import _now
+
+    date = date or _now().date()
+    profile, _ = latest_departures(destination, date)
+    minutes = profile[closures.routing_engine().node_index(star)]
+    if minutes == -math.inf:
+        return None
+    return datetime.datetime.combine(date, datetime.time()) + datetime.timedelta(minutes=math.floor(minutes))
+
+
+def get_cache_info():
+    """Returns the counters, the number of profiles and the size limit."""
+    with _lock:
+        return dict(_stats, entries=len(_entries), max_entries=CACHE_MAX_ENTRIES)
@@ -0,0 +1,202 @@
+"""
+Line-expanded graph for transfer-aware routing.
+
+In G a station is a single node and a change of line is a walking edge with
+transfer=1, so the 'transfer' criterion counts those edges rather than
+vehicles: the 0.01-minute edges joining the shared stations of Metroplus
+lines 1 and 2 count as transfers, and among routes with the same count the
+search keeps whichever it settles first, however long.
+
+Here every station v also gets one node per line that stops there, (v, line):
+- ride arcs (u, line) -> (v, line) for every edge of the line, with its time,
+- boarding arcs v -> (v, line), each counting one boarding,
+- alighting arcs (v, line) -> v, free,
+- walking arcs u -> v for the transfer edges of G, with their time.
+A route boards once per vehicle, so its transfers are boardings - 1, and a
+query minimises (boardings, time) or (time, boardings) lexicographically.
+Times are integer multiples of TIME_RESOLUTION minutes and each objective
+folds its pair into one exact integer weight (the first component scaled past
+anything the second can add up to along a route), so the search is a plain
+Dijkstra and two routes of the same time tie exactly whatever order their hops
+were added in.
+
+The graph is compiled from the routing engine, closures included (see
+closures.routing_engine), and rebuilt whenever that engine changes.
+"""
+from dataclasses import dataclass, field
+from heapq import heappush, heappop
+import math
+import threading
+
+import networkx as nx
+
+# Criteria answered on this graph by functions.find_route
+LINE_CRITERIA = ("min_transfers",)
+# Search objective of each criterion (see LineGraph.search)
+LINE_OBJECTIVES = {"min_transfers": "transfers"}
+# Minutes per unit of the integer arc times
+TIME_RESOLUTION = 1e-6
+
+
+@dataclass
+class LineRoute:
+    """A route on the line graph: stations of G, rides per line, boardings and time."""
+    path: list
+    legs: list = field(default_factory=list)  # [{'line', 'stations'}], one per vehicle
+    boardings: int = 0
+    time: float = 0.0
+    expanded_nodes: int = 0
+
+    @property
+    def transfers(self):
+        return max(self.boardings - 1, 0)
+
+
+class LineGraph:
+    """
+    (station, line) expansion of a CompiledGraph. Nodes 0..n-1 are the
+    stations of the engine (same ids); the route nodes come after them.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        n = engine.number_of_nodes
+        indptr = engine.indptr.tolist()
+        indices = engine.indices.tolist()
+        times = engine.weights['time'].tolist()
+        arc_line = engine.arc_line.tolist()
+        walking = engine.arc_transfer.tolist()
+
+        node_station = list(range(n))
+        node_line = [-1] * n
+        route_nodes = {}
+        adjacency = [[] for _ in range(n)]
+
+        def route_node(station, line):
+            node = route_nodes.get((station, line))
+            if node is None:
+                node = route_nodes[(station, line)] = len(node_station)
+                node_station.append(station)
+                node_line.append(line)
+                adjacency.append([])
+                # Boarding counts one vehicle, alighting is free
+                adjacency[station].append((node, 0, 1))
+                adjacency[node].append((station, 0, 0))
+            return node
+
+        for u in range(n):
+            for k in range(indptr[u], indptr[u + 1]):
+                if times[k] == math.inf:
+                    continue  # closed (see closures)
+                time = round(times[k] / TIME_RESOLUTION)
+                v = indices[k]
+                if walking[k]:
+                    adjacency[u].append((v, time, 0))
+                else:
+                    line = arc_line[k]
+                    adjacency[route_node(u, line)].append((route_node(v, line), time, 0))
+
+        self.node_station = node_station
+        self.node_line = node_line
+        self.lines = engine.lines
+        # (head, time, boardings) per node
+        self.arcs = [tuple(arcs) for arcs in adjacency]
+        # A route visits a route node at most once, so it boards fewer times than there are route nodes
+        self._scales = {
+            'transfers': sum(time for arcs in adjacency for _, time, _ in arcs) + 1,
+            'time': len(route_nodes) + 1,
+        }
+        self._arcs = {
+            'transfers': [tuple((head, boardings * self._scales['transfers'] + time) for head, time, boardings in arcs)
+                          for arcs in adjacency],
+            'time': [tuple((head, time * self._scales['time'] + boardings) for head, time, boardings in arcs)
+                     for arcs in adjacency],
+        }
+
+    @property
+    def number_of_nodes(self):
+        return len(self.node_station)
+
+    def search(self, source, target, objective="transfers"):
+        """
+        Lexicographic Dijkstra between stations of G. objective 'transfers'
+        minimises (boardings, time) and 'time' minimises (time, boardings).
+        Returns a LineRoute. Raises nx.NodeNotFound or nx.NetworkXNoPath.
+        """
+        if objective not in self._arcs:
+            raise ValueError(f"Unknown objective '{objective}'")
+        s = self.engine.node_index(source)
+        t = self.engine.node_index(target)
+
+        arcs = self._arcs[objective]
+        n = len(arcs)
+        dist = [math.inf] * n
+        pred = [-1] * n
+        done = bytearray(n)
+        settled = 0
+        dist[s] = 0
+        fringe = [(0, s)]
+        while fringe:
+            d, v = heappop(fringe)
+            if done[v]:
+                continue
+            done[v] = 1
+            settled += 1
+            if v == t:
+                break
+            for u, w in arcs[v]:
+                candidate = d + w
+                if candidate < dist[u]:
+                    dist[u] = candidate
+                    pred[u] = v
+                    heappush(fringe, (candidate, u))
+
+        if not done[t]:
+            raise nx.NetworkXNoPath(f"No path to {target}.")
+
+        nodes = [t]
+        while nodes[-1] != s:
+            nodes.append(pred[nodes[-1]])
+        nodes.reverse()
+        first, second = divmod(dist[t], self._scales[objective])
+        boardings, time = (second, first) if objective == "time" else (first, second)
+        return self.line_route(nodes, boardings, time * TIME_RESOLUTION, settled)
+
+    def line_route(self, nodes, boardings, time, expanded=0):
+        """Turns a path of expanded nodes into stations of G and one leg per vehicle."""
+        node_ids = self.engine.node_ids
+        path = []
+        legs = []
+        riding = None
+        for node in nodes:
+            station = node_ids[self.node_station[node]]
+            if not path or path[-1] != station:
+                path.append(station)
+            line = self.node_line[node]
+            if line < 0:
+                riding = None
+            elif riding is None:
+                riding = {'line': self.lines[line], 'stations': [station]}
+                legs.append(riding)
+            elif riding['stations'][-1] != station:
+                riding['stations'].append(station)
+        return LineRoute(path=path, legs=legs, boardings=boardings, time=time, expanded_nodes=expanded)
+
+
+_line_graph = None
+_lock = threading.Lock()
+
+
+def get_line_graph():
+    """Line graph of the current routing engine (closures applied), built on first use."""
+    global _line_graph
+    from metroversoApp.assets import closures
+
+    engine = closures.routing_engine()
+    line_graph = _line_graph
+    if line_graph is None or line_graph.engine is not engine:
+        with _lock:
+            if _line_graph is None or _line_graph.engine is not engine:
+                _line_graph = LineGraph(engine)
+            line_graph = _line_graph
+    return line_graph
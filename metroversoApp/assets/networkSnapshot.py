@@ -0,0 +1,265 @@
+"""
+Versioned binary snapshot of the station network.
+
+Building G in stationGraphs runs every add_station/add_edge_time/add_transfer
+call and a haversine per edge. The build step below does that once and writes
+the result to a single binary file:
+
+    python -m metroversoApp.assets.networkSnapshot
+
+At startup load_network() memory-maps the file, rebuilds G from its arrays and
+hands the CSR arrays and the precomputed route tables to the routing code
+without copying them; the pages are shared by every worker. When the file
+is missing or was built from other sources (see SOURCE_FILES) the graph is
+built from stationGraphs as before.
+
+File layout: MAGIC, format version and header length (little-endian uint32),
+a JSON header (station ids, line names, array offsets, source digest) and the
+raw arrays, each aligned to 8 bytes.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_MAGIC = b'MVNETSNP'
+_PREAMBLE = struct.Struct('<8sII')
+
+ASSETS_DIR = Path(__file__).resolve().parent
+SNAPSHOT_PATH = ASSETS_DIR / 'network.snapshot'
+
+# Files the network is built from; editing any of them makes the snapshot stale
+SOURCE_FILES = [
+    ASSETS_DIR / 'stationGraphs.py', ASSETS_DIR / 'routingEngine.py', ASSETS_DIR / 'routeTable.py',
+    ASSETS_DIR / 'feederNetwork.py', ASSETS_DIR / 'spatialIndex.py',
+]
+# Only part of the build when the feeder network is enabled
+FEEDER_SOURCE_FILES = [ASSETS_DIR.parents[1] / 'todas_las_rutas.geojson']
+
+# Numeric edge attributes that are restored as int instead of float
+INTEGER_EDGE_ATTRIBUTES = ('transfer', 'speed_kmh', 'speed_km')
+
+# Snapshot the current G was loaded from (None if G was built from source)
+_loaded = None
+
+
+def source_digest(options=None):
+    """
+    Digest of the format version, the build `options` (e.g. whether the feeder
+    network is included) and every file the graph is built from.
+    """
+    options = options or {}
+    digest = hashlib.sha256(str(SNAPSHOT_FORMAT_VERSION).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    files = SOURCE_FILES + (FEEDER_SOURCE_FILES if options.get('feeder_network') else [])
+    for path in files:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def _edge_insertion_order(graph):
+    """
+    Returns the edges of `graph` in an order that, when added to an empty
+    graph, reproduces the neighbour order of every node. Neighbour order
+    decides how Dijkstra breaks ties, so it has to survive the round trip.
+    """
+    key = {}
+    for u, v in graph.edges():
+        key[(u, v)] = key[(v, u)] = (u, v)
+
+    sorter = TopologicalSorter()
+    for edge in dict.fromkeys(key.values()):
+        sorter.add(edge)
+    for node in graph.nodes():
+        neighbours = [key[(node, nbr)] for nbr in graph.adj[node]]
+        for before, after in zip(neighbours, neighbours[1:]):
+            sorter.add(after, before)
+    return list(sorter.static_order())
+
+
+def write_snapshot(graph, path=SNAPSHOT_PATH, options=None):
+    """
+    Compiles `graph` and writes it atomically to `path`. `options` are the
+    build options passed to load_network. Returns the size in bytes.
+    """
+    from metroversoApp.assets.routingEngine import compile_graph, ENGINE_CRITERIA
+    from metroversoApp.assets.routeTable import build_route_tables, tables_supported, ROUTE_CRITERIA
+
+    compiled = compile_graph(graph, ENGINE_CRITERIA)
+    nodes = compiled.node_ids
+    index = compiled.index
+    edges = _edge_insertion_order(graph)
+
+    lines = list(compiled.lines)
+    line_index = {line: i for i, line in enumerate(lines)}
+    columns = sorted({attr for u, v in edges for attr in graph.edges[u, v] if attr != 'line'})
+
+    arrays = {
+        'node_pos': compiled.positions,
+        'indptr': compiled.indptr,
+        'indices': compiled.indices,
+        'arc_line': compiled.arc_line,
+        'arc_transfer': compiled.arc_transfer,
+        'edge_u': np.array([index[u] for u, v in edges], dtype=np.int32),
+        'edge_v': np.array([index[v] for u, v in edges], dtype=np.int32),
+        'edge_line': np.array([line_index[graph.edges[u, v].get('line', '')] for u, v in edges], dtype=np.int16),
+    }
+    for criterion in ENGINE_CRITERIA:
+        arrays[f'weight_{criterion}'] = compiled.weights[criterion]
+    for attr in columns:
+        arrays[f'edge_{attr}'] = np.array(
+            [float(graph.edges[u, v].get(attr, np.nan)) for u, v in edges], dtype=np.float64
+        )
+    # Above routeTable.MAX_TABLE_NODES stations the n x n tables are not built
+    table_criteria = ROUTE_CRITERIA if tables_supported(compiled) else ()
+    for criterion, table in build_route_tables(compiled, table_criteria).items():
+        for name, matrix in table.items():
+            arrays[f'table_{criterion}_{name}'] = matrix
+
+    header = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'source_digest': source_digest(options),
+        'nodes': nodes,
+        'node_lines': [graph.nodes[node].get('line') for node in nodes],
+        'lines': lines,
+        'criteria': list(ENGINE_CRITERIA),
+        'table_criteria': list(table_criteria),
+        'edge_columns': columns,
+        'arrays': {},
+    }
+
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += (array.nbytes + 7) // 8 * 8
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (-(_PREAMBLE.size + len(header_bytes)) % 8)
+
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for array in arrays.values():
+                data = np.ascontiguousarray(array).tobytes()
+                f.write(data)
+                f.write(b'\0' * (-len(data) % 8))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path.stat().st_size
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Memory-maps a snapshot and returns {'header': dict, 'arrays': {name: ndarray}}.
+    The arrays are read-only views on the mapped file.
+    Raises FileNotFoundError if there is no file and ValueError if it is not a
+    snapshot of the current format.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapped) < _PREAMBLE.size:
+        raise ValueError(f"{path} is not a network snapshot")
+    magic, version, header_len = _PREAMBLE.unpack_from(mapped, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a network snapshot")
+    if version != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {version}, expected {SNAPSHOT_FORMAT_VERSION}")
+
+    header = json.loads(mapped[_PREAMBLE.size:_PREAMBLE.size + header_len].decode('utf-8'))
+    data_start = _PREAMBLE.size + header_len
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        shape = tuple(spec['shape'])
+        count = int(np.prod(shape)) if shape else 1
+        arrays[name] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=data_start + spec['offset']
+        ).reshape(shape)
+
+    return {'header': header, 'arrays': arrays}
+
+
+def graph_from_snapshot(snapshot):
+    """Rebuilds the nx.Graph stored in a snapshot, with the same node and neighbour order."""
+    header = snapshot['header']
+    arrays = snapshot['arrays']
+    nodes = header['nodes']
+    lines = header['lines']
+
+    graph = nx.Graph()
+    for node, line, pos in zip(nodes, header['node_lines'], arrays['node_pos'].tolist()):
+        attrs = {} if line is None else {'line': line}
+        if pos[0] == pos[0]:  # NaN means the node had no position
+            attrs['pos'] = (pos[0], pos[1])
+        graph.add_node(node, **attrs)
+
+    columns = [(attr, arrays[f'edge_{attr}'].tolist()) for attr in header['edge_columns']]
+    edge_line = arrays['edge_line'].tolist()
+    for k, (u, v) in enumerate(zip(arrays['edge_u'].tolist(), arrays['edge_v'].tolist())):
+        data = {}
+        for attr, values in columns:
+            value = values[k]
+            if value != value:  # NaN: attribute not set on this edge
+                continue
+            if attr in INTEGER_EDGE_ATTRIBUTES and value.is_integer():
+                value = int(value)
+            data[attr] = value
+        data['line'] = lines[edge_line[k]]
+        graph.add_edge(nodes[u], nodes[v], **data)
+    return graph
+
+
+def load_network(builder, path=SNAPSHOT_PATH, options=None):
+    """
+    Returns the station graph from the snapshot at `path` if it is current
+    for the build `options`, otherwise calls `builder()` to build it from source.
+    """
+    global _loaded
+
+    try:
+        snapshot = load_snapshot(path)
+    except FileNotFoundError:
+        snapshot = None
+    except (ValueError, OSError) as e:
+        print(f"Warning: could not read network snapshot: {e}")
+        snapshot = None
+
+    if snapshot is not None and snapshot['header']['source_digest'] == source_digest(options):
+        _loaded = snapshot
+        return graph_from_snapshot(snapshot)
+
+    if snapshot is not None:
+        print("Warning: network snapshot is outdated, building the graph from source. "
+              "Run: python -m metroversoApp.assets.networkSnapshot")
+    _loaded = None
+    return builder()
+
+
+def loaded_snapshot():
+    """Returns the snapshot the current graph was loaded from, or None."""
+    return _loaded
+
+
+if __name__ == "__main__":
+    from metroversoApp.assets.stationGraphs import build_graph, INCLUDE_FEEDER_NETWORK
+
+    graph = build_graph()
+    size = write_snapshot(graph, options={'feeder_network': INCLUDE_FEEDER_NETWORK})
+    print(f"Wrote {SNAPSHOT_PATH} ({size / 1024:.1f} KiB, "
+          f"{graph.number_of_nodes()} stations, {graph.number_of_edges()} edges)")
@@ -0,0 +1,228 @@
+"""
+Pareto-optimal routes over travel time, transfers and fare.
+
+One multi-label search (a multi-objective Dijkstra) on the line graph of
+lineGraph, carrying the fare automaton state of fareRouting: a search state
+is (line graph node, fare state, slot) and every state keeps the labels
+(price, boardings, time) that reached it and that no other label of the
+state is at least as good as on all three. Labels are settled in order of
+time plus the shortest remaining time to the target (a consistent lower
+bound), so a new label only has to be compared on price and boardings with
+the labels settled before it at its state and with the routes already
+found: those arrive no later than the label possibly could. Against the
+routes found, the boardings of a label count the fewest it still needs to
+reach the target, and its price the cheapest package once it has used a
+transport (every fare state but the start charges one more package, on the
+way or at the end). Settling the target station charges the fare package
+still open and gives one route of the Pareto set.
+
+The number of labels is bounded so that a query stays fast on any network:
+a state keeps at most MAX_LABELS_PER_STATE labels and the search stops after
+MAX_LABELS settled labels. The answer then says it was truncated and holds
+the non-dominated routes found until then.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from heapq import heappush, heappop
+import math
+import threading
+
+import networkx as nx
+
+from metroversoApp.assets.lineGraph import TIME_RESOLUTION
+
+MAX_LABELS_PER_STATE = 8
+MAX_LABELS = 5000
+
+
+@dataclass
+class ParetoRoute:
+    """One route of the Pareto set: stations of G, rides per line, price, transfers and time in minutes."""
+    path: list
+    legs: list = field(default_factory=list)
+    price: float = 0.0
+    transfers: int = 0
+    time: float = 0.0
+
+
+class ParetoGraph:
+    """
+    Arcs of a LineGraph as (head, time, boardings, slot of the station the arc
+    enters), the slot being -1 for arcs that stay in the same station.
+    """
+
+    def __init__(self, line_graph):
+        from metroversoApp.assets.travelMatrix import _fare_columns
+
+        self.line_graph = line_graph
+        columns = _fare_columns(line_graph.engine).tolist()
+        station = line_graph.node_station
+        self._column_slots = [column + 1 for column in columns]
+        self._arcs = [
+            tuple((head, time, boardings, columns[station[head]] + 1 if station[head] != station[node] else -1)
+                  for head, time, boardings in arcs)
+            for node, arcs in enumerate(line_graph.arcs)
+        ]
+        # (tail, boardings) of the arcs entering every node
+        reverse_arcs = [[] for _ in line_graph.arcs]
+        for node, arcs in enumerate(line_graph.arcs):
+            for head, _, boardings in arcs:
+                reverse_arcs[head].append((node, boardings))
+        self._reverse_arcs = [tuple(arcs) for arcs in reverse_arcs]
+
+    def search(self, source, target, profile="Frecuente"):
+        """
+        Pareto set of routes between stations of G for `profile`, ordered by
+        time, transfers and price. Returns (routes, truncated, labels) where
+        labels is the number of labels settled. Raises nx.NodeNotFound or nx.NetworkXNoPath.
+        """
+        from metroversoApp.assets import fareRouting
+        from metroversoApp.assets.functions import FARE_TRANSPORTS, _FARE_NEXT, _FARE_EMIT, _FARE_FINAL
+
+        engine = self.line_graph.engine
+        s = engine.node_index(source)
+        t = engine.node_index(target)
+        cents = fareRouting._package_cents(profile)
+        transitions = fareRouting.transition_table(cents)
+        arcs = self._arcs
+        slots = len(FARE_TRANSPORTS) + 1
+        node_states = len(_FARE_NEXT) * slots
+
+        charged = {package for row in _FARE_EMIT for package in row} | set(_FARE_FINAL)
+        cheapest_package = min(cents[package] for package in charged if package >= 0)
+        remaining, remaining_boardings = self._bounds_to(t)
+        if remaining[s] == math.inf:
+            raise nx.NetworkXNoPath(f"No path to {target}.")
+
+        # Labels in parallel lists, indexed by label id
+        label_key, label_parent = [], []
+        fare_state, slot, price = transitions[self._column_slots[s]]
+        label_key.append(s * node_states + fare_state * slots + slot)
+        label_parent.append(-1)
+        fringe = [(remaining[s], 0, price, 0, 0)]
+        # State key -> (price, boardings) of its settled labels
+        bags = {}
+        # (final price, boardings, time, label) of the routes found
+        found = []
+        settled = 0
+        truncated = False
+        while fringe:
+            _, boardings, price, time, label = heappop(fringe)
+            key = label_key[label]
+            node, state = divmod(key, node_states)
+            # Every route found arrives no later than this label can
+            least_price = price + cheapest_package if state >= slots else price
+            least_boardings = boardings + remaining_boardings[node]
+            if any(p <= least_price and b <= least_boardings for p, b, _, _ in found):
+                continue
+            bag = bags.setdefault(key, [])
+            if any(p <= price and b <= boardings for p, b in bag):
+                continue
+            if settled >= MAX_LABELS:
+                truncated = True
+                break
+            if len(bag) >= MAX_LABELS_PER_STATE:
+                truncated = True
+                continue
+            bag.append((price, boardings))
+            settled += 1
+
+            if node == t:
+                # The route ends here: charge the package still open
+                package = _FARE_FINAL[state // slots]
+                price += cents[package] if package >= 0 else 0
+                if not any(p <= price and b <= boardings for p, b, _, _ in found):
+                    found.append((price, boardings, time, label))
+                continue
+            base = state * slots
+            for head, ticks, more_boardings, column_slot in arcs[node]:
+                if remaining[head] == math.inf:
+                    continue
+                if column_slot < 0:
+                    next_state, cost = state, 0
+                else:
+                    fare_state, slot, cost = transitions[base + column_slot]
+                    next_state = fare_state * slots + slot
+                next_key = head * node_states + next_state
+                next_price, next_boardings = price + cost, boardings + more_boardings
+                next_bag = bags.get(next_key)
+                if next_bag and any(p <= next_price and b <= next_boardings for p, b in next_bag):
+                    continue
+                label_key.append(next_key)
+                label_parent.append(label)
+                next_time = time + ticks
+                heappush(fringe, (next_time + remaining[head], next_boardings, next_price, next_time,
+                                  len(label_key) - 1))
+
+        routes = []
+        for i, (price, boardings, time, label) in enumerate(found):
+            # A route found later with the same time can still have a lower final price
+            if any(j != i and p <= price and b <= boardings and tm <= time and ((p, b, tm) != (price, boardings, time) or j < i)
+                   for j, (p, b, tm, _) in enumerate(found)):
+                continue
+            nodes = []
+            while label >= 0:
+                nodes.append(label_key[label] // node_states)
+                label = label_parent[label]
+            nodes.reverse()
+            line_route = self.line_graph.line_route(nodes, boardings, time * TIME_RESOLUTION)
+            routes.append(ParetoRoute(path=line_route.path, legs=line_route.legs, price=price / 100,
+                                      transfers=line_route.transfers, time=line_route.time))
+        routes.sort(key=lambda route: (route.time, route.transfers, route.price))
+        return routes, truncated, settled
+
+    def _bounds_to(self, target):
+        """
+        (time, boardings): the least time in TIME_RESOLUTION units and the
+        fewest boardings from every line graph node to station `target` (an
+        engine index), inf if it cannot be reached. Every arc has a reverse
+        arc of the same time, so the times come from a search from the
+        target; the boardings from a 0-1 search over the reversed arcs.
+        """
+        arcs = self.line_graph.arcs
+        time = [math.inf] * len(arcs)
+        time[target] = 0
+        fringe = [(0, target)]
+        while fringe:
+            d, node = heappop(fringe)
+            if d > time[node]:
+                continue
+            for head, ticks, _ in arcs[node]:
+                candidate = d + ticks
+                if candidate < time[head]:
+                    time[head] = candidate
+                    heappush(fringe, (candidate, head))
+
+        boardings = [math.inf] * len(arcs)
+        boardings[target] = 0
+        queue = deque([target])
+        while queue:
+            node = queue.popleft()
+            for tail, more_boardings in self._reverse_arcs[node]:
+                candidate = boardings[node] + more_boardings
+                if candidate < boardings[tail]:
+                    boardings[tail] = candidate
+                    if more_boardings:
+                        queue.append(tail)
+                    else:
+                        queue.appendleft(tail)
+        return time, boardings
+
+
+_pareto_graph = None
+_lock = threading.Lock()
+
+
+def get_pareto_graph():
+    """Pareto search graph of the current line graph (closures applied), built on first use."""
+    global _pareto_graph
+    from metroversoApp.assets import lineGraph
+
+    line_graph = lineGraph.get_line_graph()
+    pareto_graph = _pareto_graph
+    if pareto_graph is None or pareto_graph.line_graph is not line_graph:
+        with _lock:
+            if _pareto_graph is None or _pareto_graph.line_graph is not line_graph:
+                _pareto_graph = ParetoGraph(line_graph)
+            pareto_graph = _pareto_graph
+    return pareto_graph
@@ -0,0 +1,101 @@
+"""
+Process-local table of Package prices.
+
+The packages fixture is a couple of dozen rows, so instead of one query per
+package and route the whole table is read once into a dict keyed by
+(package id, normalized profile). The post_save/post_delete receivers on
+Package (metroversoApp.signals) mark it stale and it is read again on the
+next lookup, so pricing a route needs no database access in between.
+
+Each process keeps its own table. invalidate() also rewrites the PRICES_STAMP
+stamp file (stampFile), and every process checks it before a lookup and
+before answering from routeCache (refresh): when another process changed
+the prices, the table and the cached route responses priced with it are
+dropped here too.
+"""
+import threading
+
+from metroversoApp.assets import stampFile
+
+PRICES_STAMP = 'prices'
+
+_lock = threading.Lock()
+# (id_package, profile.lower()) -> price, or None when it has to be (re)loaded
+_prices = None
+# Stamp file the table was loaded at
+_loaded_stamp = None
+_stats = {'loads': 0, 'remote_changes': 0}
+
+
+def normalize_profile(profile):
+    """Profiles are compared like profile__iexact: stripped and case-insensitive."""
+    return str(profile).strip().lower()
+
+
+def _load():
+    from metroversoApp.models import Package
+
+    prices = {}
+    for id_package, profile, price in Package.objects.order_by('pk').values_list('id_package', 'profile', 'price'):
+        # Keep the first row if two profiles only differ in case
+        prices.setdefault((id_package, normalize_profile(profile)), price)
+    return prices
+
+
+def refresh():
+    """
+    Drops the table, and the cached route responses priced with it, if
+    another process changed the prices since it was loaded. One stat when
+    nothing changed.
+    """
+    global _prices
+    from metroversoApp.assets import routeCache
+
+    if _prices is None or stampFile.read_stamp(PRICES_STAMP) == _loaded_stamp:
+        return
+    with _lock:
+        if _prices is None or stampFile.read_stamp(PRICES_STAMP) == _loaded_stamp:
+            return
+        _prices = None
+        _stats['remote_changes'] += 1
+    routeCache.invalidate()
+
+
+def get_prices():
+    """Returns the price dict, loading it from the database if needed."""
+    global _prices, _loaded_stamp
+    refresh()
+    prices = _prices
+    if prices is None:
+        with _lock:
+            if _prices is None:
+                # Read before the rows, so a change made while loading is seen on the next call
+                _loaded_stamp = stampFile.read_stamp(PRICES_STAMP)
+                _prices = _load()
+                _stats['loads'] += 1
+            prices = _prices
+    return prices
+
+
+def get_price(package, profile):
+    """Price of `package` for `profile`, or None if there is no such row."""
+    return get_prices().get((package, normalize_profile(profile)))
+
+
+def invalidate():
+    """
+    Marks the table stale; it is read again on the next lookup. Rewrites the
+    stamp file so every other process does the same.
+    """
+    global _prices
+    with _lock:
+        _prices = None
+    try:
+        stampFile.write_stamp(PRICES_STAMP)
+    except OSError as e:
+        print(f"Warning: could not write the {PRICES_STAMP} stamp ({e}); other processes keep their prices "
+              f"until they restart")
+
+
+def get_price_table_info():
+    return dict(_stats, rows=len(_prices) if _prices is not None else None)
@@ -0,0 +1,151 @@
+"""
+Shortest-path trees to a destination, for rerouting a rider who left the route.
+
+The map follows the rider with watchPosition, and a rider who goes off-route
+needs a new route to the same destination from wherever they are now. Arcs
+of G go both ways with the same weights (closures close both directions), so
+the Dijkstra tree grown from the destination holds the shortest route from
+every station to it: the parent of a station is its next station on the way
+to the destination, and a reroute is a walk up the tree.
+
+Trees are kept per (destination, criterion) in a bounded LRU, cleared when
+the graph version or the active closures change. warm_up() builds the trees
+of the destinations most saved in journeys (models.Route) in a background
+thread, started once per process by start_warm_up() and again after the
+trees are cleared.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = 64
+WARM_UP_DESTINATIONS = 16
+WARM_UP_CRITERION = "time"
+
+_lock = threading.Lock()
+# (destination, criterion) -> (dist, pred, pred_arc) lists indexed by engine node id
+_entries = OrderedDict()
+_graph_version = None
+_warm_up_started = False
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'warmed': 0}
+
+
+def _check_graph_version(engine):
+    """Clears the trees if the graph, or the closures applied to it, changed. Call with _lock held."""
+    global _graph_version, _warm_up_started
+    if engine.version != _graph_version:
+        if _entries:
+            _stats['invalidations'] += 1
+            # The popular trees are built again in the background
+            _warm_up_started = False
+        _entries.clear()
+        _graph_version = engine.version
+
+
+def _tree(engine, destination, criterion):
+    """Returns (tree, cache_hit) for `destination`, searching and storing it on a miss."""
+    key = (destination, criterion)
+    with _lock:
+        _check_graph_version(engine)
+        tree = _entries.get(key)
+        if tree is not None:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return tree, True
+        _stats['misses'] += 1
+
+    dist, pred, pred_arc, _ = engine.dijkstra(engine.node_index(destination), criterion)
+    tree = (dist, pred, pred_arc)
+    with _lock:
+        if engine.version == _graph_version:
+            _entries[key] = tree
+            _entries.move_to_end(key)
+            while len(_entries) > CACHE_MAX_ENTRIES:
+                _entries.popitem(last=False)
+                _stats['evictions'] += 1
+    return tree, False
+
+
+def route_to(station, destination, criterion="time"):
+    """
+    Shortest route from `station` to `destination` for `criterion` (one of
+    routingEngine.ENGINE_CRITERIA). Returns (path, cost, transfers,
+    cache_hit). Raises nx.NodeNotFound for unknown stations and
+    nx.NetworkXNoPath if they are not connected.
+    """
+    import networkx as nx
+    from metroversoApp.assets import closures
+
+    engine = closures.routing_engine()
+    source = engine.node_index(station)
+    (dist, pred, pred_arc), cache_hit = _tree(engine, destination, criterion)
+    if dist[source] == math.inf:
+        raise nx.NetworkXNoPath(f"No path to {destination}.")
+
+    arc_transfer = engine.arc_transfer
+    path = [station]
+    transfers = 0
+    node = source
+    while pred[node] >= 0:
+        transfers += int(arc_transfer[pred_arc[node]])
+        node = pred[node]
+        path.append(engine.node_ids[node])
+    return path, dist[source], transfers, cache_hit
+
+
+def popular_destinations(limit=WARM_UP_DESTINATIONS):
+    """The `limit` stations most often saved as a journey's destination (an empty list without a database)."""
+    from django.db import DatabaseError
+    from django.db.models import Count
+    from metroversoApp.models import Route
+
+    try:
+        counts = Route.objects.values('id_end').annotate(count=Count('id_route')).order_by('-count')[:limit]
+        return [row['id_end'] for row in counts]
+    except DatabaseError as e:
+        print(f"Warning: could not read the saved journeys ({e}); no reroute trees precomputed")
+        return []
+
+
+def warm_up(destinations=None, criterion=WARM_UP_CRITERION):
+    """
+    Builds the trees of `destinations` (default: popular_destinations());
+    returns how many were built. Closes the thread's database connection,
+    as it runs in its own thread.
+    """
+    from django.db import connection
+    from metroversoApp.assets import closures
+
+    try:
+        engine = closures.routing_engine()
+        if destinations is None:
+            destinations = popular_destinations()
+        built = 0
+        for destination in destinations:
+            if destination not in engine.index:
+                continue
+            _, cache_hit = _tree(engine, destination, criterion)
+            built += not cache_hit
+        with _lock:
+            _stats['warmed'] += built
+        return built
+    finally:
+        connection.close()
+
+
+def start_warm_up():
+    """Runs warm_up() in a background thread, once per process and after every invalidation."""
+    global _warm_up_started
+    if _warm_up_started:
+        return
+    with _lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up, name="reroute-warm-up", daemon=True).start()
+
+
+def get_cache_info():
+    """Returns the counters, the number of trees and the size limit."""
+    with _lock:
+        return dict(_stats, entries=len(_entries), max_entries=CACHE_MAX_ENTRIES)
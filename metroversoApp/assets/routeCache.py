@@ -0,0 +1,137 @@
+"""
+Bounded LRU cache of route responses.
+
+The map, the dashboard and save_journey ask for the same popular
+origin-destination pairs over and over. The part of a route response that
+only depends on the network and the fares (path, coordinates, transfers,
+packages, price) is kept here, keyed by (start, destination, criterion,
+profile, algorithm).
+
+Entries are dropped:
+- when the cache is full (least recently used first),
+- after CACHE_TTL_SECONDS, or earlier at the next opening/closing time of
+  the service so nothing cached before a service change outlives it,
+- all at once when the graph version changes (routingEngine.graph_version)
+  or when a Package price changes, here (see metroversoApp.signals) or in
+  another process (see priceTable.refresh),
+- selectively when closures start or end (see closures.refresh): the routes
+  through a new closure and the ones computed while an ended closure was active.
+
+Fields that depend on the clock (can_make_trip, service hours) are never
+cached; calculeRute computes them on every call.
+"""
+import datetime
+import threading
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL_SECONDS = 15 * 60
+
+_lock = threading.Lock()
+# key -> (expires_at, value, ids of the closures active when it was computed)
+_entries = OrderedDict()
+_graph_version = None
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0, 'closure_drops': 0}
+
+
+def _next_service_change(now):
+    """First opening or closing time (metro or Arví) after `now`, or the next midnight."""
+    from metroversoApp.assets.stationGraphs import _service_window, _arvi_service_window
+
+    midnight = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    changes = [t for t in (*_service_window(now), *_arvi_service_window(now)) if t > now]
+    return min(changes, default=midnight)
+
+
+def _check_graph_version():
+    """Clears the cache if the graph changed since the entries were stored. Call with _lock held."""
+    global _graph_version
+    from metroversoApp.assets.routingEngine import graph_version
+
+    version = graph_version()
+    if version != _graph_version:
+        if _entries:
+            _stats['invalidations'] += 1
+        _entries.clear()
+        _graph_version = version
+
+
+def get(key):
+    """Returns the cached value for `key`, or None (counted as a miss)."""
+    from metroversoApp.assets import closures, priceTable
+    from metroversoApp.assets.stationGraphs import _now
+
+    # Applies closure and price changes (and their invalidations) before answering
+    closures.refresh()
+    priceTable.refresh()
+    with _lock:
+        _check_graph_version()
+        entry = _entries.get(key)
+        if entry is None:
+            _stats['misses'] += 1
+            return None
+        expires_at, value, _ = entry
+        if _now() >= expires_at:
+            del _entries[key]
+            _stats['expirations'] += 1
+            _stats['misses'] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats['hits'] += 1
+        return value
+
+
+def put(key, value):
+    """
+    Stores `value` for `key`. Cached values are shared between requests and
+    must not be modified by the caller.
+    """
+    from metroversoApp.assets import closures
+    from metroversoApp.assets.stationGraphs import _now
+
+    now = _now()
+    expires_at = min(now + datetime.timedelta(seconds=CACHE_TTL_SECONDS), _next_service_change(now))
+    closure_ids = closures.active_ids()
+    with _lock:
+        _check_graph_version()
+        _entries[key] = (expires_at, value, closure_ids)
+        _entries.move_to_end(key)
+        while len(_entries) > CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+
+
+def invalidate():
+    """Drops every entry, e.g. after a fare change."""
+    with _lock:
+        if _entries:
+            _stats['invalidations'] += 1
+        _entries.clear()
+
+
+def invalidate_routes(stations=(), edges=(), closure_ids=()):
+    """
+    Drops the entries whose route visits one of `stations`, uses one of
+    `edges` ((u, v) pairs, give both directions) or was computed while one of
+    the closures in `closure_ids` was active. Returns the number dropped.
+    """
+    stations, edges, closure_ids = frozenset(stations), frozenset(edges), frozenset(closure_ids)
+    if not stations and not edges and not closure_ids:
+        return 0
+    with _lock:
+        stale = []
+        for key, (_, value, entry_closures) in _entries.items():
+            path = value['route_result'].path
+            if (entry_closures & closure_ids or any(station in stations for station in path)
+                    or any(edge in edges for edge in zip(path, path[1:]))):
+                stale.append(key)
+        for key in stale:
+            del _entries[key]
+        _stats['closure_drops'] += len(stale)
+        return len(stale)
+
+
+def get_cache_info():
+    """Returns the counters, the number of entries and the size limits."""
+    with _lock:
+        return dict(_stats, entries=len(_entries), max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS)
@@ -0,0 +1,228 @@
+"""
+Precomputed all-pairs route tables for the station graph.
+
+The network in stationGraphs is small and fixed, so instead of running
+Dijkstra on every request we run it once per source and criterion when the
+module is imported and keep the shortest-path trees. A route lookup is then a
+walk back from the destination to the source through the stored predecessors.
+
+The trees are computed on the compiled routing engine and stored as dense
+NumPy matrices indexed by the engine's integer station ids. When the network
+was loaded from a snapshot (networkSnapshot) the matrices come from the mapped
+file and nothing is computed at startup.
+
+The tables take n x n entries per criterion, so they are only built for
+networks of up to MAX_TABLE_NODES stations (the metro network, not the one
+with the feeder buses). Without tables, routes are searched on the engine.
+
+Besides ROUTE_CRITERIA there is a table per time layer of the hours some
+line is slowed (speedProfiles.SLOWED_LAYERS), so 'time' at the peaks is a
+lookup too. The snapshot does not store those; they are built at startup.
+"""
+import math
+import time
+
+import networkx as nx
+import numpy as np
+
+from metroversoApp.assets import routingEngine
+
+# Edge attributes that can be used as routing criteria
+ROUTE_CRITERIA = ("weight", "time", "transfer", "distance_km")
+
+# Largest network the tables are built for (500 stations ~ 20 MB of tables)
+MAX_TABLE_NODES = 500
+
+# criterion -> {'pred': int32 (n, n), 'length': float64 (n, n), 'duration': float64 (n, n)}
+# Row = source, column = target. pred is -1 for the source and unreachable nodes.
+_tables = {}
+# Same matrices as memoryviews: indexing them returns plain Python numbers
+_views = {}
+_table_engine = None
+_table_info = {'nodes': 0, 'edges': 0, 'build_seconds': 0.0, 'builds': 0}
+
+
+def _build_criterion_table(engine, criterion):
+    """
+    Runs one single-source Dijkstra per station and keeps, for every target,
+    the parent on the shortest path, the cost for `criterion` and the travel
+    time in minutes along that same path.
+    """
+    n = engine.number_of_nodes
+    pred = np.full((n, n), -1, dtype=np.int32)
+    length = np.full((n, n), np.inf, dtype=np.float64)
+    duration = np.full((n, n), np.inf, dtype=np.float64)
+    # A time layer is its own travel time
+    layered = engine.layers is not None and criterion in engine.layers[0]
+    time_weights = engine.weights[criterion if layered else 'time']
+
+    for source in range(n):
+        dist, parents, parent_arcs, order = engine.dijkstra(source, criterion)
+
+        row_duration = duration[source]
+        row_duration[source] = 0.0
+        # `order` is the settling order, so every parent comes before its children
+        for node in order[1:]:
+            row_duration[node] = row_duration[parents[node]] + time_weights[parent_arcs[node]]
+
+        length[source] = dist
+        pred[source] = parents
+
+    return {'pred': pred, 'length': length, 'duration': duration}
+
+
+def tables_supported(engine):
+    """Returns True if `engine` is small enough to precompute its route tables."""
+    return engine.number_of_nodes <= MAX_TABLE_NODES
+
+
+def table_criteria(engine):
+    """ROUTE_CRITERIA plus the speedProfiles.SLOWED_LAYERS registered in `engine`."""
+    from metroversoApp.assets.speedProfiles import SLOWED_LAYERS
+
+    return ROUTE_CRITERIA + tuple(criterion for criterion in SLOWED_LAYERS if criterion in engine.weights)
+
+
+def build_route_tables(engine=None, criteria=None):
+    """
+    Builds the route tables for `criteria` (default: table_criteria()) on
+    `engine` (defaults to the compiled station graph). Returns a new dict; it
+    does not touch the active tables.
+    """
+    if engine is None:
+        engine = routingEngine.engine
+    if criteria is None:
+        criteria = table_criteria(engine)
+
+    return {criterion: _build_criterion_table(engine, criterion) for criterion in criteria}
+
+
+def rebuild_route_tables(engine=None, criteria=None):
+    """
+    Rebuilds the active route tables after the graph changed.
+    If `criteria` is given only those tables are rebuilt; the rest are kept.
+    The new tables are swapped in at once so readers never see a half-built table.
+    """
+    if engine is None:
+        engine = routingEngine.engine
+
+    start = time.perf_counter()
+    if not tables_supported(engine):
+        print(f"Route tables disabled: {engine.number_of_nodes} stations > {MAX_TABLE_NODES}")
+        new_tables = {}
+    elif criteria is None or engine is not _table_engine:
+        new_tables = build_route_tables(engine)
+    else:
+        new_tables = dict(_tables)
+        new_tables.update(build_route_tables(engine, criteria))
+    elapsed = time.perf_counter() - start
+
+    _install_tables(new_tables, engine, elapsed)
+    return elapsed
+
+
+def _install_tables(new_tables, engine, elapsed):
+    global _tables, _views, _table_engine
+
+    new_views = {
+        criterion: {name: memoryview(matrix) for name, matrix in table.items()}
+        for criterion, table in new_tables.items()
+    }
+    _tables, _views, _table_engine = new_tables, new_views, engine
+    _table_info.update({
+        'nodes': engine.number_of_nodes,
+        'edges': engine.number_of_arcs // 2,
+        'build_seconds': elapsed,
+        'builds': _table_info['builds'] + 1,
+    })
+
+
+def _tables_from_snapshot(engine):
+    """Returns the route tables stored in the loaded network snapshot, or None."""
+    from metroversoApp.assets.networkSnapshot import loaded_snapshot
+
+    snapshot = loaded_snapshot()
+    if snapshot is None or snapshot['header']['nodes'] != engine.node_ids:
+        return None
+    if tuple(snapshot['header'].get('table_criteria', ())) != ROUTE_CRITERIA:
+        return None
+    arrays = snapshot['arrays']
+    return {
+        criterion: {name: arrays[f'table_{criterion}_{name}'] for name in ('pred', 'length', 'duration')}
+        for criterion in ROUTE_CRITERIA
+    }
+
+
+def has_table(criterion):
+    """Returns True if there is a precomputed table for `criterion`."""
+    return criterion in _tables
+
+
+def get_table(criterion, engine=None):
+    """
+    Returns the {'pred', 'length', 'duration'} matrices for `criterion`, or
+    None if there is no table for it (or the tables belong to another engine).
+    """
+    if engine is not None and engine is not _table_engine:
+        return None
+    return _tables.get(criterion)
+
+
+def _lookup(source, target, criterion):
+    views = _views[criterion]
+    try:
+        s = _table_engine.index[source]
+        t = _table_engine.index[target]
+    except KeyError as e:
+        raise nx.NodeNotFound(f"Node {e.args[0]} not found in graph")
+    if views['length'][s, t] == math.inf:
+        raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+    return views, s, t
+
+
+def get_route(source, target, criterion):
+    """
+    Returns the shortest path from `source` to `target` for `criterion`, the
+    same one nx.dijkstra_path would return. Raises nx.NetworkXNoPath if the
+    destination is unreachable and KeyError if the criterion has no table.
+    """
+    views, s, t = _lookup(source, target, criterion)
+    pred = views['pred']
+    node_ids = _table_engine.node_ids
+
+    path = [node_ids[t]]
+    node = t
+    while node != s:
+        node = pred[s, node]
+        path.append(node_ids[node])
+    path.reverse()
+    return path
+
+
+def get_route_length(source, target, criterion):
+    """Returns the cost of the shortest path for `criterion`."""
+    views, s, t = _lookup(source, target, criterion)
+    return views['length'][s, t]
+
+
+def get_route_duration(source, target, criterion):
+    """Returns the travel time in minutes along the shortest path for `criterion`."""
+    views, s, t = _lookup(source, target, criterion)
+    return views['duration'][s, t]
+
+
+def get_table_info():
+    """Returns a copy of the build statistics of the active tables."""
+    nbytes = sum(a.nbytes for table in _tables.values() for a in table.values())
+    return dict(_table_info, criteria=list(_tables), nbytes=nbytes)
+
+
+_snapshot_tables = _tables_from_snapshot(routingEngine.engine)
+if _snapshot_tables is not None:
+    _start = time.perf_counter()
+    _snapshot_tables.update(build_route_tables(routingEngine.engine, [
+        criterion for criterion in table_criteria(routingEngine.engine) if criterion not in _snapshot_tables
+    ]))
+    _install_tables(_snapshot_tables, routingEngine.engine, time.perf_counter() - _start)
+else:
+    rebuild_route_tables()
@@ -0,0 +1,549 @@
+"""
+Array-backed routing engine compiled from the station graph.
+
+G (stationGraphs) stays the source of truth for building and debugging the
+network. For routing it is compiled once into a compact form:
+- every station gets an integer id (its position in G.nodes()),
+- adjacency is stored as CSR arrays (indptr/indices),
+- every criterion has one NumPy weight array aligned with `indices`.
+
+Neighbours keep the order of G.adj and the search breaks ties exactly like
+networkx, so shortest_path() returns the same paths as nx.dijkstra_path.
+
+For the time-based criteria there are also A* and bidirectional A* searches
+guided by the straight-line distance to the destination (see search()).
+
+Weight layers (set_weight_layers) are extra minute criteria kept as the rows
+of one 2D array, e.g. the time-of-day layers of speedProfiles; they are
+searched like 'time', A* included.
+"""
+from heapq import heappush, heappop
+import copy
+import hashlib
+import json
+import math
+
+import networkx as nx
+import numpy as np
+
+from metroversoApp.assets.stationGraphs import G, SPEEDS, R_KM
+
+# Edge attributes compiled into weight arrays
+ENGINE_CRITERIA = ("weight", "time", "transfer", "distance_km")
+
+# Search algorithms accepted by CompiledGraph.search()
+SEARCH_ALGORITHMS = ("dijkstra", "astar", "bidirectional")
+# Criteria measured in minutes, where the straight-line heuristic applies
+ASTAR_CRITERIA = ("weight", "time")
+
+
+class CompiledGraph:
+    """
+    CSR representation of an undirected station graph. Every undirected edge
+    is stored as two arcs, one per direction.
+    """
+
+    def __init__(self, node_ids, positions, indptr, indices, weights, arc_line, arc_transfer, lines):
+        self.node_ids = list(node_ids)
+        self.index = {node: i for i, node in enumerate(self.node_ids)}
+        self.positions = positions          # float64 (n, 2) -> lon, lat
+        self.indptr = indptr                # int32 (n + 1)
+        self.indices = indices              # int32 (arcs)
+        self.weights = weights              # criterion -> float64 (arcs)
+        self.arc_line = arc_line            # int16 (arcs), index into `lines`
+        self.arc_transfer = arc_transfer    # int8 (arcs), 1 for walking transfers
+        self.lines = list(lines)
+
+        # The search loop runs in pure Python, where list indexing is much
+        # cheaper than indexing NumPy arrays. The topology is kept once as
+        # per-node tuples of (arc, head) and each criterion gets a flat list of
+        # weights, made on first use.
+        indptr_list = indptr.tolist()
+        indices_list = indices.tolist()
+        self._arcs = [
+            tuple(zip(range(indptr_list[v], indptr_list[v + 1]), indices_list[indptr_list[v]:indptr_list[v + 1]]))
+            for v in range(len(self.node_ids))
+        ]
+        self._weights = {}
+
+        # Positions in radians for the haversine heuristic
+        lon_lat = np.radians(np.nan_to_num(np.asarray(positions, dtype=np.float64)))
+        self._lon = lon_lat[:, 0]
+        self._lat = lon_lat[:, 1]
+        self._cos_lat = np.cos(self._lat)
+        self._heuristic_scales = {}
+        self._version = None
+        # (criteria, float64 (criteria, arcs)) whose rows are registered in `weights`
+        self.layers = None
+
+    @property
+    def version(self):
+        """
+        Content hash of the stations, adjacency and weights. The same network
+        gives the same version in every process, and any change gives a new one.
+        """
+        if self._version is None:
+            digest = hashlib.sha1(json.dumps(self.node_ids).encode())
+            for array in (self.positions, self.indptr, self.indices):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            for criterion in ENGINE_CRITERIA:
+                if criterion in self.weights:
+                    digest.update(np.ascontiguousarray(self.weights[criterion]).tobytes())
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    @property
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def number_of_arcs(self):
+        return len(self.indices)
+
+    def nbytes(self):
+        """Memory used by the arrays of the engine."""
+        arrays = [self.positions, self.indptr, self.indices, self.arc_line, self.arc_transfer]
+        arrays.extend(self.weights.values())
+        return sum(a.nbytes for a in arrays)
+
+    def _weight_view(self, criterion):
+        view = self._weights.get(criterion)
+        if view is None:
+            if criterion not in self.weights:
+                # Only compiled criteria get a view, so arbitrary names cannot grow the engine
+                raise ValueError(f"Unknown criterion: {criterion}")
+            view = self._weights[criterion] = self.weights[criterion].tolist()
+        return view
+
+    def weight_list(self, criterion):
+        """
+        Weights of `criterion` as a flat list aligned with the arcs, as the
+        searches read them. The list is shared: do not modify it.
+        """
+        return self._weight_view(criterion)
+
+    @property
+    def arcs(self):
+        """Per node id, the (arc, head) tuples of its outgoing arcs in the order of G.adj."""
+        return self._arcs
+
+    def set_weight_layers(self, criteria, layers):
+        """
+        Registers row i of the 2D array `layers` as the weights of
+        criteria[i]. The rows share the topology and one contiguous block of
+        memory; they are minute criteria, searched with A* like 'time'.
+        """
+        self.layers = (tuple(criteria), layers)
+        for criterion, row in zip(criteria, layers):
+            self.weights[criterion] = row
+            self._weights.pop(criterion, None)
+            self._heuristic_scales.pop(criterion, None)
+
+    @property
+    def astar_criteria(self):
+        """ASTAR_CRITERIA plus the weight layers."""
+        return ASTAR_CRITERIA + (self.layers[0] if self.layers is not None else ())
+
+    def node_index(self, node):
+        """Integer id of station `node`. Raises nx.NodeNotFound for an unknown station."""
+        try:
+            return self.index[node]
+        except KeyError:
+            raise nx.NodeNotFound(f"Node {node} not found in graph")
+
+    def arc_index(self, u, v):
+        """Returns the arc position of u -> v (integer ids), or -1 if there is none."""
+        for k, head in self._arcs[u]:
+            if head == v:
+                return k
+        return -1
+
+    def station_arcs(self, node):
+        """Positions of every arc leaving or entering `node` (integer id)."""
+        outgoing = np.arange(self.indptr[node], self.indptr[node + 1])
+        return np.concatenate([outgoing, np.flatnonzero(self.indices == node)])
+
+    def with_closed_arcs(self, closed_arcs):
+        """
+        Returns a copy of the engine where the arcs in `closed_arcs` cannot be
+        used: their weight is inf for every criterion. Only the weight arrays
+        are new; the topology, positions and search structures are shared.
+        """
+        overlay = copy.copy(self)
+        overlay.weights = {}
+        if self.layers is not None:
+            criteria, layers = self.layers
+            layers = layers.copy()
+            layers[:, closed_arcs] = math.inf
+            overlay.layers = (criteria, layers)
+            overlay.weights.update(zip(criteria, layers))
+        for criterion, weights in self.weights.items():
+            if criterion in overlay.weights:
+                continue
+            weights = np.array(weights, dtype=np.float64)
+            weights[closed_arcs] = math.inf
+            overlay.weights[criterion] = weights
+        overlay._weights = {}
+        # Closing arcs only raises costs, so the base bounds stay admissible
+        overlay._heuristic_scales = {criterion: self.heuristic_scale(criterion) for criterion in self.astar_criteria}
+        overlay._version = None
+        return overlay
+
+    def dijkstra(self, source, criterion, target=-1, max_cost=math.inf):
+        """
+        Single-source Dijkstra over integer ids. Stops once `target` is settled
+        (if given) or once the next node would cost more than `max_cost`.
+        Returns (dist, pred, pred_arc, order): lists indexed by node id with
+        the cost, the parent and the arc used to reach it (-1 if none), and
+        the settled nodes in settling order. Only the costs of settled nodes
+        are final.
+        """
+        arcs = self._arcs
+        weights = self._weight_view(criterion)
+        n = len(arcs)
+
+        dist = [math.inf] * n
+        pred = [-1] * n
+        pred_arc = [-1] * n
+        done = bytearray(n)
+        order = []
+        # The push counter breaks ties in the heap the same way networkx does
+        pushes = 0
+        dist[source] = 0.0
+        fringe = [(0.0, 0, source)]
+        while fringe:
+            d, _, v = heappop(fringe)
+            if done[v]:
+                continue
+            if d > max_cost:
+                break
+            done[v] = 1
+            order.append(v)
+            if v == target:
+                break
+            for k, u in arcs[v]:
+                vu_dist = d + weights[k]
+                if vu_dist < dist[u] and not done[u]:
+                    dist[u] = vu_dist
+                    pred[u] = v
+                    pred_arc[u] = k
+                    pushes += 1
+                    heappush(fringe, (vu_dist, pushes, u))
+
+        if target >= 0 and not done[target]:
+            dist[target] = math.inf
+        return dist, pred, pred_arc, order
+
+    def path_from_pred(self, pred, source, target):
+        """Rebuilds the path (integer ids) from a predecessor mapping."""
+        path = [target]
+        node = target
+        while node != source:
+            node = pred[node]
+            path.append(node)
+        path.reverse()
+        return path
+
+    def shortest_path_ids(self, source, target, criterion):
+        """Shortest path between integer ids. Raises nx.NetworkXNoPath."""
+        if source == target:
+            return [source]
+        dist, pred, _, _ = self.dijkstra(source, criterion, target)
+        if dist[target] == math.inf:
+            raise nx.NetworkXNoPath(f"No path to {self.node_ids[target]}.")
+        return self.path_from_pred(pred, source, target)
+
+    def shortest_path(self, source, target, criterion="weight"):
+        """
+        Same contract as nx.dijkstra_path(G, source, target, weight=criterion)
+        but over the compiled arrays. Returns a list of station ids.
+        """
+        s = self.node_index(source)
+        t = self.node_index(target)
+        node_ids = self.node_ids
+        return [node_ids[i] for i in self.shortest_path_ids(s, t, criterion)]
+
+    def shortest_path_length(self, source, target, criterion="weight"):
+        """Cost of the shortest path for `criterion`."""
+        s = self.node_index(source)
+        t = self.node_index(target)
+        dist, _, _, _ = self.dijkstra(s, criterion, t)
+        if dist[t] == math.inf:
+            raise nx.NetworkXNoPath(f"No path to {target}.")
+        return dist[t]
+
+    def heuristic_scale(self, criterion):
+        """
+        Minutes per straight-line km used by the A* heuristic for `criterion`.
+        It is the time at the fastest line speed (SPEEDS), lowered if any arc
+        (e.g. a short walking transfer) is cheaper than that per km, so the
+        heuristic never overestimates and stays consistent.
+        """
+        scale = self._heuristic_scales.get(criterion)
+        if scale is not None:
+            return scale
+
+        if criterion not in self.astar_criteria:
+            raise ValueError(f"A* is only available for {self.astar_criteria}, not '{criterion}'")
+
+        scale = 60.0 / max(SPEEDS.values())
+        if np.isnan(np.asarray(self.positions, dtype=np.float64)).any():
+            # Without every position the bound cannot be guaranteed
+            self._heuristic_scales[criterion] = 0.0
+            return 0.0
+        tails = np.repeat(np.arange(len(self.node_ids)), np.diff(self.indptr))
+        lon = self._lon
+        lat = self._lat
+        a = (np.sin((lat[self.indices] - lat[tails]) / 2) ** 2
+             + np.cos(lat[tails]) * np.cos(lat[self.indices]) * np.sin((lon[self.indices] - lon[tails]) / 2) ** 2)
+        arc_km = 2 * R_KM * np.arcsin(np.sqrt(a))
+        weights = self.weights[criterion]
+        moving = arc_km > 0
+        if moving.any():
+            if (weights[moving] <= 0).any():
+                scale = 0.0
+            else:
+                scale = min(scale, float((weights[moving] / arc_km[moving]).min()))
+
+        self._heuristic_scales[criterion] = scale
+        return scale
+
+    def _heuristic(self, target, criterion):
+        """
+        Returns the lower bound in minutes from every node to `target` as a
+        list indexed by node id. Computing it for all nodes at once with NumPy
+        is cheaper than one haversine per node visited in the search loop.
+        """
+        scale = 2 * R_KM * self.heuristic_scale(criterion)
+        lon, lat, cos_lat = self._lon, self._lat, self._cos_lat
+        a = np.sin((lat - lat[target]) / 2) ** 2 + cos_lat * cos_lat[target] * np.sin((lon - lon[target]) / 2) ** 2
+        return (scale * np.arcsin(np.sqrt(np.minimum(a, 1.0)))).tolist()
+
+    def astar(self, source, target, criterion="time"):
+        """
+        A* between integer ids with the haversine heuristic.
+        Returns (path, cost, expanded) where expanded is the number of settled nodes.
+        Raises nx.NetworkXNoPath.
+        """
+        arcs = self._arcs
+        weights = self._weight_view(criterion)
+        h = self._heuristic(target, criterion)
+        n = len(arcs)
+
+        g = [math.inf] * n
+        pred = [-1] * n
+        closed = bytearray(n)
+        expanded = 0
+        pushes = 0
+        g[source] = 0.0
+        fringe = [(h[source], 0, source)]
+        while fringe:
+            _, _, v = heappop(fringe)
+            if closed[v]:
+                continue
+            closed[v] = 1
+            expanded += 1
+            if v == target:
+                return self.path_from_pred(pred, source, target), g[target], expanded
+            g_v = g[v]
+            for k, u in arcs[v]:
+                g_u = g_v + weights[k]
+                if g_u < g[u] and not closed[u]:
+                    g[u] = g_u
+                    pred[u] = v
+                    pushes += 1
+                    heappush(fringe, (g_u + h[u], pushes, u))
+
+        raise nx.NetworkXNoPath(f"No path to {self.node_ids[target]}.")
+
+    def bidirectional_astar(self, source, target, criterion="time"):
+        """
+        Bidirectional A* between integer ids using the average of the forward
+        and backward haversine potentials, so both searches see consistent
+        reduced costs. Stops when the two smallest keys add up to the best
+        path found. Returns (path, cost, expanded). Raises nx.NetworkXNoPath.
+        The cost is optimal, but among routes of equal cost the path can
+        differ from the one dijkstra() and networkx pick.
+        """
+        if source == target:
+            return [source], 0.0, 1
+
+        arcs = self._arcs
+        weights = self._weight_view(criterion)
+        h_to_target = self._heuristic(target, criterion)
+        h_to_source = self._heuristic(source, criterion)
+        potential = [(h_t - h_s) / 2 for h_t, h_s in zip(h_to_target, h_to_source)]
+
+        n = len(arcs)
+        # index 0 = forward search from source, 1 = backward search from target
+        g = ([math.inf] * n, [math.inf] * n)
+        pred = ([-1] * n, [-1] * n)
+        closed = (bytearray(n), bytearray(n))
+        fringes = ([(potential[source], 0, source)], [(-potential[target], 0, target)])
+        g[0][source] = 0.0
+        g[1][target] = 0.0
+        sign = (1, -1)
+
+        best = math.inf
+        meeting = None
+        expanded = 0
+        pushes = 0
+        while fringes[0] and fringes[1]:
+            if fringes[0][0][0] + fringes[1][0][0] >= best:
+                break
+            side = 0 if len(fringes[0]) <= len(fringes[1]) else 1
+            other = 1 - side
+            _, _, v = heappop(fringes[side])
+            if closed[side][v]:
+                continue
+            closed[side][v] = 1
+            expanded += 1
+
+            g_side, g_other = g[side], g[other]
+            g_v = g_side[v]
+            for k, u in arcs[v]:
+                g_u = g_v + weights[k]
+                if g_u < g_side[u] and not closed[side][u]:
+                    g_side[u] = g_u
+                    pred[side][u] = v
+                    pushes += 1
+                    heappush(fringes[side], (g_u + sign[side] * potential[u], pushes, u))
+                if g_other[u] < math.inf and g_u + g_other[u] < best:
+                    best = g_u + g_other[u]
+                    meeting = (v, u) if side == 0 else (u, v)
+
+        if meeting is None:
+            raise nx.NetworkXNoPath(f"No path to {self.node_ids[target]}.")
+
+        forward_end, backward_start = meeting
+        path = self.path_from_pred(pred[0], source, forward_end)
+        node = backward_start
+        path.append(node)
+        while node != target:
+            node = pred[1][node]
+            path.append(node)
+        if path[-2] == path[-1]:
+            path.pop()
+        return path, best, expanded
+
+    def search(self, source, target, criterion="time", algorithm="dijkstra"):
+        """
+        Shortest path between station ids with the given algorithm
+        ('dijkstra', 'astar' or 'bidirectional'). A* variants are only
+        available for ASTAR_CRITERIA and the weight layers. Returns (path, expanded) where expanded
+        is the number of nodes the search settled.
+        """
+        if algorithm not in SEARCH_ALGORITHMS:
+            raise ValueError(f"Unknown search algorithm '{algorithm}'")
+        s = self.node_index(source)
+        t = self.node_index(target)
+
+        if algorithm == "dijkstra":
+            if s == t:
+                return [source], 1
+            dist, pred, _, order = self.dijkstra(s, criterion, t)
+            if dist[t] == math.inf:
+                raise nx.NetworkXNoPath(f"No path to {target}.")
+            path_ids, expanded = self.path_from_pred(pred, s, t), len(order)
+        elif algorithm == "astar":
+            path_ids, _, expanded = self.astar(s, t, criterion)
+        else:
+            path_ids, _, expanded = self.bidirectional_astar(s, t, criterion)
+
+        node_ids = self.node_ids
+        return [node_ids[i] for i in path_ids], expanded
+
+    def path_cost(self, path_ids, criterion):
+        """Sum of `criterion` along a path of integer ids."""
+        weights = self._weight_view(criterion)
+        return sum(weights[self.arc_index(u, v)] for u, v in zip(path_ids, path_ids[1:]))
+
+    def path_weights(self, path, criterion):
+        """Weight of `criterion` on every hop of a path of station ids."""
+        weights = self._weight_view(criterion)
+        path_ids = [self.node_index(node) for node in path]
+        return [weights[self.arc_index(u, v)] for u, v in zip(path_ids, path_ids[1:])]
+
+
+def compile_graph(graph=None, criteria=ENGINE_CRITERIA):
+    """Compiles an nx.Graph (defaults to G) into a CompiledGraph."""
+    if graph is None:
+        graph = G
+
+    node_ids = list(graph.nodes())
+    index = {node: i for i, node in enumerate(node_ids)}
+    n = len(node_ids)
+    arcs = 2 * graph.number_of_edges()
+
+    positions = np.zeros((n, 2), dtype=np.float64)
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    indices = np.zeros(arcs, dtype=np.int32)
+    weights = {criterion: np.zeros(arcs, dtype=np.float64) for criterion in criteria}
+    arc_line = np.zeros(arcs, dtype=np.int16)
+    arc_transfer = np.zeros(arcs, dtype=np.int8)
+    lines = []
+    line_index = {}
+
+    k = 0
+    for i, node in enumerate(node_ids):
+        pos = graph.nodes[node].get('pos')
+        positions[i] = pos if pos is not None else (math.nan, math.nan)
+        for neighbor, data in graph.adj[node].items():
+            indices[k] = index[neighbor]
+            for criterion in criteria:
+                weights[criterion][k] = data.get(criterion, 1)
+            line = data.get('line', '')
+            if line not in line_index:
+                line_index[line] = len(lines)
+                lines.append(line)
+            arc_line[k] = line_index[line]
+            arc_transfer[k] = 1 if data.get('transfer') == 1 else 0
+            k += 1
+        indptr[i + 1] = k
+
+    return CompiledGraph(node_ids, positions, indptr, indices, weights, arc_line, arc_transfer, lines)
+
+
+def engine_from_snapshot(snapshot):
+    """
+    Builds a CompiledGraph directly on the memory-mapped arrays of a network
+    snapshot. Returns None if the snapshot was compiled for other criteria.
+    """
+    header = snapshot['header']
+    arrays = snapshot['arrays']
+    if tuple(header['criteria']) != ENGINE_CRITERIA:
+        return None
+    weights = {criterion: arrays[f'weight_{criterion}'] for criterion in ENGINE_CRITERIA}
+    return CompiledGraph(
+        header['nodes'], arrays['node_pos'], arrays['indptr'], arrays['indices'],
+        weights, arrays['arc_line'], arrays['arc_transfer'], header['lines'],
+    )
+
+
+def _initial_engine():
+    from metroversoApp.assets import speedProfiles
+    from metroversoApp.assets.networkSnapshot import loaded_snapshot
+
+    snapshot = loaded_snapshot()
+    if snapshot is not None:
+        compiled = engine_from_snapshot(snapshot)
+        if compiled is not None:
+            return speedProfiles.add_time_layers(compiled)
+    return speedProfiles.add_time_layers(compile_graph(G))
+
+
+engine = _initial_engine()
+
+
+def graph_version():
+    """Version of the network the module engine was compiled from (see CompiledGraph.version)."""
+    return engine.version
+
+
+def rebuild_engine(graph=None):
+    """Recompiles the module engine, with its time layers, after the graph changed and returns it."""
+    from metroversoApp.assets import speedProfiles
+
+    global engine
+    engine = speedProfiles.add_time_layers(compile_graph(graph))
+    return engine
@@ -0,0 +1,213 @@
+"""
+Service calendar: when each part of the network runs.
+
+Opening hours are kept per service (SERVICE_HOURS) and day type: Monday to
+Saturday, or Sundays and Colombian public holidays. Stations and lines are
+assigned a service by STATION_SERVICES and LINE_SERVICES, everything else
+runs on the 'network' service; the Arví station (L01) has its own hours.
+SERVICE_EXCEPTIONS overrides single dates of one service (other hours, or
+closed).
+
+Every service is compiled into an interval table: the opening and closing
+times of its service days, in order, as numpy arrays of seconds. A trip can
+be made if it starts and ends within one interval of every service its route
+uses, which is two binary searches per service for a whole array of trips at
+once (check_trips). Tables cover whole years and are extended when a trip
+falls outside them.
+
+Times are naive local datetimes, like stationGraphs._now().
+"""
+import datetime
+import threading
+
+import numpy as np
+
+# Service -> day type -> ((open hour, minute), (close hour, minute))
+SERVICE_HOURS = {
+    'network': {'weekday': ((4, 30), (23, 0)), 'sunday': ((5, 0), (22, 0))},
+    'arvi': {'weekday': ((9, 0), (18, 0)), 'sunday': ((8, 30), (18, 0))},
+}
+DEFAULT_SERVICE = 'network'
+# Station or line -> service, for the parts that do not follow the network's hours
+STATION_SERVICES = {'L01': 'arvi'}
+LINE_SERVICES = {}
+# (service, datetime.date) -> hours like SERVICE_HOURS, or None when closed all day
+SERVICE_EXCEPTIONS = {}
+
+# Table times are seconds since this naive datetime
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+_lock = threading.Lock()
+# service -> (first year, last year, opens, closes)
+_tables = {}
+
+
+def _easter(year):
+    """Easter Sunday of `year` (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _next_monday(date):
+    return date + datetime.timedelta(days=-date.weekday() % 7)
+
+
+def colombian_holidays(year):
+    """Public holidays of Colombia in `year`, with the ones that move to Monday (Ley 51 de 1983) moved."""
+    fixed = [(1, 1), (5, 1), (7, 20), (8, 7), (12, 8), (12, 25)]
+    moved = [(1, 6), (3, 19), (6, 29), (8, 15), (10, 12), (11, 1), (11, 11)]
+    easter = _easter(year)
+    holidays = {datetime.date(year, month, day) for month, day in fixed}
+    holidays.update(_next_monday(datetime.date(year, month, day)) for month, day in moved)
+    # Holy Thursday and Good Friday, then Ascension, Corpus Christi and Sacred Heart moved to Monday
+    holidays.update(easter + datetime.timedelta(days=days) for days in (-3, -2, 43, 64, 71))
+    return holidays
+
+
+def day_type(date):
+    """'sunday' for Sundays and holidays, 'weekday' for the other days."""
+    if date.weekday() == 6 or date in colombian_holidays(date.year):
+        return 'sunday'
+    return 'weekday'
+
+
+def _hours(service, date):
+    """((open hour, minute), (close hour, minute)) of `service` on `date`, or None if it does not run."""
+    if (service, date) in SERVICE_EXCEPTIONS:
+        return SERVICE_EXCEPTIONS[(service, date)]
+    return SERVICE_HOURS[service][day_type(date)]
+
+
+def service_window(start_time, service=DEFAULT_SERVICE):
+    """
+    (open_time, close_time) of `service` on the day of `start_time`. Both are
+    midnight when it does not run that day.
+    """
+    hours = _hours(service, start_time.date())
+    if hours is None:
+        midnight = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight, midnight
+    (open_hour, open_minute), (close_hour, close_minute) = hours
+    return (start_time.replace(hour=open_hour, minute=open_minute, second=0, microsecond=0),
+            start_time.replace(hour=close_hour, minute=close_minute, second=0, microsecond=0))
+
+
+def add_exception(service, date, hours):
+    """Sets the hours of `service` on `date` (None: closed all day) and recompiles its table."""
+    with _lock:
+        SERVICE_EXCEPTIONS[(service, date)] = hours
+        _tables.pop(service, None)
+
+
+def _compile(service, first_year, last_year):
+    """Opening and closing times, in seconds, of every day `service` runs between the two years."""
+    opens, closes = [], []
+    date = datetime.date(first_year, 1, 1)
+    end = datetime.date(last_year, 12, 31)
+    day = datetime.timedelta(days=1)
+    while date <= end:
+        hours = _hours(service, date)
+        if hours is not None:
+            midnight = datetime.datetime.combine(date, datetime.time())
+            (open_hour, open_minute), (close_hour, close_minute) = hours
+            opens.append(midnight.replace(hour=open_hour, minute=open_minute))
+            closes.append(midnight.replace(hour=close_hour, minute=close_minute))
+        date += day
+    return (np.array(opens, dtype='datetime64[s]').astype(np.int64),
+            np.array(closes, dtype='datetime64[s]').astype(np.int64))
+
+
+def _table(service, first_year, last_year):
+    """Interval table of `service` covering at least the years from `first_year` to `last_year`."""
+    table = _tables.get(service)
+    if table is None or table[0] > first_year or table[1] < last_year:
+        with _lock:
+            table = _tables.get(service)
+            if table is not None:
+                first_year, last_year = min(first_year, table[0]), max(last_year, table[1])
+            if table is None or table[0] > first_year or table[1] < last_year:
+                table = _tables[service] = (first_year, last_year, *_compile(service, first_year, last_year))
+    return table[2], table[3]
+
+
+def station_service(station):
+    """Service `station` runs on."""
+    from metroversoApp.assets.stationGraphs import G
+
+    service = STATION_SERVICES.get(station)
+    if service is None and station in G:
+        service = LINE_SERVICES.get(G.nodes[station].get('line'))
+    return service or DEFAULT_SERVICE
+
+
+def route_services(route):
+    """Services a route (list of station ids) uses."""
+    return frozenset({DEFAULT_SERVICE, *(station_service(station) for station in route)})
+
+
+def check_trips(starts, durations, routes):
+    """
+    For every trip i, True if a trip of `durations[i]` minutes leaving at
+    `starts[i]` along `routes[i]` (list of station ids, or a set from
+    route_services()) starts and ends while every service it uses runs.
+    Returns a numpy bool array.
+    """
+    starts = np.array(starts, dtype='datetime64[s]').astype(np.int64)
+    ends = starts + np.round(np.asarray(durations, dtype=np.float64) * 60).astype(np.int64)
+    can_make = np.ones(len(starts), dtype=bool)
+    if not len(starts):
+        return can_make
+
+    first_year = (_EPOCH + datetime.timedelta(seconds=int(starts.min()))).year
+    last_year = (_EPOCH + datetime.timedelta(seconds=int(ends.max()))).year
+    services = [route if isinstance(route, frozenset) else route_services(route) for route in routes]
+    for service in set().union(*services):
+        uses = np.fromiter((service in used for used in services), dtype=bool, count=len(services))
+        opens, closes = _table(service, first_year, last_year)
+        # The last interval opening at or before the start must still be open at the end
+        interval = np.searchsorted(opens, starts[uses], side='right') - 1
+        inside = interval >= 0
+        inside[inside] = ends[uses][inside] <= closes[interval[inside]]
+        can_make[uses] &= inside
+    return can_make
+
+
+def plan_trips(durations, routes, depart_at=None, arrive_by=None):
+    """
+    Departure and arrival of trips that leave at `depart_at` or arrive by
+    `arrive_by` (default: leave now). Returns (departures, arrivals,
+    can_make) where can_make comes from check_trips().
+    """
+    from metroversoApp.assets.stationGraphs import _now
+
+    minutes = [datetime.timedelta(minutes=duration) for duration in durations]
+    if arrive_by is not None:
+        departures = [arrive_by - duration for duration in minutes]
+    else:
+        start = depart_at if depart_at is not None else _now()
+        departures = [start] * len(minutes)
+    arrivals = [departure + duration for departure, duration in zip(departures, minutes)]
+    return departures, arrivals, check_trips(departures, durations, routes)
+
+
+def parse_time(value, now=None):
+    """
+    Naive local datetime from 'HH:MM' (today) or an ISO 8601 date and time;
+    times with an offset are converted to local time. Raises ValueError.
+    """
+    from metroversoApp.assets.stationGraphs import _now
+
+    if len(value) <= 5 and ':' in value:
+        hour, minute = value.split(':')
+        return (now or _now()).replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
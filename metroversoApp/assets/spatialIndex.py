@@ -0,0 +1,183 @@
+"""
+In-memory spatial index for stations and stops.
+
+Points are bucketed in a regular grid of roughly `cell_km` x `cell_km` cells
+(lon/lat degrees scaled at the latitude of the data), so a radius or
+k-nearest query only looks at the few cells around the query point instead
+of every point. Distances are great-circle distances in km (haversine).
+
+station_index() is the index over the `pos` of every node in
+stationGraphs.G, used by the /view/nearest endpoint.
+"""
+import math
+
+# Same mean Earth radius as stationGraphs.haversine. This module does not
+# import stationGraphs because the graph build uses it.
+R_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * R_KM / 180.0
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """Great-circle distance in km between two lon/lat points in degrees."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class GridIndex:
+    """
+    Grid bucket index over {point_id: (lon, lat)}.
+    Points can be added after construction; the grid geometry is fixed by
+    `cell_km` and `ref_lat` (defaults to Medellín's latitude).
+    """
+
+    def __init__(self, points=None, cell_km=0.5, ref_lat=6.25):
+        self.cell_km = cell_km
+        self.cell_lat = cell_km / KM_PER_DEGREE_LAT
+        self._cos_ref = math.cos(math.radians(ref_lat))
+        self.cell_lon = cell_km / (KM_PER_DEGREE_LAT * self._cos_ref)
+        # cell -> [(point_id, lon_rad, lat_rad, cos_lat)], ready for the haversine
+        self.cells = {}
+        self.points = {}
+        self._extent = None  # min x, min y, max x, max y of the used cells
+        if points:
+            for point_id, (lon, lat) in points.items():
+                self.add(point_id, lon, lat)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, lon, lat):
+        return (math.floor(lon / self.cell_lon), math.floor(lat / self.cell_lat))
+
+    def _cell_km_at(self, lat):
+        """Smallest side of a cell in km near `lat` (lon cells narrow away from ref_lat)."""
+        # 0.99 covers the difference between the flat grid and the haversine
+        return self.cell_km * min(1.0, math.cos(math.radians(lat)) / self._cos_ref) * 0.99
+
+    def add(self, point_id, lon, lat):
+        self.points[point_id] = (lon, lat)
+        cell = self._cell(lon, lat)
+        lat_r = math.radians(lat)
+        self.cells.setdefault(cell, []).append((point_id, math.radians(lon), lat_r, math.cos(lat_r)))
+        if not self._extent:
+            self._extent = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            self._extent = [min(self._extent[0], cell[0]), min(self._extent[1], cell[1]),
+                            max(self._extent[2], cell[0]), max(self._extent[3], cell[1])]
+
+    def _scan(self, cells, lon, lat, max_a, found):
+        """
+        Appends (a, point_id) for the points of `cells` whose haversine term
+        `a` is at most `max_a`. `a` grows with the distance, so points can be
+        ranked by it and only converted to km at the end.
+        """
+        sin = math.sin
+        lon_q = math.radians(lon)
+        lat_q = math.radians(lat)
+        cos_q = math.cos(lat_q)
+        grid = self.cells
+        for cell in cells:
+            for point_id, p_lon, p_lat, p_cos in grid.get(cell, ()):
+                a = sin((p_lat - lat_q) / 2) ** 2 + cos_q * p_cos * sin((p_lon - lon_q) / 2) ** 2
+                if a <= max_a:
+                    found.append((a, point_id))
+
+    @staticmethod
+    def _a_to_km(a):
+        return 2 * R_KM * math.asin(math.sqrt(min(1.0, a)))
+
+    @staticmethod
+    def _km_to_a(km):
+        return math.sin(min(km / (2 * R_KM), math.pi / 2)) ** 2
+
+    def within(self, lon, lat, radius_km):
+        """Returns [(point_id, distance_km)] within `radius_km`, closest first."""
+        if not self.points:
+            return []
+        cx, cy = self._cell(lon, lat)
+        reach = int(math.ceil(radius_km / self._cell_km_at(lat)))
+        min_x, min_y, max_x, max_y = self._extent
+        cells = [(x, y)
+                 for x in range(max(cx - reach, min_x), min(cx + reach, max_x) + 1)
+                 for y in range(max(cy - reach, min_y), min(cy + reach, max_y) + 1)]
+        found = []
+        self._scan(cells, lon, lat, self._km_to_a(radius_km), found)
+        found.sort()
+        return [(point_id, self._a_to_km(a)) for a, point_id in found]
+
+    def nearest(self, lon, lat, k=1, max_km=None):
+        """
+        Returns the `k` closest points as [(point_id, distance_km)], closest
+        first, optionally only those within `max_km`. Cells are visited in
+        rings around the query point until no unvisited cell can hold a
+        closer point.
+        """
+        if not self.points or k <= 0:
+            return []
+        cx, cy = self._cell(lon, lat)
+        min_x, min_y, max_x, max_y = self._extent
+        # Rings closer than the used cells are empty, start at the first one that is not
+        ring = max(min_x - cx, cx - max_x, min_y - cy, cy - max_y, 0)
+        last_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+        side_km = self._cell_km_at(lat)
+        max_a = math.inf if max_km is None else self._km_to_a(max_km)
+
+        best = []
+        while ring <= last_ring:
+            # Every point `ring` cells away is at least this far
+            bound_a = self._km_to_a((ring - 1) * side_km) if ring > 1 else 0.0
+            if bound_a > max_a or (len(best) >= k and bound_a > best[k - 1][0]):
+                break
+            cells = []
+            for x in range(max(cx - ring, min_x), min(cx + ring, max_x) + 1):
+                if x == cx - ring or x == cx + ring:
+                    cells.extend((x, y) for y in range(max(cy - ring, min_y), min(cy + ring, max_y) + 1))
+                else:
+                    # Only the border of the ring: the inside was visited before
+                    cells.extend((x, y) for y in (cy - ring, cy + ring) if min_y <= y <= max_y)
+            size = len(best)
+            self._scan(cells, lon, lat, max_a, best)
+            if len(best) != size:
+                best.sort()
+                del best[k:]
+            ring += 1
+        return [(point_id, self._a_to_km(a)) for a, point_id in best]
+
+
+# feeder_stops flag -> GridIndex, for the graph in _indexed_graph
+_station_indexes = {}
+_indexed_graph = None
+
+
+def station_index(feeder_stops=False):
+    """
+    Returns the GridIndex over the positions of the nodes of
+    stationGraphs.G: the stations shown on the map, plus the feeder-bus
+    stops when `feeder_stops` is True and they are loaded.
+    Built on first use and again if G is replaced.
+    """
+    global _indexed_graph
+    from metroversoApp.assets import stationGraphs
+    from metroversoApp.assets.feederNetwork import FEEDER_LINE_KEY
+
+    graph = stationGraphs.G
+    if _indexed_graph is not graph:
+        _station_indexes.clear()
+        _indexed_graph = graph
+    index = _station_indexes.get(feeder_stops)
+    if index is None:
+        index = _station_indexes[feeder_stops] = GridIndex({
+            node: data['pos'] for node, data in graph.nodes(data=True)
+            if 'pos' in data and (feeder_stops or data.get('line') != FEEDER_LINE_KEY)
+        })
+    return index
+
+
+def nearest_stations(points, k=1, max_km=None, feeder_stops=False):
+    """
+    Batch k-nearest query over station_index(feeder_stops). `points` is a
+    list of (lon, lat); returns one [(station_id, distance_km)] list per point.
+    """
+    index = station_index(feeder_stops)
+    return [index.nearest(lon, lat, k, max_km) for lon, lat in points]
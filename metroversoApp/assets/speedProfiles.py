@@ -0,0 +1,114 @@
+"""
+Time-of-day speeds: one 'time' weight layer per hour bucket.
+
+SPEEDS (stationGraphs) gives every line a single speed, but Metroplus and
+the tram share the streets and are much slower at the weekday peaks.
+SPEED_PROFILES lists, per line, the hours at which it runs at another speed.
+The day is cut into HOUR_BUCKETS at every boundary of the profiles, and each
+bucket gets a layer: the 'time' of every ride arc recomputed with the speed
+of its line in that bucket (stop times and walking transfers are unchanged).
+
+The layers are compiled once per routing engine, at startup and on rebuild,
+into one float64 array with a row per bucket. Each row is registered as a
+criterion of the engine ('time@06', ...), so a search on a layer runs on the
+same topology and arc order as one on 'time' and costs the same. The
+SLOWED_LAYERS get route tables of their own (routeTable). Sundays, holidays
+and the buckets where no line is slowed use the static 'time'.
+"""
+from bisect import bisect_right
+
+import numpy as np
+
+from metroversoApp.assets.stationGraphs import SPEEDS
+
+# Weekday hours at which a line runs at another speed: line -> ((first hour, end hour, km/h), ...)
+SPEED_PROFILES = {
+    'M': ((6, 9, 11), (16, 20, 11)),
+    'X': ((6, 9, 11), (16, 20, 11)),
+    'O': ((6, 9, 9), (16, 20, 9)),
+    'T': ((6, 9, 12), (16, 20, 12)),
+}
+TIME_LAYER_PREFIX = "time@"
+
+
+def _hour_buckets():
+    """(first hour, end hour) of every bucket, cut at each boundary of SPEED_PROFILES."""
+    bounds = sorted({0, 24, *(hour for ranges in SPEED_PROFILES.values() for start, end, _ in ranges
+                              for hour in (start, end))})
+    return tuple(zip(bounds, bounds[1:]))
+
+
+HOUR_BUCKETS = _hour_buckets()
+TIME_LAYERS = tuple(f"{TIME_LAYER_PREFIX}{start:02d}" for start, _ in HOUR_BUCKETS)
+
+
+def line_speed(line, hour):
+    """Speed in km/h of `line` at `hour` of a weekday."""
+    for start, end, speed in SPEED_PROFILES.get(line, ()):
+        if start <= hour < end:
+            return speed
+    return SPEEDS.get(line)
+
+
+# Buckets where some line is not at its SPEEDS speed
+SLOWED_BUCKETS = frozenset(
+    i for i, (start, _) in enumerate(HOUR_BUCKETS)
+    if any(line_speed(line, start) != SPEEDS[line] for line in SPEED_PROFILES)
+)
+# Layers searched instead of 'time' (the other buckets use the static weights)
+SLOWED_LAYERS = tuple(TIME_LAYERS[i] for i in sorted(SLOWED_BUCKETS))
+
+
+def compile_layers(engine):
+    """
+    (TIME_LAYERS, float64 array of shape (buckets, arcs)) for a CompiledGraph:
+    row i is the engine's 'time' with the speeds of HOUR_BUCKETS[i].
+    """
+    times = np.asarray(engine.weights['time'], dtype=np.float64)
+    km = np.asarray(engine.weights['distance_km'], dtype=np.float64)
+    arc_lines = np.array(engine.lines, dtype=object)[engine.arc_line]
+    riding = np.asarray(engine.arc_transfer) == 0
+
+    layers = np.empty((len(HOUR_BUCKETS), len(times)), dtype=np.float64)
+    layers[:] = times
+    for line in SPEED_PROFILES:
+        arcs = riding & (arc_lines == line)
+        if not arcs.any():
+            continue
+        for i, (start, _) in enumerate(HOUR_BUCKETS):
+            speed = line_speed(line, start)
+            if speed != SPEEDS[line]:
+                layers[i, arcs] += km[arcs] * 60.0 * (1.0 / speed - 1.0 / SPEEDS[line])
+    return TIME_LAYERS, layers
+
+
+def add_time_layers(engine):
+    """Compiles the layers of `engine` and registers them as its weights; returns the engine."""
+    engine.set_weight_layers(*compile_layers(engine))
+    return engine
+
+
+def day_layers(date):
+    """
+    (first minute, end minute, criterion) of every hour bucket of `date`, the
+    criterion being 'time' in the buckets where no line is slowed.
+    """
+    from metroversoApp.assets import serviceCalendar
+
+    if serviceCalendar.day_type(date) == 'sunday':
+        return ((0, 24 * 60, 'time'),)
+    return tuple((start * 60, end * 60, TIME_LAYERS[i] if i in SLOWED_BUCKETS else 'time')
+                 for i, (start, end) in enumerate(HOUR_BUCKETS))
+
+
+def time_layer(moment):
+    """
+    Criterion of the layer for a naive local datetime, or None when every
+    line runs at its SPEEDS speed then (Sundays, holidays, off-peak).
+    """
+    from metroversoApp.assets import serviceCalendar
+
+    if serviceCalendar.day_type(moment.date()) == 'sunday':
+        return None
+    bucket = bisect_right([start for start, _ in HOUR_BUCKETS], moment.hour) - 1
+    return TIME_LAYERS[bucket] if bucket in SLOWED_BUCKETS else None
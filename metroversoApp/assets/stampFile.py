@@ -0,0 +1,51 @@
+"""
+Stamp files: how a process tells the others that shared data changed.
+
+Some tables are kept in memory by every process (closures, prices). The
+process that changes one of them rewrites a small stamp file (write_stamp,
+an atomic rename), and every process compares the file with the stamp it
+loaded its copy at (read_stamp, one stat) and reloads when they differ.
+
+The files live in stamp_dir(): settings.METROVERSO_STAMP_DIR, else the
+METROVERSO_STAMP_DIR environment variable, else a 'metroverso' directory in
+the system temporary directory. Every process of a deployment has to see
+the same directory.
+"""
+import os
+import tempfile
+import uuid
+from pathlib import Path
+
+
+def stamp_dir():
+    """Directory of the stamp files."""
+    from django.conf import settings
+
+    directory = getattr(settings, 'METROVERSO_STAMP_DIR', None) if settings.configured else None
+    return Path(directory or os.environ.get('METROVERSO_STAMP_DIR') or Path(tempfile.gettempdir()) / 'metroverso')
+
+
+def stamp_path(name):
+    return stamp_dir() / f"{name}.stamp"
+
+
+def read_stamp(name):
+    """Identity of the stamp file `name` as it is now, or None if there is none."""
+    try:
+        stat = os.stat(stamp_path(name))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def write_stamp(name):
+    """Replaces the stamp file `name` with a new one. Raises OSError if it cannot be written."""
+    path = stamp_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp_path.write_text(uuid.uuid4().hex)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
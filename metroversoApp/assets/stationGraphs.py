@@ -3,6 +3,7 @@ from math import sqrt
 import math
 import json
 import datetime
+import os
 # import matplotlib.pyplot as plt
 # import matplotlib
 # matplotlib.use("TkAgg")
@@ -38,6 +39,7 @@ SPEEDS = {
     "X": 16,   # Metroplus línea 2
     "P": 19,   # Cable 
     "Z": 18,   # Cable 
+    "C": 15,   # Alimentadores (buses)
 }
 
 def add_station(G, station_id, coords, line_key="A"):
@@ -49,7 +51,9 @@ def add_station(G, station_id, coords, line_key="A"):
     - line_key: identificador de línea
     """
     lon, lat = coords
-    if station_id not in G:
+    # A transfer can create the node before its line is added (e.g. K00),
+    # so only skip stations that already have a position
+    if station_id not in G or 'pos' not in G.nodes[station_id]:
         G.add_node(station_id, pos=(lon, lat), line=line_key)
 
 def add_edge_time(G, coords_dict, u, v, line_key, stopTime=0.3):
@@ -74,7 +78,9 @@ def add_edge_time(G, coords_dict, u, v, line_key, stopTime=0.3):
 def add_transfer(G, u, v, walkTime=5):
     G.add_edge(u, v, weight=walkTime, time=walkTime, distance_km=0, speed_km=0, line='',transfer=1)  # solo caminata
 
-G = nx.Graph()
+# Feeder-bus routes (todas_las_rutas.geojson, see feederNetwork) add ~1500 stops
+# to the graph; they are only loaded when METROVERSO_FEEDER_NETWORK=1
+INCLUDE_FEEDER_NETWORK = os.environ.get("METROVERSO_FEEDER_NETWORK", "0") == "1"
 
 # Formato del id: A01 -- A(La línea a la que pertenece) + 01 (número de la estación según la API)
 lineaA = {
@@ -101,30 +107,11 @@ lineaA = {
     "A20": [-75.62644764544693, 6.152742930466616],  # La Estrella
 }
 
-#Nodos Linea A:
-for station_id, coords in lineaA.items():
-    add_station(G, station_id, coords, line_key="A")
-
-#Conexiones Linea A:
-
-for i in range(0, 20):  # De A01 a A30
-    origen = f"A{str(i).zfill(2)}"
-    destino = f"A{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaA, origen, destino, line_key="A")
-
 lineaL = {
     "L01": [-75.50297173, 6.281545751],  # Arvi
     "L00": [-75.54184763, 6.29272255],  # Santo Domingo
 }
 
-#Conexiones Linea L:
-
-#Nodos Linea L:
-for station_id, coords in lineaL.items():
-    add_station(G, station_id, coords, line_key="L")
-
-add_edge_time(G, lineaL, "L00", "L01", line_key="L")
-
 linea1 = {
     "M00": [-75.6092249, 6.230666882],  # UDM
     "M01": [-75.60516873, 6.231092741],  # Los Alpes
@@ -148,21 +135,6 @@ linea1 = {
     "M19": [-75.55665899, 6.285200132],  # Parque Aranjuez
 }
 
-#Nodos Linea 1:
-for station_id, coords in linea1.items():
-    add_station(G, station_id, coords, line_key="1")
-
-#Conexiones Linea 1:
-
-for i in range(0, 19):  # De M00 a M19
-    origen = f"M{str(i).zfill(2)}"
-    destino = f"M{str(i+1).zfill(2)}"
-    add_edge_time(G, linea1, origen, destino, line_key="M")
-
-add_transfer(G,"M07", "A13")
-add_transfer(G,"M13", "A07")
-
-
 linea2 = {
     "X00": [-75.6092249, 6.230666882],  # UDM
     "X01": [-75.60516873, 6.231092741],  # Los Alpes
@@ -187,38 +159,6 @@ linea2 = {
     "X20": [-75.55665899, 6.285200132],  # Parque Aranjuez
 }
 
-#Nodos Linea 2:
-for station_id, coords in linea2.items():
-    add_station(G, station_id, coords, line_key="2")
-
-#Conexiones Linea 2:
-
-for i in range(0, 20):  # De X00 a X20
-    origen = f"X{str(i).zfill(2)}"
-    destino = f"X{str(i+1).zfill(2)}"
-    add_edge_time(G, linea2, origen, destino, line_key="X")
-
-add_transfer(G,"X07","A13")
-
-# Transferencias de peso mínimo entre líneas M (1) y X (2) - Estaciones compartidas
-# Nota: Usamos walkTime=0.01 en vez de 0 para evitar que el algoritmo tome rutas ilógicas
-add_transfer(G, "M00", "X00", walkTime=0.01)  # UDM
-add_transfer(G, "M01", "X01", walkTime=0.01)  # Los Alpes
-add_transfer(G, "M02", "X02", walkTime=0.01)  # La Palma
-add_transfer(G, "M03", "X03", walkTime=0.01)  # Parque Belén
-add_transfer(G, "M04", "X04", walkTime=0.01)  # Rosales
-add_transfer(G, "M05", "X05", walkTime=0.01)  # Fátima
-add_transfer(G, "M06", "X06", walkTime=0.01)  # Nutibara
-add_transfer(G, "M07", "X07", walkTime=0.01)  # Industriales
-
-# Transferencias de peso mínimo entre líneas M (1) y X (2) - Estaciones compartidas al final
-add_transfer(G, "M14", "X15", walkTime=0.01)  # Palos Verdes
-add_transfer(G, "M15", "X16", walkTime=0.01)  # Gardel
-add_transfer(G, "M16", "X17", walkTime=0.01)  # Manrique
-add_transfer(G, "M17", "X18", walkTime=0.01)  # Las Esmeraldas
-add_transfer(G, "M18", "X19", walkTime=0.01)  # Berlín
-add_transfer(G, "M19", "X20", walkTime=0.01)  # Parque Aranjuez
-
 lineaB = {
     "B00": [-75.56967864286219, 6.247175927579917], #San Antonio
     "B01": [-75.57686314607379, 6.249639285618355], # Cisneros
@@ -228,20 +168,6 @@ lineaB = {
     "B05": [-75.60374625, 6.25808821],  # Santa Lucía
     "B06": [-75.6136642, 6.256780931],  # San Javier
 }
-#Nodos Linea B:
-for station_id, coords in lineaB.items():
-    add_station(G, station_id, coords, line_key="B")
-
-#Conexiones Linea B:
-
-for i in range(0, 6):  # De B00 a B06
-    origen = f"B{str(i).zfill(2)}"
-    destino = f"B{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaB, origen, destino, line_key="B")
-
-add_transfer(G,"B00","A10")
-add_transfer(G,"M09","B01")
-
 
 lineaT = {
     "T00": [-75.56967864286219, 6.247175927579917], #San Antonio
@@ -255,40 +181,12 @@ lineaT = {
     "T08": [-75.54013974, 6.233150212], # Oriente
 }
 
-#Nodos Linea T:
-for station_id, coords in lineaT.items():
-    add_station(G, station_id, coords, line_key="T")
-
-#Conexiones Linea T:
-
-for i in range(0, 8):  # De T00 a T08
-    origen = f"T{str(i).zfill(2)}"
-    destino = f"T{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaT, origen, destino, line_key="T")
-
-add_transfer(G,"T00", "A10")
-add_transfer(G,"B00", "T00")
-
 lineaZ = {
     "Z00": [-75.54900339, 6.241387875], # Miraflores
     "Z01": [-75.54447595, 6.24526309],  # El Pinal
     "Z02": [-75.5413945, 6.24761518],   # 13 de Noviembre
 }
 
-#Nodos Linea Z:
-for station_id, coords in lineaZ.items():
-    add_station(G, station_id, coords, line_key="Z")
-
-
-#Conexiones Linea Z:
-
-for i in range(0, 2):  # De Z00 a Z02
-    origen = f"Z{str(i).zfill(2)}"
-    destino = f"Z{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaZ, origen, destino, line_key="Z")
-
-add_transfer(G,"Z00", "T05")
-
 lineaJ = {
     "J00": [-75.61420338, 6.281093175], # La Aurora
     "J01": [-75.61401716, 6.275360769], # Vallejuelos
@@ -296,38 +194,12 @@ lineaJ = {
     "J03": [-75.6136642, 6.256780931],  # San Javier
 }
 
-#Nodos Linea J:
-for station_id, coords in lineaJ.items():
-    add_station(G, station_id, coords, line_key="J")
-
-#Conexiones Linea J:
-
-for i in range(0, 3):  # De J00 a J03   
-    origen = f"J{str(i).zfill(2)}"
-    destino = f"J{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaJ, origen, destino, line_key="J")
-
-add_transfer(G,"J03","B06")
-
 lineaH = {
     "H00": [-75.54013974, 6.233150212], # Oriente
     "H01": [-75.53637212, 6.236645415], # Las Torres
     "H02": [-75.52867948, 6.234874544], # Villa Sierra
 }
 
-#Nodos Linea H:
-for station_id, coords in lineaH.items():
-    add_station(G, station_id, coords, line_key="H")
-
-#Conexiones Linea H:
-
-for i in range(0, 2):  # De H00 a H02
-    origen = f"H{str(i).zfill(2)}"
-    destino = f"H{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaH, origen, destino, line_key="H")
-
-add_transfer(G,"H00","T08")
-
 lineaO = {
     "O00": [-75.57036193058795, 6.277513430075575], #Caribe
     "O01": [-75.57316774, 6.276849813], # Cementerio Universal
@@ -345,22 +217,6 @@ lineaO = {
     "O13": [-75.602100596521,6.232430791047558 ],  # La Palma
 }
 
-#Nodos Linea O:
-for station_id, coords in lineaO.items():
-    add_station(G, station_id, coords, line_key="O")
-
-#Conexiones Linea O:
-
-for i in range(0, 13):  # De O01 a O13
-    origen = f"O{str(i).zfill(2)}"
-    destino = f"O{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaO, origen, destino, line_key="O")
-
-add_transfer(G,"O00","A05")
-add_transfer(G,"O08","B04")
-add_transfer(G,"O13","M02")
-add_transfer(G,"O13","X02")
-
 lineaP = {
     "P00": [-75.55851194186361, 6.299961957796953],  # Acevedo
     "P01": [-75.5673189, 6.301882672], # Sena Pedregal
@@ -368,21 +224,6 @@ lineaP = {
     "P03": [-75.58233359, 6.30599902], # El progreso
 }
 
-#Nodos Linea P:
-for station_id, coords in lineaP.items():
-    add_station(G, station_id, coords, line_key="P")
-
-
-#Conexiones Linea P:
-
-for i in range(0, 3):  # De P00 a P03   
-    origen = f"P{str(i).zfill(2)}"
-    destino = f"P{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaP, origen, destino, line_key="P")
-
-add_transfer(G,"P00","A03")
-add_transfer(G, "P00", "K00")
-
 lineaK = {
     "K00": [-75.55851194186361, 6.299961957796953],  # Acevedo
     "K01": [-75.55189694, 6.296272054], # Andalucía
@@ -390,22 +231,201 @@ lineaK = {
     "K03": [-75.54184763, 6.29272255],  # Santo Domingo
 }
 
-#Nodos Linea K:
-for station_id, coords in lineaK.items():
-    add_station(G, station_id, coords, line_key="K")
+def build_graph():
+    """
+    Builds the station graph from the line dictionaries above.
+    Nodes carry pos=(lon, lat) and line; edges carry weight, time,
+    distance_km, speed_kmh, line and transfer.
+    """
+    G = nx.Graph()
+
+    #Nodos Linea A:
+    for station_id, coords in lineaA.items():
+        add_station(G, station_id, coords, line_key="A")
+
+    #Conexiones Linea A:
+
+    for i in range(0, 20):  # De A01 a A30
+        origen = f"A{str(i).zfill(2)}"
+        destino = f"A{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaA, origen, destino, line_key="A")
+
+    #Conexiones Linea L:
+
+    #Nodos Linea L:
+    for station_id, coords in lineaL.items():
+        add_station(G, station_id, coords, line_key="L")
+
+    add_edge_time(G, lineaL, "L00", "L01", line_key="L")
 
+    #Nodos Linea 1:
+    for station_id, coords in linea1.items():
+        add_station(G, station_id, coords, line_key="1")
 
-#Conexiones Linea K:
+    #Conexiones Linea 1:
 
-for i in range(0, 3):  # De K00 a K03
-    origen = f"K{str(i).zfill(2)}"
-    destino = f"K{str(i+1).zfill(2)}"
-    add_edge_time(G, lineaK, origen, destino, line_key="K")
+    for i in range(0, 19):  # De M00 a M19
+        origen = f"M{str(i).zfill(2)}"
+        destino = f"M{str(i+1).zfill(2)}"
+        add_edge_time(G, linea1, origen, destino, line_key="M")
 
-add_transfer(G,"K00", "A03")
-add_transfer(G, "K00", "P00")
-add_transfer(G,"K03", "L00")
+    add_transfer(G,"M07", "A13")
+    add_transfer(G,"M13", "A07")
 
+    #Nodos Linea 2:
+    for station_id, coords in linea2.items():
+        add_station(G, station_id, coords, line_key="2")
+
+    #Conexiones Linea 2:
+
+    for i in range(0, 20):  # De X00 a X20
+        origen = f"X{str(i).zfill(2)}"
+        destino = f"X{str(i+1).zfill(2)}"
+        add_edge_time(G, linea2, origen, destino, line_key="X")
+
+    add_transfer(G,"X07","A13")
+
+    # Transferencias de peso mínimo entre líneas M (1) y X (2) - Estaciones compartidas
+    # Nota: Usamos walkTime=0.01 en vez de 0 para evitar que el algoritmo tome rutas ilógicas
+    add_transfer(G, "M00", "X00", walkTime=0.01)  # UDM
+    add_transfer(G, "M01", "X01", walkTime=0.01)  # Los Alpes
+    add_transfer(G, "M02", "X02", walkTime=0.01)  # La Palma
+    add_transfer(G, "M03", "X03", walkTime=0.01)  # Parque Belén
+    add_transfer(G, "M04", "X04", walkTime=0.01)  # Rosales
+    add_transfer(G, "M05", "X05", walkTime=0.01)  # Fátima
+    add_transfer(G, "M06", "X06", walkTime=0.01)  # Nutibara
+    add_transfer(G, "M07", "X07", walkTime=0.01)  # Industriales
+
+    # Transferencias de peso mínimo entre líneas M (1) y X (2) - Estaciones compartidas al final
+    add_transfer(G, "M14", "X15", walkTime=0.01)  # Palos Verdes
+    add_transfer(G, "M15", "X16", walkTime=0.01)  # Gardel
+    add_transfer(G, "M16", "X17", walkTime=0.01)  # Manrique
+    add_transfer(G, "M17", "X18", walkTime=0.01)  # Las Esmeraldas
+    add_transfer(G, "M18", "X19", walkTime=0.01)  # Berlín
+    add_transfer(G, "M19", "X20", walkTime=0.01)  # Parque Aranjuez
+
+    #Nodos Linea B:
+    for station_id, coords in lineaB.items():
+        add_station(G, station_id, coords, line_key="B")
+
+    #Conexiones Linea B:
+
+    for i in range(0, 6):  # De B00 a B06
+        origen = f"B{str(i).zfill(2)}"
+        destino = f"B{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaB, origen, destino, line_key="B")
+
+    add_transfer(G,"B00","A10")
+    add_transfer(G,"M09","B01")
+
+    #Nodos Linea T:
+    for station_id, coords in lineaT.items():
+        add_station(G, station_id, coords, line_key="T")
+
+    #Conexiones Linea T:
+
+    for i in range(0, 8):  # De T00 a T08
+        origen = f"T{str(i).zfill(2)}"
+        destino = f"T{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaT, origen, destino, line_key="T")
+
+    add_transfer(G,"T00", "A10")
+    add_transfer(G,"B00", "T00")
+
+    #Nodos Linea Z:
+    for station_id, coords in lineaZ.items():
+        add_station(G, station_id, coords, line_key="Z")
+
+    #Conexiones Linea Z:
+
+    for i in range(0, 2):  # De Z00 a Z02
+        origen = f"Z{str(i).zfill(2)}"
+        destino = f"Z{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaZ, origen, destino, line_key="Z")
+
+    add_transfer(G,"Z00", "T05")
+
+    #Nodos Linea J:
+    for station_id, coords in lineaJ.items():
+        add_station(G, station_id, coords, line_key="J")
+
+    #Conexiones Linea J:
+
+    for i in range(0, 3):  # De J00 a J03   
+        origen = f"J{str(i).zfill(2)}"
+        destino = f"J{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaJ, origen, destino, line_key="J")
+
+    add_transfer(G,"J03","B06")
+
+    #Nodos Linea H:
+    for station_id, coords in lineaH.items():
+        add_station(G, station_id, coords, line_key="H")
+
+    #Conexiones Linea H:
+
+    for i in range(0, 2):  # De H00 a H02
+        origen = f"H{str(i).zfill(2)}"
+        destino = f"H{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaH, origen, destino, line_key="H")
+
+    add_transfer(G,"H00","T08")
+
+    #Nodos Linea O:
+    for station_id, coords in lineaO.items():
+        add_station(G, station_id, coords, line_key="O")
+
+    #Conexiones Linea O:
+
+    for i in range(0, 13):  # De O01 a O13
+        origen = f"O{str(i).zfill(2)}"
+        destino = f"O{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaO, origen, destino, line_key="O")
+
+    add_transfer(G,"O00","A05")
+    add_transfer(G,"O08","B04")
+    add_transfer(G,"O13","M02")
+    add_transfer(G,"O13","X02")
+
+    #Nodos Linea P:
+    for station_id, coords in lineaP.items():
+        add_station(G, station_id, coords, line_key="P")
+
+    #Conexiones Linea P:
+
+    for i in range(0, 3):  # De P00 a P03   
+        origen = f"P{str(i).zfill(2)}"
+        destino = f"P{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaP, origen, destino, line_key="P")
+
+    add_transfer(G,"P00","A03")
+    add_transfer(G, "P00", "K00")
+
+    #Nodos Linea K:
+    for station_id, coords in lineaK.items():
+        add_station(G, station_id, coords, line_key="K")
+
+    #Conexiones Linea K:
+
+    for i in range(0, 3):  # De K00 a K03
+        origen = f"K{str(i).zfill(2)}"
+        destino = f"K{str(i+1).zfill(2)}"
+        add_edge_time(G, lineaK, origen, destino, line_key="K")
+
+    add_transfer(G,"K00", "A03")
+    add_transfer(G, "K00", "P00")
+    add_transfer(G,"K03", "L00")
+
+    #Alimentadores:
+    if INCLUDE_FEEDER_NETWORK:
+        from metroversoApp.assets.feederNetwork import add_feeder_network
+        add_feeder_network(G)
+
+    return G
+
+
+# The feeder routes below are now read from todas_las_rutas.geojson by
+# feederNetwork.add_feeder_network (see INCLUDE_FEEDER_NETWORK).
 # # Alimentadores:
 
 # C6_001 = {
@@ -2359,34 +2379,27 @@ add_transfer(G,"K03", "L00")
 #     destino = f"C3-003RLC-{str(i + 1).zfill(4)}"
 #     G.add_edge(origen, destino, weight=euclidiana(C3_003RLC[origen], C3_003RLC[destino]))
 
-rute = nx.dijkstra_path(G, source="M00", target="J00", weight="transfer")
-distancia = nx.dijkstra_path_length(G, source="M00", target="J00", weight="transfer")
+# The station graph is loaded from the compiled network snapshot when it is up
+# to date, otherwise it is built from the dictionaries above.
+# To refresh the snapshot: python -m metroversoApp.assets.networkSnapshot
+from metroversoApp.assets.networkSnapshot import load_network
 
-print("Rute:", rute)
-print("Distance:", round(distancia, 2), "minutes")
+G = load_network(build_graph, options={'feeder_network': INCLUDE_FEEDER_NETWORK})
 
 
 # --- UTILITIES FOR SCHEDULE AND DATES ---
 
 def _service_window(start_time: datetime.datetime):
-    """Returns (open_time, close_time) according to the day of start_time."""
-    if start_time.weekday() == 6:  # Sunday
-        open_time  = start_time.replace(hour=5,  minute=0, second=0, microsecond=0)
-        close_time = start_time.replace(hour=22, minute=0, second=0, microsecond=0)
-    else:  # Monday to Saturday
-        open_time  = start_time.replace(hour=4,  minute=30, second=0, microsecond=0)
-        close_time = start_time.replace(hour=23, minute=00, second=0, microsecond=0)
-    return open_time, close_time
+    """Returns (open_time, close_time) according to the day of start_time (see serviceCalendar)."""
+    from metroversoApp.assets import serviceCalendar
+
+    return serviceCalendar.service_window(start_time)
 
 def _arvi_service_window(start_time: datetime.datetime):
     """Returns (open_time, close_time) for Arvi station according to the day of start_time."""
-    if start_time.weekday() == 6:  # Sunday
-        open_time  = start_time.replace(hour=8,  minute=30, second=0, microsecond=0)
-        close_time = start_time.replace(hour=18, minute=0, second=0, microsecond=0)
-    else:  # Monday to Saturday
-        open_time  = start_time.replace(hour=9,  minute=0, second=0, microsecond=0)
-        close_time = start_time.replace(hour=18, minute=0, second=0, microsecond=0)
-    return open_time, close_time
+    from metroversoApp.assets import serviceCalendar
+
+    return serviceCalendar.service_window(start_time, serviceCalendar.STATION_SERVICES['L01'])
 
 def _now():
     """
@@ -2454,17 +2467,12 @@ def can_make_trip(start_time: datetime.datetime, trip_duration_min: int, route=N
     Returns True if a trip of 'trip_duration_min' starting at 'start_time'
     both starts and ends within the metro operating hours.
     
-    If route includes Arvi station (L02), applies Arvi specific schedule.
+    If route includes Arvi station (L01), applies Arvi specific schedule, and
+    Sundays' hours on holidays (serviceCalendar).
     """
-    # Check if route includes Arvi station
-    if route and _route_includes_arvi(route):
-        open_time, close_time = _arvi_service_window(start_time)
-    else:
-        open_time, close_time = _service_window(start_time)
-    
-    end_time = start_time + datetime.timedelta(minutes=trip_duration_min)
-    result = (start_time >= open_time) and (end_time <= close_time)
-    return result
+    from metroversoApp.assets import serviceCalendar
+
+    return bool(serviceCalendar.check_trips([start_time], [trip_duration_min], [route or ()])[0])
 
 def can_make_trip_now_duration(trip_duration_min: int) -> bool:
     """
@@ -2473,14 +2481,26 @@ def can_make_trip_now_duration(trip_duration_min: int) -> bool:
     start_time = _now()
     return can_make_trip(start_time, trip_duration_min)
 
-def can_make_trip_now_graph(G: nx.Graph, source: str, target: str) -> bool:
+def can_make_trip_now_graph(G: nx.Graph, source: str, target: str, route_result=None) -> bool:
     """
     Calculates duration with Dijkstra (using already penalized weights in G)
     and evaluates against the current backend time. Returns bool.
+    If a RouteResult from functions.find_route is given, its path and duration
+    are used and no search is done. Otherwise the precomputed route tables are
+    used when G is the station graph.
     """
+    from metroversoApp.assets import routeTable
+
+    if route_result is not None:
+        return route_result.check_service_window()
+
     try:
-        trip_duration_min = nx.dijkstra_path_length(G, source=source, target=target, weight="weight")
-        route = nx.dijkstra_path(G, source=source, target=target, weight="weight")
+        if G is globals()['G'] and routeTable.has_table("weight"):
+            trip_duration_min = routeTable.get_route_length(source, target, "weight")
+            route = routeTable.get_route(source, target, "weight")
+        else:
+            trip_duration_min = nx.dijkstra_path_length(G, source=source, target=target, weight="weight")
+            route = nx.dijkstra_path(G, source=source, target=target, weight="weight")
     except nx.NetworkXNoPath:
         print(f"No path found between {source} and {target}")
         return False
@@ -0,0 +1,146 @@
+"""
+Read-only registry of station metadata.
+
+Every node of stationGraphs.G gets an integer index (the same order as
+G.nodes() and the routing engine) and the registry keeps, per index:
+- coords: [lon, lat] as shown on the map (the line dictionaries first, then
+  the node position; None if the station has neither). The same list object
+  is returned every time, so building a route response does not copy it.
+- line: the line of the node in G.
+- name, type and model line from the Station table (None for nodes without
+  a Station row, e.g. feeder stops). Station rows that are not in the graph
+  are kept aside so station_fields() still finds them.
+
+The geometry is built from G on first use; the Station fields are read from
+the database once, on the first lookup that needs them, and again after a
+Station is saved or deleted (see metroversoApp.signals).
+"""
+import threading
+
+import numpy as np
+
+
+class StationRegistry:
+    """Station metadata stored in parallel tuples indexed by station index."""
+
+    def __init__(self, graph, line_coords):
+        self.ids = tuple(graph.nodes())
+        self.index = {station: i for i, station in enumerate(self.ids)}
+
+        coords = []
+        for station, data in graph.nodes(data=True):
+            found = None
+            for mapping in line_coords:
+                if station in mapping:
+                    found = mapping[station]  # later dictionaries win, like {**a, **b}
+            if found is None and 'pos' in data:
+                # Feeder stops are not in the line dictionaries
+                found = list(data['pos'])
+            coords.append(found)
+        self.coords = tuple(coords)
+        self.positions = np.array(
+            [c if c is not None else (np.nan, np.nan) for c in coords], dtype=np.float64
+        ).reshape(-1, 2)
+        self.positions.flags.writeable = False
+        self.lines = tuple(data.get('line') for _, data in graph.nodes(data=True))
+
+        self._lock = threading.Lock()
+        self._model_fields = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, station):
+        return station in self.index
+
+    def _fields(self):
+        """
+        (names, types, model_lines, has_row, other_rows), read from Station on
+        first use. The tuples are indexed by station index; other_rows maps
+        the ids of Station rows that are not in the graph to their fields.
+        """
+        fields = self._model_fields
+        if fields is None:
+            with self._lock:
+                if self._model_fields is None:
+                    from metroversoApp.models import Station
+
+                    rows = {row[0]: row for row in Station.objects.values_list('id_station', 'name', 'line', 'type')}
+                    self._model_fields = (
+                        tuple(rows[s][1] if s in rows else None for s in self.ids),
+                        tuple(rows[s][3] if s in rows else None for s in self.ids),
+                        tuple(rows[s][2] if s in rows else None for s in self.ids),
+                        tuple(s in rows for s in self.ids),
+                        {s: {'id': s, 'name': name, 'line': line, 'type': type_}
+                         for s, name, line, type_ in rows.values() if s not in self.index},
+                    )
+                fields = self._model_fields
+        return fields
+
+    def reload_model_fields(self):
+        """Forgets the Station fields; they are read again on the next lookup."""
+        with self._lock:
+            self._model_fields = None
+
+    def coordinates(self, station):
+        """[lon, lat] of `station` or None. The list is shared and must not be modified."""
+        i = self.index.get(station)
+        return self.coords[i] if i is not None else None
+
+    def has_station_row(self, station):
+        """True if `station` has a row in the Station table."""
+        i = self.index.get(station)
+        if i is None:
+            return station in self._fields()[4]
+        return self._fields()[3][i]
+
+    def name(self, station, default=None):
+        """Display name from the Station table, or `default` (the id if not given)."""
+        i = self.index.get(station)
+        if i is not None:
+            name = self._fields()[0][i]
+        else:
+            name = self._fields()[4].get(station, {}).get('name')
+        if name is None:
+            return station if default is None else default
+        return name
+
+    def station_fields(self, station):
+        """{'id', 'name', 'line', 'type'} like a Station row, or None if there is no row."""
+        names, types, model_lines, has_row, other_rows = self._fields()
+        i = self.index.get(station)
+        if i is None:
+            return other_rows.get(station)
+        if not has_row[i]:
+            return None
+        return {'id': station, 'name': names[i], 'line': model_lines[i], 'type': types[i]}
+
+
+_registry = None
+_registry_graph = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Returns the registry for the current stationGraphs.G, building it on first use."""
+    global _registry, _registry_graph
+    from metroversoApp.assets import stationGraphs
+
+    graph = stationGraphs.G
+    registry = _registry
+    if registry is None or _registry_graph is not graph:
+        with _registry_lock:
+            if _registry is None or _registry_graph is not graph:
+                line_coords = (stationGraphs.lineaA, stationGraphs.linea1, stationGraphs.linea2, stationGraphs.lineaL,
+                               stationGraphs.lineaB, stationGraphs.lineaT, stationGraphs.lineaZ, stationGraphs.lineaJ,
+                               stationGraphs.lineaH, stationGraphs.lineaO, stationGraphs.lineaP, stationGraphs.lineaK)
+                _registry = StationRegistry(graph, line_coords)
+                _registry_graph = graph
+            registry = _registry
+    return registry
+
+
+def reload_station_fields():
+    """Called when a Station row changes."""
+    if _registry is not None:
+        _registry.reload_model_fields()
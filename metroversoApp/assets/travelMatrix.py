@@ -0,0 +1,244 @@
+"""
+Dense station x station matrices of travel time, transfers and fares.
+
+For one criterion the shortest-path trees of every station (the route
+tables, or one CSR Dijkstra per station when the network is too large for
+them) give the route between every pair. Instead of walking each route, the
+values are propagated down the trees with NumPy: all the pairs whose route
+has k hops are computed together from the pairs with k - 1 hops, for
+every source at once. The fare automaton of functions (get_route_pricing_package)
+is run the same way, one transition per hop.
+
+The result is served as an .npz file (numpy.load) with one array per column:
+    stations      (n,)       station ids, the row/column order
+    cost          (n, n)     cost for the criterion
+    time_minutes  (n, n)     travel time along that route (inf if unreachable)
+    transfers     (n, n)     walking transfers on the route (-1 if unreachable)
+    packages      (n, n, k)  fare packages in order, padded with -1
+    price         (n, n)     price of those packages for the profile (nan if unreachable)
+The matrices follow the active closures (closures.routing_engine). The files
+are cached per ETag, which changes with the graph version, the closures, the
+criterion and the prices of the profile.
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MATRIX_CACHE_ENTRIES = 4
+
+_lock = threading.Lock()
+# etag -> npz bytes
+_files = OrderedDict()
+
+
+def _trees(engine, criterion):
+    """(pred, length) n x n matrices for `criterion`: the route table, or one Dijkstra per station."""
+    from metroversoApp.assets import routeTable
+
+    table = routeTable.get_table(criterion, engine)
+    if table is not None:
+        return table['pred'], table['length']
+
+    n = engine.number_of_nodes
+    pred = np.full((n, n), -1, dtype=np.int32)
+    length = np.full((n, n), np.inf, dtype=np.float64)
+    for source in range(n):
+        dist, parents, _, order = engine.dijkstra(source, criterion)
+        pred[source] = parents
+        # Every reachable node is settled, so the other costs are inf
+        length[source, order] = np.asarray(dist)[order]
+    return pred, length
+
+
+def _tree_layers(pred):
+    """
+    Yields (pairs, parents) layer by layer: the flat indices (source * n +
+    target) of the pairs whose route has 1, 2, ... hops, and the flat index
+    of the pair (source, parent of target) each one extends.
+    """
+    n = len(pred)
+    parent = (np.arange(n, dtype=np.int64)[:, None] * n + pred).ravel()
+    known = np.zeros(n * n, dtype=bool)
+    known[np.arange(n) * (n + 1)] = True
+    remaining = np.flatnonzero(pred.ravel() >= 0)
+    while remaining.size:
+        ready = known[parent[remaining]]
+        layer = remaining[ready]
+        yield layer, parent[layer]
+        known[layer] = True
+        remaining = remaining[~ready]
+
+
+def _arc_lookup(engine):
+    """Returns a function mapping arrays of (tail, head) ids to arc positions."""
+    n = engine.number_of_nodes
+    tails = np.repeat(np.arange(n, dtype=np.int64), np.diff(engine.indptr))
+    keys = tails * n + engine.indices
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    def lookup(tail, head):
+        return order[np.searchsorted(sorted_keys, tail * n + head)]
+
+    return lookup
+
+
+def _fare_columns(engine):
+    """Column of the fare automaton for every station (-1 for unknown lines)."""
+    from metroversoApp.assets.functions import ARVI_STATION, _ARVI_COLUMN, _FARE_COLUMN
+
+    return np.array(
+        [_ARVI_COLUMN if station == ARVI_STATION else _FARE_COLUMN.get(station[:1], -1) for station in engine.node_ids],
+        dtype=np.int64,
+    )
+
+
+def compute_matrices(engine=None, criterion="time"):
+    """
+    Returns {'stations', 'cost', 'time_minutes', 'transfers', 'packages'} for
+    every pair of stations of `engine` (defaults to the routing engine).
+    """
+    from metroversoApp.assets import closures
+    from metroversoApp.assets.functions import _FARE_NEXT, _FARE_EMIT, _FARE_FINAL
+
+    if engine is None:
+        engine = closures.routing_engine()
+    n = engine.number_of_nodes
+    pred, length = _trees(engine, criterion)
+    arc_of = _arc_lookup(engine)
+    time_weights = engine.weights['time']
+    arc_transfer = engine.arc_transfer.astype(np.int16)
+    columns = _fare_columns(engine)
+    fare_next = np.array(_FARE_NEXT, dtype=np.int64)
+    fare_emit = np.array(_FARE_EMIT, dtype=np.int64)
+    fare_final = np.array(_FARE_FINAL, dtype=np.int64)
+
+    time_minutes = np.full(n * n, np.inf, dtype=np.float64)
+    transfers = np.full(n * n, -1, dtype=np.int16)
+    # Fare automaton per pair: state, last transport counted and packages charged so far
+    state = np.zeros(n * n, dtype=np.int64)
+    previous = np.full(n * n, -1, dtype=np.int64)
+    packages = np.full((n * n, 4), -1, dtype=np.int8)
+    count = np.zeros(n * n, dtype=np.int64)
+
+    def charge(pairs, charged):
+        """Appends the packages >= 0 in `charged` to the packages of `pairs`."""
+        nonlocal packages
+        mask = charged >= 0
+        pairs, charged = pairs[mask], charged[mask]
+        if not pairs.size:
+            return
+        slots = count[pairs]
+        if slots.max() >= packages.shape[1]:
+            packages = np.pad(packages, ((0, 0), (0, packages.shape[1])), constant_values=-1)
+        packages[pairs, slots] = charged
+        count[pairs] = slots + 1
+
+    def fare_step(pairs, parent_state, parent_previous, column):
+        """One transition for `pairs` from their parents' state; returns the packages charged."""
+        # Unknown lines are ignored and consecutive stops on the same transport count once
+        skip = (column < 0) | (column == parent_previous)
+        safe_column = np.where(skip, 0, column)
+        state[pairs] = np.where(skip, parent_state, fare_next[parent_state, safe_column])
+        previous[pairs] = np.where(skip, parent_previous, column)
+        return np.where(skip, -1, fare_emit[parent_state, safe_column])
+
+    # The route from a station to itself is the station alone
+    diagonal = np.arange(n, dtype=np.int64) * (n + 1)
+    time_minutes[diagonal] = 0.0
+    transfers[diagonal] = 0
+    charge(diagonal, fare_step(diagonal, np.zeros(n, dtype=np.int64), np.full(n, -1, dtype=np.int64), columns))
+
+    for pairs, parents in _tree_layers(pred):
+        heads = pairs % n
+        arcs = arc_of(parents % n, heads)
+        time_minutes[pairs] = time_minutes[parents] + time_weights[arcs]
+        transfers[pairs] = transfers[parents] + arc_transfer[arcs]
+        packages[pairs] = packages[parents]
+        count[pairs] = count[parents]
+        charge(pairs, fare_step(pairs, state[parents], previous[parents], columns[heads]))
+
+    reachable = np.flatnonzero(np.isfinite(length.ravel()))
+    charge(reachable, fare_final[state[reachable]])
+    packages = packages[:, :max(int(count.max()), 1)]
+
+    return {
+        'stations': np.array(engine.node_ids),
+        'cost': length.astype(np.float32),
+        'time_minutes': time_minutes.reshape(n, n).astype(np.float32),
+        'transfers': transfers.reshape(n, n),
+        'packages': packages.reshape(n, n, -1),
+    }
+
+
+# (graph version, criterion) -> compute_matrices() result
+_matrices = {}
+
+
+def _package_prices(profile):
+    """Price of every fare package for `profile`, indexed by package id (0 without a price)."""
+    from metroversoApp.assets import priceTable
+    from metroversoApp.assets.functions import FARE_PATTERNS
+
+    lookup = np.zeros(max(package for _, package in FARE_PATTERNS) + 1, dtype=np.float64)
+    for package in range(len(lookup)):
+        price = priceTable.get_price(package, profile)
+        if price is not None:
+            lookup[package] = float(price)
+    return lookup
+
+
+def matrix_etag(criterion, profile):
+    """
+    ETag of the matrix file: changes with the graph version, the active
+    closures, the criterion and the profile's prices.
+    """
+    from metroversoApp.assets import closures, priceTable
+
+    digest = hashlib.sha1(f"{closures.routing_engine().version}|{criterion}|{priceTable.normalize_profile(profile)}".encode())
+    digest.update(_package_prices(profile).tobytes())
+    return digest.hexdigest()[:20]
+
+
+def get_matrices(criterion="time"):
+    """compute_matrices() for the routing engine, computed once per engine version and criterion."""
+    from metroversoApp.assets import closures
+
+    engine = closures.routing_engine()
+    key = (engine.version, criterion)
+    with _lock:
+        matrices = _matrices.get(key)
+    if matrices is None:
+        matrices = compute_matrices(engine, criterion)
+        with _lock:
+            for stale in [k for k in _matrices if k[0] != key[0]]:
+                del _matrices[stale]
+            _matrices[key] = matrices
+    return matrices
+
+
+def matrix_file(criterion="time", profile="Frecuente"):
+    """Returns (etag, npz bytes) of the matrices of `criterion` priced for `profile`."""
+    etag = matrix_etag(criterion, profile)
+    with _lock:
+        data = _files.get(etag)
+        if data is not None:
+            _files.move_to_end(etag)
+            return etag, data
+
+    matrices = get_matrices(criterion)
+    packages = matrices['packages']
+    price = np.where(packages >= 0, _package_prices(profile)[np.maximum(packages, 0)], 0.0).sum(axis=-1)
+    price[~np.isfinite(matrices['cost'])] = np.nan
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, price=price.astype(np.float32), **matrices)
+    data = buffer.getvalue()
+    with _lock:
+        _files[etag] = data
+        while len(_files) > MATRIX_CACHE_ENTRIES:
+            _files.popitem(last=False)
+    return etag, data
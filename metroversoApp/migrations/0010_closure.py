@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metroversoApp', '0009_rename_perfil_package_profile_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Closure',
+            fields=[
+                ('id_closure', models.AutoField(primary_key=True, serialize=False)),
+                ('station', models.CharField(max_length=20)),
+                ('other_station', models.CharField(blank=True, max_length=20)),
+                ('starts_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['starts_at'],
+            },
+        ),
+    ]
@@ -40,6 +40,28 @@ class Station(models.Model):
     line = models.CharField(max_length=1)
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
 
+class Closure(models.Model):
+    """
+    A station, or the connection between two stations, that routing must not
+    use between starts_at and ends_at (until it is deleted if ends_at is empty).
+    Stations are graph ids, so feeder stops can be closed too.
+    """
+    id_closure = models.AutoField(primary_key=True)
+    station = models.CharField(max_length=20)
+    # Set to close only the connection station - other_station
+    other_station = models.CharField(max_length=20, blank=True)
+    starts_at = models.DateTimeField(default=timezone.now)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    reason = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['starts_at']
+
+    def __str__(self):
+        target = f"{self.station} - {self.other_station}" if self.other_station else self.station
+        return f"{target}: {self.reason}" if self.reason else target
+
 class Route(models.Model):
     CRITERION_CHOICES = [
         ("tiempo", "Tiempo"),
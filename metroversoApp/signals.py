@@ -0,0 +1,35 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Closure, Package, Station
+
+
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Package)
+def package_changed(sender, instance, **kwargs):
+    """
+    Reloads the in-memory price table on the next lookup, and drops the
+    cached route responses since they include prices.
+    """
+    from .assets import priceTable, routeCache
+
+    priceTable.invalidate()
+    routeCache.invalidate()
+
+
+@receiver(post_save, sender=Station)
+@receiver(post_delete, sender=Station)
+def station_changed(sender, instance, **kwargs):
+    """Reloads the station names, lines and types of the registry on the next lookup."""
+    from .assets import stationRegistry
+
+    stationRegistry.reload_station_fields()
+
+
+@receiver(post_save, sender=Closure)
+@receiver(post_delete, sender=Closure)
+def closure_changed(sender, instance, **kwargs):
+    """Makes every process reload the closures on its next routing call."""
+    from .assets import closures
+
+    closures.notify_changed()
@@ -20,6 +20,29 @@ function closestPoints(userPoint, radius) {
     }
 }
 
+// Same result as closestPoints, from the server-side spatial index (/view/nearest).
+// Falls back to closestPoints if the request fails.
+async function fetchClosestPoints(userPoint, radius) {
+    const [lon, lat] = userPoint.geometry.coordinates;
+    try {
+        // closestPoints widens the radius up to 10 km before giving up
+        const maxKm = Math.max(radius, 10000) / 1000;
+        const res = await fetch(`/view/nearest?lon=${lon}&lat=${lat}&k=3&max_km=${maxKm}`);
+        if (res.ok) {
+            const data = await res.json();
+            return (data.results?.[0] || [])
+                .map((s) => {
+                    const f = featureCollection.features.find((p) => p.properties.ID === s.id);
+                    return f ? { ...f, distance: s.distance_km * 1000 } : null;
+                })
+                .filter(Boolean);
+        }
+    } catch (err) {
+        console.warn("Nearest stations request failed, using turf:", err);
+    }
+    return closestPoints(userPoint, radius);
+}
+
 // metropolitan area where the Metro system operates
 const METRO_AREA_BOUNDARY = {
     type: "Feature",
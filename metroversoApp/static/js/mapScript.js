@@ -166,20 +166,25 @@ function updateUserLocation(position) {
   setClosestStationsBoxVisible(true);
 
   if (shouldUpdateStations) {
-    closestStationsToUser = closestPoints(turf.point(userLocation), 2000);
-    closestStations(turf.point(userLocation), 2000);
+    const userPoint = turf.point(userLocation);
     lastUserLocation = [...userLocation];
 
-    // Update the button text with the station name/id
-    const btn1 = document.getElementById("btnClosestStation1");
-    const btn2 = document.getElementById("btnClosestStation2");
-    const btn3 = document.getElementById("btnClosestStation3");
-    btn1.innerHTML = `<i class="bi bi-geo-alt"></i> ${closestStationsToUser[0]?.properties.name || ""
-      }`;
-    btn2.innerHTML = `<i class="bi bi-geo-alt"></i> ${closestStationsToUser[1]?.properties.name || ""
-      }`;
-    btn3.innerHTML = `<i class="bi bi-geo-alt"></i> ${closestStationsToUser[2]?.properties.name || ""
-      }`;
+    // One nearest-station query serves both the buttons and the map layers
+    fetchClosestPoints(userPoint, 2000).then((top3) => {
+      closestStationsToUser = top3;
+      closestStations(userPoint, 2000, top3);
+
+      // Update the button text with the station name/id
+      const btn1 = document.getElementById("btnClosestStation1");
+      const btn2 = document.getElementById("btnClosestStation2");
+      const btn3 = document.getElementById("btnClosestStation3");
+      btn1.innerHTML = `<i class="bi bi-geo-alt"></i> ${closestStationsToUser[0]?.properties.name || ""
+        }`;
+      btn2.innerHTML = `<i class="bi bi-geo-alt"></i> ${closestStationsToUser[1]?.properties.name || ""
+        }`;
+      btn3.innerHTML = `<i class="bi bi-geo-alt"></i> ${closestStationsToUser[2]?.properties.name || ""
+        }`;
+    });
   }
 
   if (!userMarker) {
@@ -517,7 +522,7 @@ function walkingRouteToDestination() {
 }
 
 // Function to find the closest stations to the user location
-function closestStations(userPoint, maxDistance) {
+function closestStations(userPoint, maxDistance, top3 = null) {
   // Remove existing layers and sources if they exist
   if (map.getLayer("distance-labels")) map.removeLayer("distance-labels");
   if (map.getLayer("points-layer")) map.removeLayer("points-layer");
@@ -527,7 +532,7 @@ function closestStations(userPoint, maxDistance) {
 
   if (inRoute) return; // Skip if in route mode
 
-  const top3 = closestPoints(userPoint, 2000);
+  if (!top3) top3 = closestPoints(userPoint, 2000);
   console.log("Closest points:", top3);
 
   const pointsGeoJSON = {
@@ -750,7 +755,7 @@ document.querySelector(".userLocation").addEventListener("click", function () {
 });
 
 // Function to handle route finding
-const routeFindingFunction = (centerOnRoute = true) => {
+const routeFindingFunction = async (centerOnRoute = true) => {
   // Clear any existing route visualization
   clearRouteVisualization();
 
@@ -776,7 +781,7 @@ const routeFindingFunction = (centerOnRoute = true) => {
   if (userMarkerActive == true) {
     console.log("seleccionado por el boton de userLocation");
     const { lng, lat } = userMarker.getLngLat();
-    inputStart = getNearestStationId(lng, lat, featureCollection);
+    inputStart = await fetchNearestStationId(lng, lat);
     nameStart = "Seleccionado por el marcador de ubicación";
     console.log("Estación más cercana al usuario:", inputStart);
   }
@@ -1727,6 +1732,22 @@ function getNearestStationId(lon, lat, featureCollection) {
   return nearest?.properties?.ID ?? null;
 }
 
+// Nearest station from the server-side spatial index (/view/nearest).
+// Falls back to the turf scan in the browser if the request fails.
+async function fetchNearestStationId(lon, lat) {
+  try {
+    const res = await fetch(`/view/nearest?lon=${lon}&lat=${lat}&k=1`);
+    if (res.ok) {
+      const data = await res.json();
+      const id = data.results?.[0]?.[0]?.id;
+      if (id) return id;
+    }
+  } catch (err) {
+    console.warn("Nearest station request failed, using turf:", err);
+  }
+  return getNearestStationId(lon, lat, featureCollection);
+}
+
 
 // Setup typeahead (autocomplete) for start and destination inputs
 document.addEventListener('DOMContentLoaded', () => {
@@ -1795,9 +1816,9 @@ document.addEventListener('DOMContentLoaded', () => {
       li.textContent = label;
       li.title = label;
       li.style.cursor = 'pointer';
-      li.addEventListener('click', () => {
+      li.addEventListener('click', async () => {
         const [lonR, latR] = searchRightCoords(lon, lat);
-        const id = getNearestStationId(lonR, latR, featureCollection);
+        const id = await fetchNearestStationId(lonR, latR);
 
         onPick({ id, label, lon: lonR, lat: latR });
         qEl.value = label;
@@ -1,3 +1,1289 @@
-from django.test import TestCase
+import datetime
+import io
+import math
+import random
+import tempfile
+from contextlib import redirect_stdout
+from itertools import product
+from unittest import mock
 
-# Create your tests here.
+import networkx as nx
+import numpy as np
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from metroversoApp.assets import functions, routeTable
+from metroversoApp.assets.stationGraphs import G
+
+
+class RoutePricingPackageTests(SimpleTestCase):
+    """The compiled fare automaton must charge exactly what the original pattern matching charged."""
+
+    def assertSamePackages(self, route):
+        self.assertEqual(
+            functions.get_route_pricing_package(route),
+            functions._reference_route_pricing_package(route),
+            msg=f"route {route}",
+        )
+
+    def test_all_od_pairs(self):
+        # Every origin-destination pair, for every criterion with a route table
+        nodes = list(G.nodes())
+        for criterion in routeTable.ROUTE_CRITERIA:
+            if not routeTable.has_table(criterion):
+                continue
+            for source in nodes:
+                for target in nodes:
+                    if source != target:
+                        self.assertSamePackages(routeTable.get_route(source, target, criterion))
+
+    def test_all_transport_sequences(self):
+        # One station per transport (metro, cable, tranvía, bus, Arví) plus an unknown line
+        stations = ['A00', 'L02', 'T01', 'M01', 'L01', 'C6-001-01']
+        for length in range(6):
+            for route in product(stations, repeat=length):
+                self.assertSamePackages(list(route))
+
+
+class LineGraphTests(SimpleTestCase):
+    """Fewest-transfer routes on the line graph against networkx on an explicit (station, line) graph."""
+
+    def test_matches_networkx(self):
+        from metroversoApp.assets import lineGraph, routingEngine
+
+        line_graph = lineGraph.LineGraph(routingEngine.engine)
+        scale = 10 ** 12
+        reference = nx.DiGraph()
+        for u, v, data in G.edges(data=True):
+            ticks = round(data['time'] / lineGraph.TIME_RESOLUTION)
+            for a, b in ((u, v), (v, u)):
+                if data.get('transfer') == 1:
+                    reference.add_edge(a, b, weight=ticks)
+                else:
+                    reference.add_edge((a, data['line']), (b, data['line']), weight=ticks)
+                    reference.add_edge(a, (a, data['line']), weight=scale)
+                    reference.add_edge((a, data['line']), a, weight=0)
+
+        nodes = list(G.nodes())
+        for source in nodes:
+            lengths = nx.single_source_dijkstra_path_length(reference, source)
+            for target in nodes:
+                route = line_graph.search(source, target)
+                self.assertEqual(divmod(lengths[target], scale),
+                                 (route.boardings, round(route.time / lineGraph.TIME_RESOLUTION)),
+                                 msg=f"{source} -> {target}")
+                self.assertTrue(all(G.has_edge(u, v) for u, v in zip(route.path, route.path[1:])))
+
+    def test_shared_metroplus_stations(self):
+        # M00 and X00 are one station joined by a 0.01 min transfer edge: riding line 2 is not a transfer
+        from metroversoApp.assets import lineGraph, routingEngine
+
+        route = lineGraph.LineGraph(routingEngine.engine).search('M00', 'X10')
+        self.assertEqual(route.transfers, 0)
+        self.assertEqual([leg['line'] for leg in route.legs], ['X'])
+
+
+class TemporaryStampDirMixin:
+    """Writes the stamp files (stampFile) of the tests of the class to a temporary directory."""
+
+    @classmethod
+    def setUpClass(cls):
+        stamp_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(METROVERSO_STAMP_DIR=stamp_dir))
+        super().setUpClass()
+
+
+class ClosureTests(TemporaryStampDirMixin, TestCase):
+    """Routing on the closures overlay avoids a closed station (X05) and a closed connection (A10 - B00)."""
+
+    def setUp(self):
+        from metroversoApp.assets import routeCache
+
+        routeCache.invalidate()
+
+    def tearDown(self):
+        from metroversoApp.assets import closures, routeCache
+        from metroversoApp.models import Closure
+
+        Closure.objects.all().delete()
+        closures.refresh()
+        routeCache.invalidate()
+
+    def assertOpen(self, path):
+        self.assertNotIn('X05', path)
+        self.assertFalse({('A10', 'B00'), ('B00', 'A10')} & set(zip(path, path[1:])), msg=f"route {path}")
+
+    def test_routes_avoid_closures(self):
+        from metroversoApp.assets import closures, routingEngine
+        from metroversoApp.models import Closure
+
+        # 'weight' does not depend on the hour (speedProfiles), so its routes come from the tables.
+        # Cached before the closures: one route through each of them and one away from both
+        self.assertIn('X05', functions.route_response('M00', 'M19', 'weight')[0]['route_result'].path)
+        path = functions.route_response('A00', 'B03', 'weight')[0]['route_result'].path
+        self.assertIn(('A10', 'B00'), set(zip(path, path[1:])))
+        functions.route_response('A00', 'A20', 'weight')
+
+        Closure.objects.create(station='X05')
+        Closure.objects.create(station='A10', other_station='B00')
+        engine = closures.routing_engine()
+        self.assertIsNot(engine, routingEngine.engine)
+
+        for source, target in (('M00', 'M19'), ('A00', 'B03'), ('B03', 'A00'), ('X00', 'T05')):
+            for algorithm in routingEngine.SEARCH_ALGORITHMS:
+                self.assertOpen(engine.search(source, target, 'weight', algorithm)[0])
+            self.assertOpen(functions.find_route(source, target, 'weight').path)
+
+        # The table routes through a closure are searched again with Dijkstra, the cached ones dropped
+        for source, target in (('M00', 'M19'), ('A00', 'B03')):
+            result = functions.find_route(source, target, 'weight')
+            self.assertEqual(result.algorithm, 'dijkstra')
+            self.assertEqual(result.path, engine.search(source, target, 'weight', 'dijkstra')[0])
+            response, cache_hit = functions.route_response(source, target, 'weight')
+            self.assertFalse(cache_hit)
+            self.assertOpen(response['route_result'].path)
+        self.assertTrue(functions.route_response('A00', 'A20', 'weight')[1])
+
+    def test_stamp_is_written_to_the_stamp_dir(self):
+        from django.conf import settings
+        from metroversoApp.assets import closures, stampFile
+        from metroversoApp.models import Closure
+
+        before = stampFile.read_stamp(closures.CLOSURES_STAMP)
+        Closure.objects.create(station='X05')
+        path = stampFile.stamp_path(closures.CLOSURES_STAMP)
+        self.assertEqual(str(path.parent), settings.METROVERSO_STAMP_DIR)
+        self.assertNotEqual(stampFile.read_stamp(closures.CLOSURES_STAMP), before)
+        self.assertIn('X05', closures.get_closures_info()['closed_stations'])
+
+
+def _od_pairs():
+    nodes = list(G.nodes())
+    return [(source, target) for source in nodes for target in nodes if source != target]
+
+
+def _route_price(path, profile):
+    return functions.get_price_from_packages(functions.get_route_pricing_package(path), profile)
+
+
+class SearchAlgorithmTests(SimpleTestCase):
+    """A* and bidirectional A* find routes as short as Dijkstra's, which are the ones networkx picks."""
+
+    def test_costs_match_dijkstra(self):
+        from metroversoApp.assets import routingEngine
+
+        engine = routingEngine.engine
+        for criterion in engine.astar_criteria:
+            for source, target in _od_pairs():
+                msg = f"{source} -> {target} ({criterion})"
+                s, t = engine.index[source], engine.index[target]
+                expected = engine.dijkstra(s, criterion, t)[0][t]
+                for algorithm in ('astar', 'bidirectional'):
+                    path, _ = engine.search(source, target, criterion, algorithm)
+                    self.assertEqual((path[0], path[-1]), (source, target), msg=msg)
+                    cost = engine.path_cost([engine.index[node] for node in path], criterion)
+                    self.assertAlmostEqual(cost, expected, delta=1e-9, msg=msg)
+
+    def test_dijkstra_matches_networkx(self):
+        from metroversoApp.assets import routingEngine
+
+        for source, target in _od_pairs():
+            path, _ = routingEngine.engine.search(source, target, 'time', 'dijkstra')
+            self.assertEqual(path, nx.dijkstra_path(G, source, target, weight='time'), msg=f"{source} -> {target}")
+
+
+class FareRoutingTests(TemporaryStampDirMixin, TestCase):
+    """Cheapest-fare routes must cost what the route is charged, and never more than the table routes."""
+    fixtures = ['packages']
+
+    def setUp(self):
+        from metroversoApp.assets import priceTable
+
+        priceTable.invalidate()
+        self.addCleanup(priceTable.invalidate)
+
+    def test_all_od_pairs(self):
+        from metroversoApp.assets import fareRouting
+
+        fare_graph = fareRouting.get_fare_graph()
+        self.assertGreater(fare_graph.search('A00', 'B03').price, 0)
+        for profile in ('Frecuente', 'Estudiantil'):
+            for source, target in _od_pairs():
+                route = fare_graph.search(source, target, profile)
+                msg = f"{source} -> {target} ({profile})"
+                self.assertAlmostEqual(route.price, _route_price(route.path, profile), places=6, msg=msg)
+                for criterion in ('time', 'transfer', 'weight'):
+                    table_route = routeTable.get_route(source, target, criterion)
+                    self.assertLessEqual(route.price, _route_price(table_route, profile) + 1e-9, msg=f"{msg} {criterion}")
+
+
+class ParetoRoutingTests(TemporaryStampDirMixin, TestCase):
+    """The Pareto set is priced like any route, holds no dominated route and contains the single-criterion optima."""
+    fixtures = ['packages']
+
+    def setUp(self):
+        from metroversoApp.assets import priceTable
+
+        priceTable.invalidate()
+        self.addCleanup(priceTable.invalidate)
+
+    def test_all_od_pairs(self):
+        from metroversoApp.assets import fareRouting, lineGraph, paretoRouting
+
+        pareto_graph = paretoRouting.get_pareto_graph()
+        fare_graph = fareRouting.get_fare_graph()
+        line_graph = lineGraph.get_line_graph()
+        profile = 'Frecuente'
+        for source, target in _od_pairs():
+            msg = f"{source} -> {target}"
+            routes, truncated, _ = pareto_graph.search(source, target, profile)
+            self.assertFalse(truncated, msg=msg)
+            for route in routes:
+                self.assertAlmostEqual(route.price, _route_price(route.path, profile), places=6, msg=msg)
+
+            objectives = [(round(route.price * 100), route.transfers, round(route.time / lineGraph.TIME_RESOLUTION))
+                          for route in routes]
+            for i, a in enumerate(objectives):
+                for j, b in enumerate(objectives):
+                    if i != j:
+                        self.assertFalse(all(x <= y for x, y in zip(a, b)), msg=f"{msg}: {a} dominates {b}")
+
+            fastest = routeTable.get_route(source, target, 'time')
+            self.assertAlmostEqual(min(route.time for route in routes),
+                                   sum(G[u][v]['time'] for u, v in zip(fastest, fastest[1:])), delta=1e-4, msg=msg)
+            self.assertEqual(min(route.transfers for route in routes),
+                             line_graph.search(source, target, 'transfers').transfers, msg=msg)
+            self.assertAlmostEqual(min(route.price for route in routes),
+                                   fare_graph.search(source, target, profile).price, places=6, msg=msg)
+
+
+class AlternativeRoutesTests(TestCase):
+    """Yen's k shortest routes over station groups, and asking for more of them incrementally."""
+
+    def forget_alternatives(self):
+        from metroversoApp.assets import alternatives
+
+        with alternatives._lock:
+            alternatives._states.clear()
+
+    def test_all_od_pairs(self):
+        from metroversoApp.assets import alternatives
+
+        for criterion in ('time', 'transfer'):
+            for source, target in _od_pairs():
+                msg = f"{source} -> {target} ({criterion})"
+                routes, _ = alternatives.k_shortest_routes(source, target, criterion, 3)
+                costs = [cost for cost, _ in routes]
+                paths = [tuple(path) for _, path in routes]
+                self.assertTrue(all(a <= b + 1e-9 for a, b in zip(costs, costs[1:])), msg=f"{msg}: {costs}")
+                self.assertEqual(len(set(paths)), len(paths), msg=msg)
+                for path in paths:
+                    self.assertEqual(len(set(path)), len(path), msg=f"{msg}: {path}")
+                    self.assertEqual((path[0], path[-1]), (source, target), msg=msg)
+                    self.assertTrue(all(G.has_edge(u, v) for u, v in zip(path, path[1:])), msg=msg)
+                if criterion == 'time':
+                    # The static 'time' route of find_route, the same at every hour
+                    self.assertEqual(routes[0][1], routeTable.get_route(source, target, 'time'), msg=msg)
+
+    def test_more_alternatives_later(self):
+        from metroversoApp.assets import alternatives
+
+        self.forget_alternatives()
+        self.addCleanup(self.forget_alternatives)
+        for source, target in (('A00', 'B03'), ('M00', 'T05'), ('X10', 'L01'), ('J03', 'H02')):
+            first, _ = alternatives.k_shortest_routes(source, target, 'time', 3)
+            more, added = alternatives.k_shortest_routes(source, target, 'time', 4)
+            self.assertEqual(added, len(more) - len(first))
+            self.forget_alternatives()
+            fresh, _ = alternatives.k_shortest_routes(source, target, 'time', 4)
+            self.assertEqual(more, fresh)
+            self.assertEqual(fresh[:3], first)
+
+
+    def test_spur_search_counter_under_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from metroversoApp.assets import alternatives
+
+        pairs = _od_pairs()[::37]
+
+        def searches(workers):
+            self.forget_alternatives()
+            before = alternatives.get_cache_info()['spur_searches']
+            with ThreadPoolExecutor(workers) as pool:
+                list(pool.map(lambda pair: alternatives.k_shortest_routes(*pair, 'time', 5), pairs))
+            return alternatives.get_cache_info()['spur_searches'] - before
+
+        self.assertEqual(searches(8), searches(1))
+
+class PriceTableTests(TemporaryStampDirMixin, TestCase):
+    """The price table holds the Package rows and follows changes made by other processes through the stamp file."""
+    fixtures = ['packages']
+
+    def setUp(self):
+        from metroversoApp.assets import priceTable, routeCache
+
+        priceTable.invalidate()
+        routeCache.invalidate()
+        self.addCleanup(priceTable.invalidate)
+
+    def test_matches_database(self):
+        from metroversoApp.assets import priceTable
+        from metroversoApp.models import Package
+
+        rows = Package.objects.all()
+        self.assertEqual(priceTable.get_prices(), {(row.id_package, row.profile.lower()): row.price for row in rows})
+        for row in rows:
+            self.assertEqual(priceTable.get_price(row.id_package, f" {row.profile.upper()} "), row.price)
+        self.assertIsNone(priceTable.get_price(99, 'Frecuente'))
+
+    def test_change_in_another_process(self):
+        from metroversoApp.assets import priceTable, stampFile
+        from metroversoApp.models import Package
+
+        response, cache_hit = functions.route_response('A00', 'A05', 'weight')
+        self.assertFalse(cache_hit)
+        self.assertTrue(functions.route_response('A00', 'A05', 'weight')[1])
+        package = response['price_packages'][0]
+        loads = priceTable.get_price_table_info()['loads']
+
+        # Another process saves a price: no signal here, only its stamp file
+        Package.objects.filter(id_package=package, profile='Frecuente').update(price=1234.0)
+        stampFile.write_stamp(priceTable.PRICES_STAMP)
+
+        response, cache_hit = functions.route_response('A00', 'A05', 'weight')
+        self.assertFalse(cache_hit)
+        self.assertEqual(response['price'], _route_price(response['route_result'].path, 'Frecuente'))
+        self.assertEqual(priceTable.get_price(package, 'Frecuente'), 1234.0)
+        self.assertEqual(priceTable.get_price_table_info()['loads'], loads + 1)
+
+
+class ServiceCalendarTests(SimpleTestCase):
+    """Holidays, vectorized trip checks against the former weekday/Sunday rules, and departure time parsing."""
+
+    def test_holidays(self):
+        from metroversoApp.assets import serviceCalendar
+
+        holidays = serviceCalendar.colombian_holidays(2025)
+        # Holy Thursday and Good Friday; Reyes on its Monday; San José, San Pedro, Asunción, Día de la Raza,
+        # Todos los Santos and Independencia de Cartagena moved to Monday; Ascension, Corpus Christi, Sacred Heart
+        for month, day in ((4, 17), (4, 18), (1, 6), (3, 24), (6, 30), (8, 18), (10, 13), (11, 3), (11, 17),
+                           (6, 2), (6, 23), (1, 1), (12, 25)):
+            self.assertIn(datetime.date(2025, month, day), holidays)
+        for month, day in ((3, 19), (6, 29), (8, 15), (10, 12), (11, 1), (11, 11), (4, 20)):
+            self.assertNotIn(datetime.date(2025, month, day), holidays)
+        self.assertEqual(serviceCalendar.day_type(datetime.date(2025, 4, 18)), 'sunday')
+        self.assertEqual(serviceCalendar.day_type(datetime.date(2025, 4, 19)), 'weekday')
+
+    @staticmethod
+    def former_can_make_trip(start, minutes, route):
+        """can_make_trip before the service calendar: Sundays or Monday to Saturday, Arví routes on Arví hours."""
+        sunday = start.weekday() == 6
+        if 'L01' in route:
+            opens, closes = ((8, 30), (18, 0)) if sunday else ((9, 0), (18, 0))
+        else:
+            opens, closes = ((5, 0), (22, 0)) if sunday else ((4, 30), (23, 0))
+        open_time = start.replace(hour=opens[0], minute=opens[1], second=0, microsecond=0)
+        close_time = start.replace(hour=closes[0], minute=closes[1], second=0, microsecond=0)
+        return open_time <= start and start + datetime.timedelta(minutes=minutes) <= close_time
+
+    def test_check_trips_matches_former_rules(self):
+        from metroversoApp.assets import serviceCalendar
+
+        routes = (['A00', 'A01'], ['L00', 'L01'])
+        weekday, sunday = datetime.datetime(2025, 5, 6), datetime.datetime(2025, 5, 4)
+        trips = [
+            (weekday.replace(hour=4, minute=29), 10, routes[0]),   # before opening
+            (weekday.replace(hour=4, minute=30), 10, routes[0]),
+            (weekday.replace(hour=22, minute=50), 10, routes[0]),  # ends at closing
+            (weekday.replace(hour=22, minute=50), 11, routes[0]),  # ends after closing
+            (weekday.replace(hour=23, minute=30), 90, routes[0]),  # ends the next day
+            (sunday.replace(hour=4, minute=45), 10, routes[0]),
+            (sunday.replace(hour=21, minute=55), 10, routes[0]),
+            (weekday.replace(hour=8, minute=59), 10, routes[1]),
+            (weekday.replace(hour=17, minute=50), 11, routes[1]),
+            (sunday.replace(hour=8, minute=30), 10, routes[1]),
+        ]
+        rng = random.Random(0)
+        start = datetime.datetime(2025, 1, 1)
+        while len(trips) < 2000:
+            moment = start + datetime.timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+            if moment.date() not in serviceCalendar.colombian_holidays(moment.year):
+                trips.append((moment, rng.randrange(180), rng.choice(routes)))
+
+        can_make = serviceCalendar.check_trips(*zip(*trips))
+        for (moment, minutes, route), verdict in zip(trips, can_make.tolist()):
+            self.assertEqual(verdict, self.former_can_make_trip(moment, minutes, route), msg=f"{moment} {minutes} {route}")
+
+    def test_parse_time(self):
+        from metroversoApp.assets import serviceCalendar
+
+        now = datetime.datetime(2025, 5, 6, 10, 15, 30)
+        self.assertEqual(serviceCalendar.parse_time('07:05', now), datetime.datetime(2025, 5, 6, 7, 5))
+        self.assertEqual(serviceCalendar.parse_time('2025-05-07T18:40'), datetime.datetime(2025, 5, 7, 18, 40))
+        moment = serviceCalendar.parse_time('2025-05-07T18:40:00+00:00')
+        self.assertIsNone(moment.tzinfo)
+        self.assertEqual(moment, datetime.datetime(2025, 5, 7, 18, 40, tzinfo=datetime.timezone.utc)
+                         .astimezone().replace(tzinfo=None))
+        with self.assertRaises(ValueError):
+            serviceCalendar.parse_time('tomorrow')
+
+
+class HeadwayRoutingTests(SimpleTestCase):
+    """Expected-time routes against networkx on an explicit (station, riding) graph."""
+
+    def test_matches_networkx(self):
+        from metroversoApp.assets import headways, routingEngine
+
+        headway_graph = headways.HeadwayGraph(routingEngine.engine)
+        nodes = list(G.nodes())
+        for band in ('am_peak', 'sunday'):
+            reference = nx.DiGraph()
+            for u, v, data in G.edges(data=True):
+                for a, b in ((u, v), (v, u)):
+                    if data.get('transfer') == 1:
+                        reference.add_edge((a, 0), (b, 0), weight=data['time'])
+                        reference.add_edge((a, 1), (b, 0), weight=data['time'])
+                    else:
+                        reference.add_edge((a, 1), (b, 1), weight=data['time'])
+                        reference.add_edge((a, 0), (b, 1), weight=data['time'] + headways.headway(data['line'], band) / 2)
+
+            for source in nodes:
+                lengths = nx.single_source_dijkstra_path_length(reference, (source, 0))
+                for target in nodes:
+                    msg = f"{source} -> {target} ({band})"
+                    route = headway_graph.search(source, target, band)
+                    expected = min(lengths.get((target, riding), math.inf) for riding in (0, 1))
+                    self.assertAlmostEqual(route.time + route.wait, expected, delta=1e-9, msg=msg)
+
+                    # A wait of half the headway at every boarding: the start of a ride, never a walk
+                    wait, riding = 0.0, False
+                    for u, v in zip(route.path, route.path[1:]):
+                        data = G[u][v]
+                        if data.get('transfer') == 1:
+                            riding = False
+                        elif not riding:
+                            wait += headways.headway(data['line'], band) / 2
+                            riding = True
+                    self.assertAlmostEqual(route.wait, wait, delta=1e-9, msg=msg)
+
+    def test_walking_is_not_charged_a_wait(self):
+        from metroversoApp.assets import headways, routingEngine
+
+        route = headways.HeadwayGraph(routingEngine.engine).search('M00', 'X00', 'am_peak')
+        self.assertEqual(route.path, ['M00', 'X00'])
+        self.assertEqual(route.wait, 0)
+
+
+class TimeLayerTests(TestCase):
+    """'time' at the peaks against networkx on G with the peak speeds, and arrive-by on the layer of the departure."""
+
+    # A Tuesday: 07:30 is in the morning peak layer, 09:30 is off-peak
+    PEAK = datetime.datetime(2025, 5, 6, 7, 30)
+
+    def test_peak_routes_match_networkx(self):
+        from metroversoApp.assets import speedProfiles
+        from metroversoApp.assets.stationGraphs import SPEEDS
+
+        self.assertEqual(functions._time_layer('time', self.PEAK), 'time@06')
+        reference = G.copy()
+        for u, v, data in reference.edges(data=True):
+            data['peak'] = data['time']
+            line = data.get('line')
+            if data.get('transfer') != 1 and line in speedProfiles.SPEED_PROFILES:
+                speed = speedProfiles.line_speed(line, self.PEAK.hour)
+                data['peak'] += data['distance_km'] * 60.0 * (1.0 / speed - 1.0 / SPEEDS[line])
+
+        for source, target in _od_pairs():
+            msg = f"{source} -> {target}"
+            result = functions.find_route(source, target, 'time', depart_at=self.PEAK)
+            self.assertEqual(result.algorithm, 'table', msg=msg)
+            self.assertEqual(result.time_layer, 'time@06', msg=msg)
+            self.assertEqual(result.path, nx.dijkstra_path(reference, source, target, weight='peak'), msg=msg)
+            self.assertAlmostEqual(result.duration, nx.dijkstra_path_length(reference, source, target, weight='peak'),
+                                   delta=1e-9, msg=msg)
+
+    def test_arrive_by_uses_the_layer_of_the_departure(self):
+        source, target = max(_od_pairs(), key=lambda pair: routeTable.get_route_duration(*pair, 'time'))
+        # Off-peak arrival of a trip that left in the morning peak
+        arrive_by = datetime.datetime(2025, 5, 6, 9, 5)
+        self.assertIsNone(functions._time_layer('time', arrive_by))
+        response, _ = functions.route_response(source, target, 'time', arrive_by=arrive_by)
+        route_result = response['route_result']
+        self.assertEqual(route_result.time_layer, 'time@06')
+        departure = arrive_by - datetime.timedelta(minutes=route_result.duration)
+        self.assertEqual(functions._time_layer('time', departure), 'time@06')
+
+        # Arriving within the peak stays on the peak layer; arriving off-peak after an off-peak departure does not
+        response, _ = functions.route_response(source, target, 'time', arrive_by=self.PEAK)
+        self.assertEqual(response['route_result'].time_layer, 'time@06')
+        response, _ = functions.route_response(source, target, 'time', arrive_by=datetime.datetime(2025, 5, 6, 12, 0))
+        self.assertIsNone(response['route_result'].time_layer)
+
+
+class IsochroneTests(TestCase):
+    """Reachable stations, times and transfers against networkx, the twin-platform walks not counted."""
+
+    def setUp(self):
+        from metroversoApp.assets import isochrone
+
+        with isochrone._lock:
+            isochrone._entries.clear()
+
+    def test_matches_networkx(self):
+        from metroversoApp.assets import isochrone
+        from metroversoApp.assets.alternatives import SAME_STATION_MINUTES
+
+        for source in G.nodes():
+            for minutes in (7, 23.5):
+                msg = f"{source} ({minutes} min)"
+                reachable, _ = isochrone.reachable_stations(source, minutes)
+                lengths, paths = nx.single_source_dijkstra(G, source, cutoff=minutes, weight='time')
+                self.assertEqual({station for station, _, _ in reachable}, set(lengths), msg=msg)
+                for station, time, transfers in reachable:
+                    self.assertAlmostEqual(time, lengths[station], delta=1e-9, msg=f"{msg} -> {station}")
+                    path = paths[station]
+                    expected = sum(1 for u, v in zip(path, path[1:])
+                                   if G[u][v].get('transfer') == 1 and G[u][v]['time'] > SAME_STATION_MINUTES)
+                    self.assertEqual(transfers, expected, msg=f"{msg} -> {station}")
+
+    def test_twin_platforms_are_not_a_transfer(self):
+        from metroversoApp.assets import isochrone
+
+        self.assertEqual(G['M00']['X00'].get('transfer'), 1)
+        reachable, cache_hit = isochrone.reachable_stations('M00', 4)
+        self.assertFalse(cache_hit)
+        self.assertIn(('X00', G['M00']['X00']['time'], 0), reachable)
+        # Same 5-minute bucket: answered from the cache, trimmed to the budget
+        trimmed, cache_hit = isochrone.reachable_stations('M00', 1)
+        self.assertTrue(cache_hit)
+        self.assertEqual(trimmed, [entry for entry in reachable if entry[1] <= 1])
+
+
+class RouteTableTests(SimpleTestCase):
+    """Table routes, lengths and durations are the ones networkx finds on G."""
+
+    def test_matches_networkx(self):
+        for criterion in routeTable.ROUTE_CRITERIA:
+            self.assertTrue(routeTable.has_table(criterion))
+            for source in G.nodes():
+                lengths, paths = nx.single_source_dijkstra(G, source, weight=criterion)
+                for target in G.nodes():
+                    msg = f"{source} -> {target} ({criterion})"
+                    path = routeTable.get_route(source, target, criterion)
+                    self.assertEqual(path, paths[target], msg=msg)
+                    self.assertAlmostEqual(routeTable.get_route_length(source, target, criterion), lengths[target],
+                                           delta=1e-9, msg=msg)
+                    self.assertAlmostEqual(routeTable.get_route_duration(source, target, criterion),
+                                           sum(G[u][v]['time'] for u, v in zip(path, path[1:])), delta=1e-9, msg=msg)
+
+    def test_partial_rebuild_keeps_the_other_tables(self):
+        tables = {criterion: routeTable.get_table(criterion) for criterion in routeTable.ROUTE_CRITERIA}
+        routeTable.rebuild_route_tables(criteria=['transfer'])
+        self.assertIsNot(routeTable.get_table('transfer'), tables['transfer'])
+        for criterion in ('weight', 'time', 'distance_km'):
+            self.assertIs(routeTable.get_table(criterion), tables[criterion])
+        for name, matrix in tables['transfer'].items():
+            self.assertTrue((routeTable.get_table('transfer')[name] == matrix).all(), msg=name)
+
+    def test_unknown_station(self):
+        with self.assertRaises(nx.NodeNotFound):
+            routeTable.get_route('A00', 'Z99-unknown', 'time')
+
+
+class RouteResultTests(TemporaryStampDirMixin, TestCase):
+    """One find_route search gives the path, hop times, duration and verdict calculeRute answers with."""
+    fixtures = ['packages']
+    # A Sunday at noon: 'time' is on the static weights
+    NOW = datetime.datetime(2025, 5, 4, 12, 0)
+
+    def setUp(self):
+        from metroversoApp.assets import priceTable, routeCache
+
+        priceTable.invalidate()
+        routeCache.invalidate()
+        self.addCleanup(priceTable.invalidate)
+        patcher = mock.patch('metroversoApp.assets.stationGraphs._now', return_value=self.NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_find_route(self):
+        from metroversoApp.assets import stationGraphs
+
+        for source, target in _od_pairs()[::7]:
+            for criterion in routeTable.ROUTE_CRITERIA:
+                msg = f"{source} -> {target} ({criterion})"
+                result = functions.find_route(source, target, criterion)
+                path = routeTable.get_route(source, target, criterion)
+                self.assertEqual((result.path, result.algorithm), (path, 'table'), msg=msg)
+                self.assertEqual(result.edge_times, [G[u][v]['time'] for u, v in zip(path, path[1:])], msg=msg)
+                self.assertAlmostEqual(result.duration, routeTable.get_route_duration(source, target, criterion),
+                                       delta=1e-9, msg=msg)
+                self.assertEqual(result.uses_arvi_station, 'L01' in path, msg=msg)
+                self.assertEqual(result.can_make_trip,
+                                 stationGraphs.can_make_trip(self.NOW, int(result.duration), path), msg=msg)
+                self.assertEqual(stationGraphs.can_make_trip_now_graph(G, source, target, result), result.can_make_trip)
+
+    def test_calcule_rute(self):
+        for source, target in (('A00', 'L01'), ('M00', 'T05'), ('B03', 'A20')):
+            with redirect_stdout(io.StringIO()):
+                (rute, distance, transfer_info, can_make_trip, service_hours, uses_arvi_station, rute_coords,
+                 transfer_coords, price_packages, price) = functions.calculeRute(source, target, 'time')
+            path = routeTable.get_route(source, target, 'time')
+            self.assertEqual(rute, path)
+            self.assertAlmostEqual(distance, routeTable.get_route_duration(source, target, 'time'), delta=1e-9)
+            self.assertEqual((transfer_info, rute_coords, transfer_coords, price_packages),
+                             tuple(functions.annotate_route(path)))
+            self.assertEqual(price, _route_price(path, 'Frecuente'))
+            self.assertEqual(uses_arvi_station, 'L01' in path)
+
+
+class RoutingEngineTests(SimpleTestCase):
+    """The compiled engine finds the networkx paths and costs, and only keeps weights for compiled criteria."""
+
+    def test_matches_networkx(self):
+        from metroversoApp.assets import routingEngine
+
+        engine = routingEngine.compile_graph(G)
+        self.assertEqual(engine.number_of_nodes, G.number_of_nodes())
+        self.assertEqual(engine.number_of_arcs, 2 * G.number_of_edges())
+        for criterion in routingEngine.ENGINE_CRITERIA:
+            for source, target in _od_pairs()[::5]:
+                msg = f"{source} -> {target} ({criterion})"
+                self.assertEqual(engine.shortest_path(source, target, criterion),
+                                 nx.dijkstra_path(G, source, target, weight=criterion), msg=msg)
+                self.assertAlmostEqual(engine.shortest_path_length(source, target, criterion),
+                                       nx.dijkstra_path_length(G, source, target, weight=criterion),
+                                       delta=1e-9, msg=msg)
+
+    def test_version_follows_the_network(self):
+        from metroversoApp.assets import routingEngine
+
+        self.assertEqual(routingEngine.compile_graph(G).version, routingEngine.engine.version)
+        graph = G.copy()
+        u, v = next(iter(graph.edges()))
+        graph[u][v]['time'] += 1
+        self.assertNotEqual(routingEngine.compile_graph(graph).version, routingEngine.engine.version)
+
+    def test_closed_arcs_leave_the_engine_unchanged(self):
+        from metroversoApp.assets import routingEngine
+
+        engine = routingEngine.engine
+        arcs = engine.station_arcs(engine.node_index('X05'))
+        overlay = engine.with_closed_arcs(arcs)
+        self.assertNotIn('X05', overlay.shortest_path('M00', 'M19', 'time'))
+        self.assertTrue(all(math.isinf(overlay.weights['time'][k]) for k in arcs))
+        self.assertFalse(any(math.isinf(engine.weights['time'][k]) for k in arcs))
+        self.assertNotEqual(overlay.version, engine.version)
+
+    def test_unknown_criterion(self):
+        from metroversoApp.assets import routingEngine
+
+        engine = routingEngine.engine
+        criteria = set(engine.weights)
+        for criterion in ('tiempo', 'junk'):
+            with self.assertRaises(ValueError):
+                engine.shortest_path('A00', 'B03', criterion)
+            with self.assertRaises(ValueError):
+                functions.find_route('A00', 'B03', criterion)
+            with redirect_stdout(io.StringIO()):
+                response = self.client.get('/view/callRute', {
+                    'inputStart': 'A00', 'inputDestination': 'B03', 'inputCriteria': criterion,
+                })
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+        self.assertEqual(set(engine.weights), criteria)
+
+
+class NetworkSnapshotTests(SimpleTestCase):
+    """A snapshot written from build_graph() loads back the same graph, engine and route tables."""
+
+    def setUp(self):
+        from metroversoApp.assets import networkSnapshot, stationGraphs
+
+        loaded = networkSnapshot._loaded
+        self.addCleanup(setattr, networkSnapshot, '_loaded', loaded)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/network.snapshot"
+        self.options = {'feeder_network': stationGraphs.INCLUDE_FEEDER_NETWORK}
+        self.built = stationGraphs.build_graph()
+        networkSnapshot.write_snapshot(self.built, self.path, self.options)
+
+    def test_graph_round_trip(self):
+        from metroversoApp.assets import networkSnapshot
+
+        graph = networkSnapshot.load_network(self.fail, self.path, self.options)
+        self.assertIsNotNone(networkSnapshot.loaded_snapshot())
+        self.assertEqual(list(graph.nodes(data=True)), list(self.built.nodes(data=True)))
+        for node in self.built:
+            self.assertEqual(list(graph.adj[node].items()), list(self.built.adj[node].items()), msg=node)
+
+    def test_engine_and_tables(self):
+        from metroversoApp.assets import networkSnapshot, routingEngine
+
+        snapshot = networkSnapshot.load_snapshot(self.path)
+        engine = routingEngine.engine_from_snapshot(snapshot)
+        compiled = routingEngine.compile_graph(self.built)
+        self.assertEqual(engine.version, compiled.version)
+        self.assertEqual(engine.lines, compiled.lines)
+        for name in ('indptr', 'indices', 'arc_line', 'arc_transfer'):
+            self.assertTrue((getattr(engine, name) == getattr(compiled, name)).all(), msg=name)
+        for criterion, table in routeTable.build_route_tables(compiled, routeTable.ROUTE_CRITERIA).items():
+            for name, matrix in table.items():
+                self.assertTrue((snapshot['arrays'][f'table_{criterion}_{name}'] == matrix).all(),
+                                msg=f"{criterion} {name}")
+
+    def test_outdated_snapshot_is_rebuilt(self):
+        from metroversoApp.assets import networkSnapshot
+
+        options = dict(self.options, feeder_network=not self.options['feeder_network'])
+        with redirect_stdout(io.StringIO()) as output:
+            graph = networkSnapshot.load_network(lambda: self.built, self.path, options)
+        self.assertIs(graph, self.built)
+        self.assertIsNone(networkSnapshot.loaded_snapshot())
+        self.assertIn('outdated', output.getvalue())
+
+
+class FeederNetworkTests(SimpleTestCase):
+    """The streamed GeoJSON reader and the feeder stops, routes and walking links added to a copy of G."""
+
+    def test_streamed_features_match_json_load(self):
+        import json
+        from metroversoApp.assets import feederNetwork
+
+        with open(feederNetwork.FEEDER_GEOJSON_PATH, encoding='utf-8') as f:
+            expected = json.load(f)['features']
+        # A small chunk cuts features in the middle and exercises the reads in between
+        self.assertEqual(list(feederNetwork.iter_features(chunk_size=97)), expected)
+
+    def test_stops_routes_and_links(self):
+        from metroversoApp.assets import feederNetwork
+        from metroversoApp.assets.spatialIndex import haversine_km
+
+        graph = nx.Graph()
+        graph.add_nodes_from(node for node in G.nodes(data=True) if node[1].get('line') != feederNetwork.FEEDER_LINE_KEY)
+        stations = {node: data['pos'] for node, data in graph.nodes(data=True) if 'pos' in data}
+        stops = list(feederNetwork.iter_stops())
+        summary = feederNetwork.add_feeder_network(graph)
+
+        self.assertEqual(summary['stops'], len(stops))
+        self.assertEqual(summary['routes'], sum(1 for i, stop in enumerate(stops) if i == 0 or stops[i - 1][1] != stop[1]))
+        for (previous, previous_route, _), (stop, route, _) in zip(stops, stops[1:]):
+            if route == previous_route:
+                self.assertEqual(graph[previous][stop]['line'], feederNetwork.FEEDER_LINE_KEY, msg=f"{previous} {stop}")
+
+        links = 0
+        for stop, _, (lon, lat) in stops:
+            for station, (s_lon, s_lat) in stations.items():
+                distance = haversine_km(lon, lat, s_lon, s_lat)
+                if abs(distance - feederNetwork.LINK_RADIUS_KM) < 1e-9:
+                    continue
+                msg = f"{stop} - {station} ({distance:.3f} km)"
+                if distance < feederNetwork.LINK_RADIUS_KM:
+                    links += 1
+                    self.assertEqual(graph[stop][station]['transfer'], 1, msg=msg)
+                    self.assertEqual(graph[stop][station]['time'], round(feederNetwork.walk_minutes(distance), 2), msg=msg)
+                else:
+                    self.assertFalse(graph.has_edge(stop, station), msg=msg)
+        self.assertEqual(summary['links'], links)
+
+
+class SpatialIndexTests(SimpleTestCase):
+    """Grid index queries against a brute-force haversine over every station, and the /view/nearest endpoint."""
+
+    def setUp(self):
+        from metroversoApp.assets.spatialIndex import haversine_km
+
+        self.stations = {node: data['pos'] for node, data in G.nodes(data=True) if 'pos' in data}
+        rng = random.Random(0)
+        # Around the stations, plus points far outside the grid
+        self.points = [(rng.uniform(-75.75, -75.40), rng.uniform(6.05, 6.45)) for _ in range(300)]
+        self.points += [(-74.0, 4.6), (-75.57, 7.5), (0.0, 0.0)]
+        self.brute = [sorted((haversine_km(lon, lat, *pos), station) for station, pos in self.stations.items())
+                      for lon, lat in self.points]
+
+    def test_nearest(self):
+        from metroversoApp.assets.spatialIndex import GridIndex
+
+        for cell_km in (0.1, 0.5, 3.0):
+            index = GridIndex(self.stations, cell_km=cell_km)
+            for (lon, lat), expected in zip(self.points, self.brute):
+                for k, max_km in ((1, None), (4, None), (10, 2.0)):
+                    msg = f"({lon}, {lat}) k={k} max_km={max_km} cell_km={cell_km}"
+                    found = index.nearest(lon, lat, k, max_km)
+                    wanted = [d for d, _ in expected if max_km is None or d <= max_km][:k]
+                    self.assertEqual(len(found), len(wanted), msg=msg)
+                    for (station, distance), expected_distance in zip(found, wanted):
+                        self.assertAlmostEqual(distance, expected_distance, delta=1e-9, msg=msg)
+                        self.assertAlmostEqual(distance, dict((s, d) for d, s in expected)[station], delta=1e-9, msg=msg)
+
+    def test_within(self):
+        from metroversoApp.assets.spatialIndex import GridIndex
+
+        index = GridIndex(self.stations, cell_km=0.5)
+        for (lon, lat), expected in zip(self.points, self.brute):
+            found = index.within(lon, lat, 1.2)
+            self.assertEqual([station for station, _ in found],
+                             [station for distance, station in expected if distance <= 1.2], msg=f"({lon}, {lat})")
+
+    def test_view(self):
+        (lon, lat), expected = self.points[0], self.brute[0]
+        response = self.client.get('/view/nearest', {'lon': lon, 'lat': lat, 'k': 2})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['id'] for result in results[0]], [station for _, station in expected[:2]])
+        for query in ({'lon': 'nan', 'lat': lat}, {'lon': lon}, {'points': '1,2,3'}):
+            self.assertEqual(self.client.get('/view/nearest', query).status_code, 400, msg=query)
+
+
+class RouteCacheTests(TemporaryStampDirMixin, TestCase):
+    """LRU eviction, expiry after the TTL or at the next service change, and the invalidations."""
+    fixtures = ['packages']
+
+    def setUp(self):
+        from metroversoApp.assets import routeCache
+
+        routeCache.invalidate()
+        self.addCleanup(routeCache.invalidate)
+        # A Tuesday: the metro runs 04:30 - 23:00, Arví 09:00 - 18:00
+        self.now = datetime.datetime(2025, 5, 6, 12, 0)
+        patcher = mock.patch('metroversoApp.assets.stationGraphs._now', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def value(*path):
+        return {'route_result': functions.RouteResult(path[0], path[-1], 'time', list(path))}
+
+    def test_lru_eviction(self):
+        from metroversoApp.assets import routeCache
+
+        evictions = routeCache.get_cache_info()['evictions']
+        with mock.patch.object(routeCache, 'CACHE_MAX_ENTRIES', 3):
+            for key in 'abc':
+                routeCache.put(key, self.value('A00', 'A01'))
+            self.assertIsNotNone(routeCache.get('a'))
+            routeCache.put('d', self.value('A00', 'A01'))
+            self.assertIsNone(routeCache.get('b'))
+            for key in 'acd':
+                self.assertIsNotNone(routeCache.get(key), msg=key)
+        self.assertEqual(routeCache.get_cache_info()['evictions'], evictions + 1)
+
+    def test_expiry(self):
+        from metroversoApp.assets import routeCache
+
+        routeCache.put('a', self.value('A00', 'A01'))
+        self.now += datetime.timedelta(seconds=routeCache.CACHE_TTL_SECONDS - 1)
+        self.assertIsNotNone(routeCache.get('a'))
+        self.now += datetime.timedelta(seconds=1)
+        self.assertIsNone(routeCache.get('a'))
+
+        # Nothing outlives the next opening or closing time (Arví closes at 18:00, the metro at 23:00)
+        for put_at, change in ((datetime.time(17, 55), datetime.time(18, 0)), (datetime.time(22, 50), datetime.time(23, 0))):
+            self.now = datetime.datetime.combine(self.now.date(), put_at)
+            routeCache.put('b', self.value('A00', 'A01'))
+            self.now = datetime.datetime.combine(self.now.date(), change) - datetime.timedelta(seconds=1)
+            self.assertIsNotNone(routeCache.get('b'), msg=put_at)
+            self.now += datetime.timedelta(seconds=1)
+            self.assertIsNone(routeCache.get('b'), msg=put_at)
+
+    def test_invalidations(self):
+        from metroversoApp.assets import routeCache
+        from metroversoApp.models import Package
+
+        routeCache.put('a', self.value('A00', 'A01', 'A02'))
+        routeCache.put('b', self.value('B00', 'B01'))
+        self.assertEqual(routeCache.invalidate_routes(stations={'A01'}), 1)
+        self.assertIsNone(routeCache.get('a'))
+        self.assertIsNotNone(routeCache.get('b'))
+        self.assertEqual(routeCache.invalidate_routes(edges={('B01', 'B00'), ('B00', 'B01')}), 1)
+        self.assertIsNone(routeCache.get('b'))
+
+        # A fare change drops every response (they carry prices)
+        routeCache.put('a', self.value('A00', 'A01'))
+        package = Package.objects.first()
+        package.price += 100
+        package.save()
+        self.assertIsNone(routeCache.get('a'))
+
+        # So does a new network
+        routeCache.put('a', self.value('A00', 'A01'))
+        with mock.patch('metroversoApp.assets.routingEngine.graph_version', return_value='another network'):
+            self.assertIsNone(routeCache.get('a'))
+
+
+def _reference_coordinates(station):
+    """Map coordinates as calculeRute looked them up before the registry: line dictionaries, then the node position."""
+    from metroversoApp.assets import stationGraphs as sg
+
+    all_coords = {**sg.lineaA, **sg.linea1, **sg.linea2, **sg.lineaL, **sg.lineaB, **sg.lineaT, **sg.lineaZ,
+                  **sg.lineaJ, **sg.lineaH, **sg.lineaO, **sg.lineaP, **sg.lineaK}
+    if station in all_coords:
+        return all_coords[station]
+    if station in G and 'pos' in G.nodes[station]:
+        return list(G.nodes[station]['pos'])
+    return [0, 0]
+
+
+class AnnotateRouteTests(SimpleTestCase):
+    """annotate_route answers like the separate transfer analysis, coordinate lookups and fare pass it replaced."""
+
+    def assertSameAnnotation(self, route):
+        transfer_info, rute_coords, transfer_coords, price_packages = functions.annotate_route(route)
+        msg = f"route {route}"
+        expected_info = functions.analyze_route_transfers(route)
+        self.assertEqual(transfer_info, expected_info, msg=msg)
+        self.assertEqual(rute_coords, [_reference_coordinates(station) for station in route], msg=msg)
+        self.assertEqual(transfer_coords,
+                         [_reference_coordinates(station) for station in expected_info['transfer_stations']], msg=msg)
+        self.assertEqual(price_packages, functions._reference_route_pricing_package(route), msg=msg)
+
+    def test_all_od_pairs(self):
+        for criterion in ('time', 'transfer'):
+            for source, target in _od_pairs():
+                self.assertSameAnnotation(routeTable.get_route(source, target, criterion))
+
+    def test_short_and_unknown_routes(self):
+        for route in ([], ['A00'], ['A00', 'A01'], ['M00', 'X00'], ['A00', 'nowhere']):
+            with redirect_stdout(io.StringIO()):
+                self.assertSameAnnotation(route)
+
+
+class StationRegistryTests(TestCase):
+    """The registry is indexed like G and the engine, and holds the Station rows until one changes."""
+    fixtures = ['stations']
+
+    def setUp(self):
+        from metroversoApp.assets import stationRegistry
+
+        stationRegistry.reload_station_fields()
+        self.addCleanup(stationRegistry.reload_station_fields)
+
+    def test_geometry(self):
+        from metroversoApp.assets import routingEngine, stationRegistry
+
+        registry = stationRegistry.get_registry()
+        self.assertEqual(list(registry.ids), list(G.nodes()))
+        self.assertEqual(list(registry.ids), routingEngine.engine.node_ids)
+        for station, data in G.nodes(data=True):
+            self.assertEqual(registry.coordinates(station), _reference_coordinates(station), msg=station)
+            self.assertEqual(registry.lines[registry.index[station]], data.get('line'), msg=station)
+        self.assertIsNone(registry.coordinates('nowhere'))
+
+    def test_station_fields(self):
+        from metroversoApp.assets import stationRegistry
+        from metroversoApp.models import Station
+
+        registry = stationRegistry.get_registry()
+        rows = {station.id_station: station for station in Station.objects.all()}
+        for station in set(G.nodes()) | set(rows):
+            row = rows.get(station)
+            self.assertEqual(registry.has_station_row(station), row is not None, msg=station)
+            if row is None:
+                self.assertIsNone(registry.station_fields(station), msg=station)
+                self.assertEqual(registry.name(station), station, msg=station)
+            else:
+                self.assertEqual(registry.station_fields(station),
+                                 {'id': station, 'name': row.name, 'line': row.line, 'type': row.type}, msg=station)
+                self.assertEqual(registry.name(station), row.name, msg=station)
+
+    def test_station_change_is_seen(self):
+        from metroversoApp.assets import stationRegistry
+        from metroversoApp.models import Station
+
+        registry = stationRegistry.get_registry()
+        row = Station.objects.get(id_station='A01')
+        registry.name('A01')
+        with self.assertNumQueries(0):
+            registry.name('A02')
+        row.name = 'Renamed'
+        row.save()
+        self.assertEqual(registry.name('A01'), 'Renamed')
+
+
+class BatchRoutesTests(TemporaryStampDirMixin, TestCase):
+    """/view/batchRoutes answers every query like route_response, including the shared Dijkstra trees."""
+    fixtures = ['packages']
+    # A Sunday: 'time' is on the static weights
+    DEPART_AT = datetime.datetime(2025, 5, 4, 12, 0)
+
+    def setUp(self):
+        from metroversoApp.assets import priceTable, routeCache
+
+        priceTable.invalidate()
+        routeCache.invalidate()
+        self.addCleanup(priceTable.invalidate)
+        self.addCleanup(routeCache.invalidate)
+
+    def post(self, routes, **schedule):
+        import json
+
+        body = {'routes': routes}
+        body.update({key: value.isoformat(timespec='minutes') for key, value in schedule.items()})
+        response = self.client.post('/view/batchRoutes', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(line['index'] for line in lines), list(range(len(routes))))
+        return {line['index']: line for line in lines}
+
+    def test_matches_route_response(self):
+        criteria = ('time', 'weight', 'transfer', 'min_transfers', 'cheapest', 'expected_time')
+        rng = random.Random(0)
+        routes = [[*rng.choice(_od_pairs()), criterion, 'Frecuente'] for criterion in criteria for _ in range(8)]
+        routes += [['A00', 'nowhere', 'time'], ['A00', 'B03', 'tiempo']]
+        lines = self.post(routes, depart_at=self.DEPART_AT)
+        for index, (start, destination, criterion, *_) in enumerate(routes):
+            line = lines[index]
+            if destination == 'nowhere' or criterion == 'tiempo':
+                self.assertFalse(line['success'], msg=line)
+                continue
+            expected, _ = functions.route_response(start, destination, criterion, depart_at=self.DEPART_AT)
+            msg = f"{start} -> {destination} ({criterion})"
+            self.assertEqual(line['rute'], expected['route_result'].path, msg=msg)
+            self.assertAlmostEqual(line['distance'], expected['route_result'].duration, delta=1e-9, msg=msg)
+            self.assertEqual(line['price'], expected['price'], msg=msg)
+            self.assertEqual(line['departure'], self.DEPART_AT.isoformat(timespec='minutes'), msg=msg)
+
+    def test_shared_trees_without_tables(self):
+        from metroversoApp.assets import routingEngine
+
+        routes = [['A00', target, 'time'] for target in ('A20', 'B03', 'X10', 'L01')]
+        with mock.patch.object(routeTable, 'has_table', return_value=False):
+            lines = self.post(routes, depart_at=self.DEPART_AT)
+        for index, (start, destination, criterion) in enumerate(routes):
+            self.assertEqual(lines[index]['search']['algorithm'], 'dijkstra')
+            self.assertEqual(lines[index]['rute'], routingEngine.engine.search(start, destination, criterion)[0])
+
+    def test_arrive_by_bands_at_the_departure(self):
+        source, target = max(_od_pairs(), key=lambda pair: routeTable.get_route_duration(*pair, 'time'))
+        arrive_by = datetime.datetime(2025, 5, 6, 9, 5)
+        line = self.post([[source, target, 'time']], arrive_by=arrive_by)[0]
+        self.assertEqual(line['search']['time_layer'], 'time@06')
+        self.assertEqual(line['arrival'], arrive_by.isoformat(timespec='minutes'))
+
+    def test_rejects_oversized_and_malformed_batches(self):
+        import json
+
+        from metroversoApp.views import BATCH_MAX_ROUTES
+
+        routes = [['A00', 'B03', 'time']] * (BATCH_MAX_ROUTES + 1)
+        response = self.client.post('/view/batchRoutes', json.dumps({'routes': routes}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/view/batchRoutes', 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TravelMatrixTests(TemporaryStampDirMixin, TestCase):
+    """The travel matrices hold what walking each table route gives, and the view serves them with an ETag."""
+    fixtures = ['packages']
+
+    def setUp(self):
+        from metroversoApp.assets import priceTable, routeCache
+
+        priceTable.invalidate()
+        routeCache.invalidate()
+        self.addCleanup(priceTable.invalidate)
+        self.addCleanup(routeCache.invalidate)
+
+    def test_matches_table_routes(self):
+        from metroversoApp.assets import closures, travelMatrix
+
+        engine = closures.routing_engine()
+        pairs = random.Random(0).sample(_od_pairs(), 1500)
+        for criterion in routeTable.ROUTE_CRITERIA:
+            matrices = travelMatrix.compute_matrices(engine, criterion)
+            self.assertEqual(list(matrices['stations']), list(engine.node_ids))
+            for source, target in pairs:
+                msg = f"{source} -> {target} ({criterion})"
+                s, t = engine.node_index(source), engine.node_index(target)
+                path = routeTable.get_route(source, target, criterion)
+                self.assertAlmostEqual(matrices['time_minutes'][s, t], sum(engine.path_weights(path, 'time')),
+                                       delta=1e-3, msg=msg)
+                self.assertEqual(matrices['transfers'][s, t],
+                                 sum(G[u][v].get('transfer') == 1 for u, v in zip(path, path[1:])), msg=msg)
+                packages = [int(package) for package in matrices['packages'][s, t] if package >= 0]
+                self.assertEqual(packages, functions.get_route_pricing_package(path), msg=msg)
+
+    def test_dijkstra_trees_without_tables(self):
+        from metroversoApp.assets import closures, travelMatrix
+
+        engine = closures.routing_engine()
+        expected = travelMatrix.compute_matrices(engine, 'time')
+        with mock.patch.object(routeTable, 'get_table', return_value=None):
+            matrices = travelMatrix.compute_matrices(engine, 'time')
+        np.testing.assert_allclose(matrices['cost'], expected['cost'], rtol=1e-6)
+        np.testing.assert_allclose(matrices['time_minutes'], expected['time_minutes'], rtol=1e-6)
+
+    def test_view_prices_and_etag(self):
+        response = self.client.get('/view/travelMatrix', {'criterion': 'time', 'profile': 'Frecuente'})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with np.load(io.BytesIO(response.content)) as arrays:
+            stations = list(arrays['stations'])
+            price = arrays['price']
+        for source, target in random.Random(1).sample(_od_pairs(), 300):
+            path = routeTable.get_route(source, target, 'time')
+            self.assertAlmostEqual(price[stations.index(source), stations.index(target)],
+                                   _route_price(path, 'Frecuente'), delta=1e-2, msg=f"{source} -> {target}")
+
+        response = self.client.get('/view/travelMatrix', {'criterion': 'time', 'profile': 'Frecuente'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/view/travelMatrix', {'criterion': 'transfer', 'profile': 'Frecuente'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_view_rejects(self):
+        response = self.client.get('/view/travelMatrix', {'criterion': 'tiempo'})
+        self.assertEqual(response.status_code, 400)
+        with mock.patch.object(routeTable, 'tables_supported', return_value=False):
+            response = self.client.get('/view/travelMatrix', {'criterion': 'time'})
+        self.assertEqual(response.status_code, 503)
+
+
+class RerouteTreeTests(TemporaryStampDirMixin, TestCase):
+    """A walk up the destination's tree gives a shortest route to it, and the view validates its query."""
+
+    def setUp(self):
+        from collections import OrderedDict
+
+        from metroversoApp.assets import rerouteTree
+
+        # An empty cache per test; the warm-up thread would read the saved journeys
+        patches = [mock.patch.object(rerouteTree, '_entries', OrderedDict()),
+                   mock.patch.object(rerouteTree, 'start_warm_up')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_matches_networkx(self):
+        from metroversoApp.assets import rerouteTree, routingEngine
+
+        pairs = random.Random(0).sample(_od_pairs(), 400)
+        for criterion in routingEngine.ENGINE_CRITERIA:
+            for station, destination in pairs:
+                msg = f"{station} -> {destination} ({criterion})"
+                path, cost, transfers, _ = rerouteTree.route_to(station, destination, criterion)
+                self.assertEqual((path[0], path[-1]), (station, destination), msg=msg)
+                hops = list(zip(path, path[1:]))
+                self.assertTrue(all(G.has_edge(u, v) for u, v in hops), msg=msg)
+                self.assertAlmostEqual(sum(G[u][v][criterion] for u, v in hops), cost, delta=1e-9, msg=msg)
+                self.assertAlmostEqual(cost, nx.dijkstra_path_length(G, station, destination, weight=criterion),
+                                       delta=1e-9, msg=msg)
+                self.assertEqual(transfers, sum(G[u][v].get('transfer') == 1 for u, v in hops), msg=msg)
+
+    def test_trees_are_cached_per_destination(self):
+        from metroversoApp.assets import rerouteTree
+
+        before = rerouteTree.get_cache_info()
+        self.assertFalse(rerouteTree.route_to('A00', 'B03')[3])
+        self.assertTrue(rerouteTree.route_to('A20', 'B03')[3])
+        self.assertFalse(rerouteTree.route_to('A20', 'B03', 'transfer')[3])
+        after = rerouteTree.get_cache_info()
+        self.assertEqual(after['misses'] - before['misses'], 2)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['entries'], 2)
+
+        with mock.patch.object(rerouteTree, 'CACHE_MAX_ENTRIES', 1):
+            rerouteTree.route_to('A00', 'X10')
+            self.assertEqual(rerouteTree.get_cache_info()['entries'], 1)
+            self.assertFalse(rerouteTree.route_to('A00', 'B03')[3])
+
+    def test_view(self):
+        from metroversoApp.assets import rerouteTree
+
+        response = self.client.get('/view/reroute', {'destination': 'B03', 'station': 'A00'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['rute'], rerouteTree.route_to('A00', 'B03')[0])
+        self.assertEqual(data['cache'], 'miss')
+
+        for query in ({'destination': 'B03', 'station': 'A00', 'criterion': 'tiempo'},
+                      {'destination': 'B03', 'lon': 'nan', 'lat': '6.25'},
+                      {'destination': 'B03', 'lon': '-75.57'}):
+            self.assertEqual(self.client.get('/view/reroute', query).status_code, 400, msg=query)
+        response = self.client.get('/view/reroute', {'destination': 'nowhere', 'station': 'A00'})
+        self.assertEqual(response.status_code, 404)
+
+
+class LastDepartureTests(TemporaryStampDirMixin, TestCase):
+    """leave_by gives the last minute of the day a trip still makes it, checked minute by minute with networkx."""
+    DATES = (datetime.date(2025, 5, 6), datetime.date(2025, 5, 4))
+
+    def setUp(self):
+        from collections import OrderedDict
+
+        from metroversoApp.assets import lastDeparture
+
+        patch = mock.patch.object(lastDeparture, '_entries', OrderedDict())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def brute_force_leave_by(self, star, destination, date):
+        """Latest minute whose shortest route (with or without Arví) passes check_trips on that minute's layer."""
+        from metroversoApp.assets import closures, serviceCalendar, speedProfiles
+
+        engine = closures.routing_engine()
+        arc_of = {(engine.node_ids[tail], engine.node_ids[head]): arc
+                  for tail, arcs in enumerate(engine.arcs) for arc, head in arcs}
+        network_only = nx.subgraph_view(
+            G, filter_node=lambda station: serviceCalendar.station_service(station) == serviceCalendar.DEFAULT_SERVICE)
+        midnight = datetime.datetime.combine(date, datetime.time())
+        starts = [midnight + datetime.timedelta(minutes=minute) for minute in range(24 * 60)]
+        routes = {}
+        for start in starts:
+            layer = speedProfiles.time_layer(start) or 'time'
+            if layer in routes:
+                continue
+            weights = engine.weight_list(layer)
+            routes[layer] = []
+            for graph in (G, network_only):
+                try:
+                    length, path = nx.single_source_dijkstra(graph, star, destination,
+                                                             weight=lambda u, v, _: weights[arc_of[u, v]])
+                except (nx.NetworkXNoPath, nx.NodeNotFound):
+                    continue
+                routes[layer].append((length, path))
+
+        feasible = np.zeros(len(starts), dtype=bool)
+        for layer, candidates in routes.items():
+            uses = np.array([(speedProfiles.time_layer(start) or 'time') == layer for start in starts])
+            layer_starts = [start for start, used in zip(starts, uses) if used]
+            for length, path in candidates:
+                feasible[uses] |= serviceCalendar.check_trips(layer_starts, [length] * len(layer_starts),
+                                                              [path] * len(layer_starts))
+        minutes = np.flatnonzero(feasible)
+        return starts[minutes[-1]] if len(minutes) else None
+
+    def test_matches_brute_force(self):
+        from metroversoApp.assets import lastDeparture
+
+        pairs = random.Random(0).sample(_od_pairs(), 12)
+        pairs += [('L01', 'B03'), ('B03', 'L01'), ('L01', 'A00')]
+        for date in self.DATES:
+            for star, destination in pairs:
+                self.assertEqual(lastDeparture.leave_by(star, destination, date),
+                                 self.brute_force_leave_by(star, destination, date),
+                                 msg=f"{star} -> {destination} on {date}")
+
+    def test_service_exceptions(self):
+        from metroversoApp.assets import lastDeparture, serviceCalendar
+
+        date = self.DATES[0]
+        self.addCleanup(serviceCalendar._tables.pop, 'arvi', None)
+        with mock.patch.dict(serviceCalendar.SERVICE_EXCEPTIONS):
+            serviceCalendar.add_exception('arvi', date, None)
+            self.assertIsNone(lastDeparture.leave_by('B03', 'L01', date))
+            serviceCalendar.add_exception('arvi', date, ((9, 0), (15, 0)))
+            leave = lastDeparture.leave_by('B03', 'L01', date)
+            self.assertEqual(leave, self.brute_force_leave_by('B03', 'L01', date))
+            self.assertLess(leave.time(), datetime.time(15, 0))
+
+    def test_profiles_are_cached_per_day_type(self):
+        from metroversoApp.assets import lastDeparture
+
+        self.assertFalse(lastDeparture.latest_departures('B03', self.DATES[0])[1])
+        # Another weekday with the same hours reuses the profile
+        self.assertTrue(lastDeparture.latest_departures('B03', datetime.date(2025, 5, 7))[1])
+        self.assertFalse(lastDeparture.latest_departures('B03', self.DATES[1])[1])
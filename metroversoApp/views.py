@@ -1,9 +1,9 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponse
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import translation
 from django.utils.translation import gettext as _
-from django.db.models import Count
+from django.db.models import Count, Q
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User as DjangoUser
 from django.contrib import messages
@@ -11,13 +11,17 @@ from django.contrib.auth.decorators import login_required
 
 from .assets import stationGraphs
 from .assets import functions
+from .assets import stationRegistry
+from .assets import serviceCalendar
 from .models import Route, Station, User, BlogPost
 
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, etag
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from datetime import datetime
 import json
+import math
+import networkx as nx
 
 def map(request):
     language_code = translation.get_language()
@@ -64,9 +68,41 @@ def callRute(request):
  
     # Read passenger profile from request
     profile = request.GET.get('profileSelection', 'Frecuente')
+    # Optional search algorithm: dijkstra, astar or bidirectional (time criteria only)
+    algorithm = request.GET.get('algorithm')
     print(criteria)
     # Call the rute function from utils
-    rute, distance, transfer_info, can_make_trip, service_hours, uses_arvi_station, rute_coords, transfer_coords, price_packages, rute_price = functions.calculeRute(start, destination, criteria, profile)
+    # Riders who go off-route are rerouted from the trees of the popular destinations
+    from .assets import rerouteTree
+    rerouteTree.start_warm_up()
+    search_stats = {}
+    # Optional alternative routes: ?alternatives=k[&alternatives_offset=n] returns alternatives n + 1 to k,
+    # so the next one can be asked for without sending the first ones again
+    if criteria not in functions.SEARCH_CRITERIA:
+        return JsonResponse({
+            'success': False,
+            'message': _('Unknown criterion: %(criterion)s') % {'criterion': criteria}
+        }, status=400)
+    alternatives = None
+    try:
+        k = int(request.GET.get('alternatives', 0))
+        offset = int(request.GET.get('alternatives_offset', 0))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': _('alternatives must be integers')}, status=400)
+    if k > 0:
+        alternatives = {'k': k, 'offset': max(offset, 0)}
+    # Optional ?departAt= or ?arriveBy= ('HH:MM' today or an ISO date and time); default: leave now
+    schedule = None
+    try:
+        if request.GET.get('departAt') and request.GET.get('arriveBy'):
+            raise ValueError(_('give departAt or arriveBy, not both'))
+        if request.GET.get('departAt'):
+            schedule = {'depart_at': serviceCalendar.parse_time(request.GET['departAt'])}
+        elif request.GET.get('arriveBy'):
+            schedule = {'arrive_by': serviceCalendar.parse_time(request.GET['arriveBy'])}
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': _('Invalid departure time: %(error)s') % {'error': str(e)}}, status=400)
+    rute, distance, transfer_info, can_make_trip, service_hours, uses_arvi_station, rute_coords, transfer_coords, price_packages, rute_price = functions.calculeRute(start, destination, criteria, profile, algorithm, search_stats, alternatives, schedule)
 
     # ❌ Ya no guardar automáticamente
     # try:
@@ -89,6 +125,14 @@ def callRute(request):
     #         id_user=user
     #     )
 
+    # Latest time to leave and still arrive before closing (Arví included), from the cached profile of the destination
+    from .assets import lastDeparture
+    leave_by = None
+    if rute:
+        day = next(iter(schedule.values())).date() if schedule else None
+        leave = lastDeparture.leave_by(start, destination, day)
+        leave_by = leave.strftime('%H:%M') if leave is not None else None
+
     return JsonResponse({ 
         'rute': rute,
         'distance': distance,
@@ -99,9 +143,486 @@ def callRute(request):
         'service_hours': service_hours,
         'uses_arvi_station': uses_arvi_station,
         'rute_coords': rute_coords,
-        'transfer_coords': transfer_coords
+        'transfer_coords': transfer_coords,
+        'search': search_stats,
+        'alternatives': alternatives.get('routes', []) if alternatives is not None else None,
+        'leave_by': leave_by,
+        'schedule': {key: value for key, value in schedule.items() if key in ('departure', 'arrival')} if schedule else None
+    })
+
+# Most stations returned per point and most points per batch request
+NEAREST_MAX_K = 20
+NEAREST_MAX_POINTS = 1000
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def nearest(request):
+    """
+    k nearest stations to one or more points, with haversine distances in km.
+    GET:  ?lon=..&lat=..[&k=1][&max_km=..]  or  ?points=lon,lat;lon,lat[&k=..]
+    POST: {"points": [[lon, lat], ...], "k": 3, "max_km": 2}
+    Feeder-bus stops are only candidates with feeder_stops=1 (true in POST).
+    Returns {'results': [[{'id', 'line', 'distance_km'}, ...], ...]}, one list per point.
+    """
+    from .assets.spatialIndex import nearest_stations
+
+    try:
+        if request.method == "POST":
+            data = json.loads(request.body)
+            points = [(float(lon), float(lat)) for lon, lat in data['points']]
+            k = int(data.get('k', 1))
+            max_km = data.get('max_km')
+            feeder_stops = bool(data.get('feeder_stops', False))
+        else:
+            if request.GET.get('points'):
+                points = [tuple(float(v) for v in pair.split(',')) for pair in request.GET['points'].split(';') if pair]
+            else:
+                points = [(float(request.GET['lon']), float(request.GET['lat']))]
+            k = int(request.GET.get('k', 1))
+            max_km = request.GET.get('max_km')
+            feeder_stops = request.GET.get('feeder_stops') == '1'
+        max_km = float(max_km) if max_km is not None else None
+        if any(len(point) != 2 for point in points):
+            raise ValueError("points must be lon,lat pairs")
+        if not all(math.isfinite(value) for point in points for value in point):
+            raise ValueError("coordinates must be finite numbers")
+    except (KeyError, ValueError, TypeError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': _('Invalid nearest station query: %(error)s') % {'error': str(e)}
+        }, status=400)
+
+    if len(points) > NEAREST_MAX_POINTS:
+        return JsonResponse({
+            'success': False,
+            'message': _('Too many points (max %(max)s)') % {'max': NEAREST_MAX_POINTS}
+        }, status=400)
+
+    k = max(1, min(k, NEAREST_MAX_K))
+    results = [
+        [{'id': station, 'line': stationGraphs.G.nodes[station].get('line'), 'distance_km': round(distance, 4)}
+         for station, distance in found]
+        for found in nearest_stations(points, k, max_km, feeder_stops)
+    ]
+    return JsonResponse({'results': results})
+
+@require_http_methods(["GET"])
+def isochrone(request):
+    """
+    Stations reachable from a station within a time budget.
+    GET: ?station=A01&minutes=30[&feeder_stops=1]
+    Returns {'station', 'minutes', 'reachable': [{'id', 'name', 'line',
+    'minutes', 'transfers', 'coords'}, ...]} ordered by travel time.
+    Feeder-bus stops are only listed with feeder_stops=1.
+    """
+    from .assets import isochrone as isochrones
+    from .assets.feederNetwork import FEEDER_LINE_KEY
+
+    station = request.GET.get('station')
+    try:
+        minutes = float(request.GET['minutes'])
+        if not 0 <= minutes <= isochrones.MAX_BUDGET_MINUTES:
+            raise ValueError(_('minutes must be between 0 and %(max)s') % {'max': isochrones.MAX_BUDGET_MINUTES})
+    except (KeyError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': _('Invalid isochrone query: %(error)s') % {'error': str(e)}
+        }, status=400)
+
+    if station not in stationGraphs.G:
+        return JsonResponse({'success': False, 'message': _('Station not found')}, status=404)
+
+    feeder_stops = request.GET.get('feeder_stops') == '1'
+    reachable, cache_hit = isochrones.reachable_stations(station, minutes)
+    registry = stationRegistry.get_registry()
+    results = []
+    for station_id, travel_minutes, transfers in reachable:
+        line = stationGraphs.G.nodes[station_id].get('line')
+        if line == FEEDER_LINE_KEY and not feeder_stops:
+            continue
+        results.append({
+            'id': station_id,
+            'name': registry.name(station_id),
+            'line': line,
+            'minutes': round(travel_minutes, 2),
+            'transfers': transfers,
+            'coords': registry.coordinates(station_id),
+        })
+    return JsonResponse({
+        'station': station,
+        'minutes': minutes,
+        'reachable': results,
+        'cache': 'hit' if cache_hit else 'miss',
     })
 
+@require_http_methods(["GET"])
+def pareto_routes(request):
+    """
+    The routes between two stations that no other route beats on travel
+    time, transfers and fare at once, for a profile, in one search.
+    GET: ?start=A00&destination=X10[&profile=Frecuente]
+    Returns {'start', 'destination', 'profile', 'routes', 'truncated',
+    'labels'}; routes are ordered by time and have the callRute fields plus
+    'transfers' (changes of vehicle) and 'legs' (stations ridden per line).
+    truncated is True when the search stopped at its label limits and some
+    routes may be missing.
+    """
+    from .assets.stationGraphs import get_current_service_hours, get_arvi_service_hours
+
+    start = request.GET.get('start')
+    destination = request.GET.get('destination')
+    profile = request.GET.get('profile', 'Frecuente')
+    if start not in stationGraphs.G or destination not in stationGraphs.G:
+        return JsonResponse({'success': False, 'message': _('Station not found')}, status=404)
+
+    try:
+        routes, truncated, labels = functions.pareto_route_responses(start, destination, profile)
+    except nx.NetworkXNoPath:
+        routes, truncated, labels = [], False, 0
+    results = []
+    for route, response in routes:
+        route_result = response['route_result']
+        results.append({
+            'rute': route.path,
+            'distance': route_result.duration,
+            'transfers': route.transfers,
+            'legs': route.legs,
+            'price': response['price'],
+            'price_packages': response['price_packages'],
+            'transfer_info': response['transfer_info'],
+            'can_make_trip': route_result.can_make_trip,
+            'service_hours': get_arvi_service_hours() if route_result.uses_arvi_station else get_current_service_hours(),
+            'uses_arvi_station': route_result.uses_arvi_station,
+            'rute_coords': response['rute_coords'],
+            'transfer_coords': response['transfer_coords'],
+        })
+    return JsonResponse({
+        'start': start,
+        'destination': destination,
+        'profile': profile,
+        'routes': results,
+        'truncated': truncated,
+        'labels': labels,
+    })
+
+@require_http_methods(["GET"])
+def reroute(request):
+    """
+    New route to a destination for a rider who left their route, from a
+    station or from the station nearest to a position. Answered from the
+    shortest-path tree of the destination (see assets/rerouteTree), so
+    only the first request for a destination searches.
+    GET: ?destination=B03&station=A05  or  ?destination=B03&lon=..&lat=..
+         [&criterion=time][&feeder_stops=1]
+    Returns {'station', 'destination', 'criterion', 'rute', 'cost',
+    'minutes', 'transfers', 'rute_coords', 'cache'}, plus 'distance_km' to
+    the nearest station when a position was sent.
+    """
+    from .assets import rerouteTree, routingEngine
+    from .assets.spatialIndex import nearest_stations
+
+    destination = request.GET.get('destination')
+    criterion = request.GET.get('criterion', 'time')
+    station = request.GET.get('station')
+    snapped_km = None
+    try:
+        if criterion not in routingEngine.ENGINE_CRITERIA:
+            raise ValueError(_('criterion must be one of %(criteria)s') % {'criteria': ', '.join(routingEngine.ENGINE_CRITERIA)})
+        if station is None:
+            point = (float(request.GET['lon']), float(request.GET['lat']))
+            if not all(math.isfinite(value) for value in point):
+                raise ValueError("coordinates must be finite numbers")
+            found = nearest_stations([point], 1, feeder_stops=request.GET.get('feeder_stops') == '1')[0]
+            if found:
+                station, snapped_km = found[0]
+    except (KeyError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': _('Invalid reroute query: %(error)s') % {'error': str(e)}
+        }, status=400)
+
+    if station not in stationGraphs.G or destination not in stationGraphs.G:
+        return JsonResponse({'success': False, 'message': _('Station not found')}, status=404)
+
+    rerouteTree.start_warm_up()
+    try:
+        rute, cost, transfers, cache_hit = rerouteTree.route_to(station, destination, criterion)
+    except nx.NetworkXNoPath:
+        rute, cost, transfers, cache_hit = [], None, 0, False
+    registry = stationRegistry.get_registry()
+    response = {
+        'station': station,
+        'destination': destination,
+        'criterion': criterion,
+        'rute': rute,
+        'cost': cost,
+        'minutes': sum(stationGraphs.G[u][v].get('time', 0.0) for u, v in zip(rute, rute[1:])),
+        'transfers': transfers,
+        'rute_coords': [registry.coordinates(station_id) for station_id in rute],
+        'cache': 'hit' if cache_hit else 'miss',
+    }
+    if snapped_km is not None:
+        response['distance_km'] = round(snapped_km, 4)
+    return JsonResponse(response)
+
+def _travel_matrix_etag(request):
+    from .assets import travelMatrix
+    from .assets.routingEngine import ENGINE_CRITERIA
+
+    criterion = request.GET.get('criterion', 'time')
+    if criterion not in ENGINE_CRITERIA:
+        return None
+    return travelMatrix.matrix_etag(criterion, request.GET.get('profile', 'Frecuente'))
+
+@require_http_methods(["GET"])
+@etag(_travel_matrix_etag)
+def travel_matrix(request):
+    """
+    Travel time, transfers and fare between every pair of stations, as an
+    .npz file (see assets/travelMatrix.py for the arrays).
+    GET: ?criterion=time&profile=Frecuente
+    The ETag changes with the network and the prices, so clients can send
+    If-None-Match and get a 304 until then.
+    Networks above routeTable.MAX_TABLE_NODES stations (the feeder network)
+    have no route tables to build the matrices from, and get a 503.
+    """
+    from .assets import closures as route_closures, routeTable, travelMatrix
+    from .assets.routingEngine import ENGINE_CRITERIA
+
+    criterion = request.GET.get('criterion', 'time')
+    if criterion not in ENGINE_CRITERIA:
+        return JsonResponse({
+            'success': False,
+            'message': _('Unknown criterion: %(criterion)s') % {'criterion': criterion}
+        }, status=400)
+    if not routeTable.tables_supported(route_closures.routing_engine()):
+        return JsonResponse({
+            'success': False,
+            'message': _('Travel matrices are only served for networks of up to %(max)s stations')
+                       % {'max': routeTable.MAX_TABLE_NODES}
+        }, status=503)
+
+    etag_value, data = travelMatrix.matrix_file(criterion, request.GET.get('profile', 'Frecuente'))
+    response = HttpResponse(data, content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="travel_matrix_{criterion}_{etag_value}.npz"'
+    return response
+
+def _closure_dict(closure):
+    return {
+        'id': closure.id_closure,
+        'station': closure.station,
+        'other_station': closure.other_station or None,
+        'starts_at': closure.starts_at,
+        'ends_at': closure.ends_at,
+        'reason': closure.reason,
+    }
+
+def _parse_closure_time(value):
+    from django.utils.dateparse import parse_datetime
+
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(_('Invalid date: %(value)s') % {'value': value})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+@require_http_methods(["GET", "POST"])
+def closures(request):
+    """
+    Closures of stations and connections that routing avoids.
+    GET:  the closures that have not ended, and the ids active now.
+    POST (staff): {"station": "B03", "other_station": "B04" (optional, closes
+    only that connection), "starts_at": ISO datetime (default now),
+    "ends_at": ISO datetime (optional), "reason": "..."}
+    The change reaches every server process on its next routing call.
+    """
+    from .assets import closures as route_closures
+    from .models import Closure
+
+    if request.method == "GET":
+        pending = Closure.objects.filter(Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()))
+        return JsonResponse({
+            'closures': [_closure_dict(closure) for closure in pending],
+            'active': sorted(route_closures.active_ids()),
+        })
+
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'message': _('Not authorized')}, status=403)
+    try:
+        data = json.loads(request.body)
+        station = str(data['station'])
+        other_station = str(data.get('other_station') or '')
+        starts_at = _parse_closure_time(data['starts_at']) if data.get('starts_at') else timezone.now()
+        ends_at = _parse_closure_time(data['ends_at']) if data.get('ends_at') else None
+        if ends_at is not None and ends_at <= starts_at:
+            raise ValueError(_('ends_at must be after starts_at'))
+    except (KeyError, ValueError, TypeError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': _('Invalid closure: %(error)s') % {'error': str(e)}
+        }, status=400)
+
+    if station not in stationGraphs.G or (other_station and not stationGraphs.G.has_edge(station, other_station)):
+        return JsonResponse({'success': False, 'message': _('Station not found')}, status=404)
+
+    closure = Closure.objects.create(
+        station=station,
+        other_station=other_station,
+        starts_at=starts_at,
+        ends_at=ends_at,
+        reason=str(data.get('reason', ''))[:200],
+    )
+    return JsonResponse({'success': True, 'closure': _closure_dict(closure)}, status=201)
+
+@require_http_methods(["POST"])
+def end_closure(request, closure_id):
+    """
+    Ends a closure now (staff only). It stays in the table as history, except
+    a closure that had not started yet, which is deleted.
+    """
+    from .models import Closure
+
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'message': _('Not authorized')}, status=403)
+    closure = get_object_or_404(Closure, id_closure=closure_id)
+    data = _closure_dict(closure)
+    now = timezone.now()
+    if closure.starts_at > now:
+        closure.delete()
+        return JsonResponse({'success': True, 'closure': data, 'deleted': True})
+    if closure.ends_at is None or closure.ends_at > now:
+        closure.ends_at = now
+        closure.save()
+    return JsonResponse({'success': True, 'closure': _closure_dict(closure), 'deleted': False})
+
+# Most route queries per batch request
+BATCH_MAX_ROUTES = 1000
+# Routes whose service windows are checked together before their lines are streamed
+BATCH_CHECK_CHUNK = 64
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_routes(request):
+    """
+    Routes for many origin-destination pairs in one request.
+    POST: {"routes": [[start, destination, criterion, profile], ...]
+           [, "depart_at": "HH:MM" | ISO datetime][, "arrive_by": ...]}
+    criterion defaults to 'time' and profile to 'Frecuente'; objects with
+    those keys are accepted too. Queries from the same origin share one search.
+    can_make_trip is checked for depart_at or arrive_by (default: now), for
+    BATCH_CHECK_CHUNK routes at a time, and each line has 'departure' and 'arrival'.
+    The answer is streamed as NDJSON, one line per query with the same fields
+    as callRute plus 'index' (its position in the request), in origin order.
+    Lines for queries that cannot be answered have 'success': False.
+    """
+    try:
+        data = json.loads(request.body)
+        queries = []
+        for item in data['routes']:
+            if isinstance(item, dict):
+                item = (item['start'], item['destination'], item.get('criterion'), item.get('profile'))
+            start, destination, criterion, profile = (list(item) + [None, None])[:4]
+            queries.append((str(start), str(destination), criterion or 'time', profile or 'Frecuente'))
+        depart_at = serviceCalendar.parse_time(data['depart_at']) if data.get('depart_at') else None
+        arrive_by = serviceCalendar.parse_time(data['arrive_by']) if data.get('arrive_by') else None
+    except (KeyError, ValueError, TypeError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': _('Invalid batch route query: %(error)s') % {'error': str(e)}
+        }, status=400)
+
+    if len(queries) > BATCH_MAX_ROUTES:
+        return JsonResponse({
+            'success': False,
+            'message': _('Too many routes (max %(max)s)') % {'max': BATCH_MAX_ROUTES}
+        }, status=400)
+
+    def lines():
+        from django.core.serializers.json import DjangoJSONEncoder
+        from .assets.stationGraphs import get_current_service_hours, get_arvi_service_hours
+
+        service_hours = get_current_service_hours()
+        arvi_service_hours = get_arvi_service_hours()
+
+        valid = []
+        for index, (start, destination, criterion, profile) in enumerate(queries):
+            if start not in stationGraphs.G or destination not in stationGraphs.G:
+                message = _('Station not found')
+            elif criterion not in functions.SEARCH_CRITERIA:
+                message = _('Unknown criterion: %(criterion)s') % {'criterion': criterion}
+            else:
+                valid.append(index)
+                continue
+            yield json.dumps({'index': index, 'success': False, 'message': message}) + '\n'
+
+        def answer(chunk):
+            # Service windows of the whole chunk are checked at once
+            answered = [(index, response) for index, response, _ in chunk if response is not None]
+            departures, arrivals, can_make = functions.plan_route_times(
+                [response['route_result'] for _, response in answered], depart_at, arrive_by)
+            checked = {index: i for i, (index, _) in enumerate(answered)}
+            for index, response, cache_hit in chunk:
+                start, destination, criterion, profile = queries[index]
+                if response is None:
+                    yield json.dumps({'index': index, 'success': False, 'message': _('No route found')}) + '\n'
+                    continue
+                route_result = response['route_result']
+                i = checked[index]
+                line = {
+                    'index': index,
+                    'success': True,
+                    'start': start,
+                    'destination': destination,
+                    'criterion': criterion,
+                    'profile': profile,
+                    'rute': route_result.path,
+                    'distance': route_result.duration,
+                    'price': response['price'],
+                    'price_packages': response['price_packages'],
+                    'transfer_info': response['transfer_info'],
+                    'can_make_trip': can_make[i],
+                    'departure': departures[i].isoformat(timespec='minutes'),
+                    'arrival': arrivals[i].isoformat(timespec='minutes'),
+                    'service_hours': arvi_service_hours if route_result.uses_arvi_station else service_hours,
+                    'uses_arvi_station': route_result.uses_arvi_station,
+                    'rute_coords': response['rute_coords'],
+                    'transfer_coords': response['transfer_coords'],
+                    'search': {
+                        'algorithm': route_result.algorithm,
+                        'expanded_nodes': route_result.expanded_nodes,
+                        'cache': 'hit' if cache_hit else 'miss',
+                    },
+                }
+                if route_result.line_transfers is not None:
+                    line['search']['line_transfers'] = route_result.line_transfers
+                if route_result.expected_wait is not None:
+                    line['search'].update(expected_wait=route_result.expected_wait, time_band=route_result.time_band)
+                if route_result.time_layer is not None:
+                    line['search']['time_layer'] = route_result.time_layer
+                yield json.dumps(line, cls=DjangoJSONEncoder) + '\n'
+
+        chunk = []
+        for position, response, cache_hit in functions.batch_route_responses([queries[i] for i in valid], depart_at, arrive_by):
+            chunk.append((valid[position], response, cache_hit))
+            if len(chunk) == BATCH_CHECK_CHUNK:
+                yield from answer(chunk)
+                chunk = []
+        yield from answer(chunk)
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+def _route_names(pairs):
+    """Station names along the 'time' route of each (start, end) pair, searched in one batch."""
+    registry = stationRegistry.get_registry()
+    known = [i for i, (start, end) in enumerate(pairs) if start in stationGraphs.G and end in stationGraphs.G]
+    names = [[] for pair in pairs]
+    queries = [(pairs[i][0], pairs[i][1], 'time', 'Frecuente') for i in known]
+    for position, response, cache_hit in functions.batch_route_responses(queries):
+        if response is not None:
+            names[known[position]] = [registry.name(station_id) for station_id in response['route_result'].path]
+    return names
+
 def dashboard(request):
     # Most used stations (top 4)
     start_counts = Route.objects.values('id_start').annotate(count=Count('id_start'))
@@ -112,21 +633,20 @@ def dashboard(request):
     for item in end_counts:
         station_usage[item['id_end']] = station_usage.get(item['id_end'], 0) + item['count']
     top_stations = sorted(station_usage.items(), key=lambda x: x[1], reverse=True)[:4]
+    registry = stationRegistry.get_registry()
     result_stations = []
     for station_id, usage in top_stations:
-        try:
-            station = Station.objects.get(pk=station_id)
-            result_stations.append({
-                'id': station_id,
-                'name': station.name,
-                'line': station.line,
-                'type': station.type,
-                'usage': usage
-            })
-        except Station.DoesNotExist:
+        station = registry.station_fields(station_id)
+        if station is None:
             continue
+        result_stations.append({
+            'id': station_id,
+            'name': station['name'],
+            'line': station['line'],
+            'type': station['type'],
+            'usage': usage
+        })
     # DBR04: Group similar routes (by start, end, criterion)
-    from .assets.functions import calculeRute
     route_groups = (
         Route.objects.values('id_start', 'id_end', 'criterion')
         .annotate(count=Count('id_route'))
@@ -134,28 +654,17 @@ def dashboard(request):
     )
     result_routes = []
     for group in route_groups:
-        try:
-            start = Station.objects.get(pk=group['id_start'])
-            end = Station.objects.get(pk=group['id_end'])
-
-            rute, _, _, _, _, _, _, _, _, _ = calculeRute(start.id_station, end.id_station, 'time')
-
-            rute_names = []
-            for station_id in rute:
-                try:
-                    station_obj = Station.objects.get(pk=station_id)
-                    rute_names.append(station_obj.name)
-                except Station.DoesNotExist:
-                    rute_names.append(station_id)
-            result_routes.append({
-                'start': start.name,
-                'end': end.name,
-                'criterion': group['criterion'],
-                'count': group['count'],
-                'rute': rute_names
-            })
-        except Station.DoesNotExist:
+        start = registry.station_fields(group['id_start'])
+        end = registry.station_fields(group['id_end'])
+        if start is None or end is None:
             continue
+        result_routes.append({
+            'start': start['name'],
+            'end': end['name'],
+            'criterion': group['criterion'],
+            'count': group['count'],
+            'rute': (start['id'], end['id'])
+        })
 
     # Get the three most recent routes for the logged-in user
     recent_routes = []
@@ -164,23 +673,20 @@ def dashboard(request):
             user_profile = request.user.metro_profile
             routes = Route.objects.filter(id_user=user_profile).order_by('-start_time')[:3]
             for route in routes:
-                rute, _, _, _, _, _, _, _, _, _ = calculeRute(route.id_start.id_station, route.id_end.id_station, 'time')
-                rute_names = []
-                for station_id in rute:
-                    try:
-                        station_obj = Station.objects.get(pk=station_id)
-                        rute_names.append(station_obj.name)
-                    except Station.DoesNotExist:
-                        rute_names.append(station_id)
                 recent_routes.append({
-                    'start': route.id_start.name,
-                    'end': route.id_end.name,
+                    'start': registry.name(route.id_start_id),
+                    'end': registry.name(route.id_end_id),
                     'date': route.start_time.strftime('%Y-%m-%d %H:%M'),
-                    'rute': rute_names
+                    'rute': (route.id_start_id, route.id_end_id)
                 })
         except User.DoesNotExist:
             pass
 
+    # All the routes of the dashboard in one batch; 'rute' holds the (start, end) pair until then
+    listed = result_routes + recent_routes
+    for item, rute_names in zip(listed, _route_names([item['rute'] for item in listed])):
+        item['rute'] = rute_names
+
     return JsonResponse({'top_stations': result_stations, 'top_routes': result_routes, 'recent_routes': recent_routes})
 
 
@@ -394,12 +900,16 @@ def save_journey(request):
         else:
             start_time = timezone.now()
         
-        # Calcular el precio y paquetes usando la función existente
-        rute, distance, transfer_info, _, _, _, _, _, price_packages, price_calc = functions.calculeRute(
-            start_station_id, 
-            end_station_id,
-            criterion
-        )
+        # Calcular el precio y paquetes (misma respuesta cacheada que usa el mapa)
+        try:
+            # Legacy clients send 'tiempo'; anything find_route does not know is priced on the 'time' route
+            route_criterion = criterion if criterion in functions.SEARCH_CRITERIA else 'time'
+            response, _cache_hit = functions.route_response(start_station_id, end_station_id, route_criterion)
+            price_packages = response['price_packages']
+            price_calc = response['price']
+        except Exception:
+            price_packages = []
+            price_calc = 0
 
         # Allow client to override price/profile by sending them in the request body
         client_price = data.get('price', None)
@@ -461,22 +971,24 @@ def station_info(request, station_id):
     """Obtiene información de servicios y puntos de interés de una estación"""
     try:
         from .models import StationService, PointOfInterest
-        station = Station.objects.get(id_station=station_id)
+        station = stationRegistry.get_registry().station_fields(station_id)
+        if station is None:
+            raise Station.DoesNotExist
         
         # Obtener servicios de la estación
-        services = StationService.objects.filter(station=station, status='active').values(
+        services = StationService.objects.filter(station_id=station_id, status='active').values(
             'service_type', 'description', 'hours', 'floor'
         )
         
         # Obtener puntos de interés cercanos
-        points_of_interest = PointOfInterest.objects.filter(station=station).values(
+        points_of_interest = PointOfInterest.objects.filter(station_id=station_id).values(
             'name', 'description', 'category', 'address', 'distance_from_station'
         )
         
         return JsonResponse({
-            'station_name': station.name,
-            'station_line': station.line,
-            'station_type': station.type,
+            'station_name': station['name'],
+            'station_line': station['line'],
+            'station_type': station['type'],
             'services': list(services),
             'points_of_interest': list(points_of_interest)
         })